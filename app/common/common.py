@@ -1,12 +1,52 @@
+import os
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, Depends
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy import select
 from typing import Optional, Annotated
 from fastapi import Query
 
 from app.common.db import get_async_session
+from app.common.identity import Identity, get_identity, token_revoked
+from app.users.auth import verify_token
 from app.users.models import User
 
+# старый способ — ?current_user_telegram_id=... без подписи (подделывается подстановкой чужого id).
+# По умолчанию выключен; включать только на время перехода фронта на токены
+ALLOW_TELEGRAM_ID_PARAM = os.getenv("AUTH_ALLOW_TELEGRAM_ID_PARAM", "false").lower() == "true"
+
+_bearer = HTTPBearer(auto_error=False, description="Токен из POST /users/auth/telegram")
+
+
+async def resolve_identity(
+    session: AsyncSession = Depends(get_async_session),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer),
+    current_user_telegram_id: Optional[int] = Query(
+        None, alias="current_user_telegram_id", description="Telegram ID текущего пользователя"
+    ),
+) -> Optional[Identity]:
+    """
+    Общая зависимость для всех CurrentUser(...): FastAPI кеширует её результат в пределах
+    запроса, поэтому роутер и сервис с разными флагами не ищут пользователя дважды.
+    Подпись Bearer-токена проверяется в памяти, отзыв (tokens_valid_after) и query-параметр —
+    через кеш identity.
+    """
+    if credentials is not None:
+        identity, issued_at = verify_token(credentials.credentials)
+        if await token_revoked(session, identity.telegram_id, issued_at):
+            raise HTTPException(status_code=401, detail="Token revoked, please log in again")
+        return identity
+
+    if current_user_telegram_id is None:
+        return None
+    if not ALLOW_TELEGRAM_ID_PARAM:
+        raise HTTPException(status_code=401, detail="Bearer token required")
+    identity = await get_identity(session, current_user_telegram_id)
+    if identity is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    return identity
+
+
 class CurrentUser:
     def __init__(self, require_admin: bool = False, optional: bool = False):
         self.require_admin = require_admin
@@ -14,28 +54,19 @@ class CurrentUser:
 
     async def __call__(
         self,
-        session: AsyncSession = Depends(get_async_session),
-        current_user_telegram_id: Optional[int] = Query(
-            None, alias="current_user_telegram_id", description="Telegram ID текущего пользователя"
-        ),
-    ) -> Optional[User]:
+        identity: Optional[Identity] = Depends(resolve_identity),
+    ) -> Optional[Identity]:
         # если id не передан
-        if current_user_telegram_id is None:
+        if identity is None:
             if self.optional:
                 return None
             raise HTTPException(status_code=401, detail="Not authenticated")
 
-        # ищем пользователя
-        res = await session.execute(select(User).where(User.telegram_id == current_user_telegram_id))
-        user = res.scalar_one_or_none()
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-
         # проверка прав
-        if self.require_admin and not user.is_admin:
+        if self.require_admin and not identity.is_admin:
             raise HTTPException(status_code=403, detail="Admin rights required")
 
-        return user
+        return identity
 
 async def init_admin(session, telegram_id: int, nickname: str, first_name: str, last_name: str):
     result = await session.execute(select(User).where(User.telegram_id == telegram_id))
@@ -1,15 +1,38 @@
 import os
 from dotenv import load_dotenv
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import declarative_base
 
+from app.common.sqlstats import instrument_engine
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL is not set")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+
+def asyncpg_dsn(url: str = DATABASE_URL) -> str:
+    """postgresql+asyncpg://... -> postgresql://... (для прямых соединений asyncpg вне пула)."""
+    scheme, rest = url.split("://", 1)
+    return f"{scheme.split('+', 1)[0]}://{rest}"
+
+# echo пишет в лог каждый запрос — только для отладки; сводка по запросам — см. app/common/sqlstats.py
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() == "true"
+
+# кеши «один раз разобрать — много раз выполнить»:
+# - query_cache_size: скомпилированный SQL у SQLAlchemy (ключ — структура запроса);
+# - prepared_statement_cache_size: подготовленные statement-ы asyncpg на каждое соединение.
+#   0 — выключить (нужно за pgbouncer в режиме transaction).
+_ENGINE_OPTIONS = dict(
+    echo=SQL_ECHO,
+    query_cache_size=int(os.getenv("SQL_COMPILED_CACHE_SIZE", "1200")),
+    connect_args={"prepared_statement_cache_size": int(os.getenv("DB_PREPARED_STATEMENT_CACHE_SIZE", "500"))},
+)
+
+engine = create_async_engine(DATABASE_URL, **_ENGINE_OPTIONS)
+instrument_engine(engine)
 
 # фабрика асинхронных сессий
 AsyncSessionLocal = async_sessionmaker(
@@ -17,6 +40,27 @@ AsyncSessionLocal = async_sessionmaker(
     expire_on_commit=False,
 )
 
+# реплика для чистого чтения (лидерборд, списки, экспорт); не задана — всё читается с primary.
+# Реплика отстаёт: то, что должно видеть только что записанное, читаем через get_async_session.
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+
+if DATABASE_REPLICA_URL:
+    replica_engine = create_async_engine(
+        DATABASE_REPLICA_URL,
+        **_ENGINE_OPTIONS,
+        pool_size=int(os.getenv("DATABASE_REPLICA_POOL_SIZE", "5")),
+        max_overflow=int(os.getenv("DATABASE_REPLICA_MAX_OVERFLOW", "10")),
+        pool_pre_ping=True,
+    )
+    instrument_engine(replica_engine)
+    ReadSessionLocal = async_sessionmaker(
+        bind=replica_engine,
+        expire_on_commit=False,
+    )
+else:
+    replica_engine = None
+    ReadSessionLocal = AsyncSessionLocal
+
 # базовый класс для моделей
 Base = declarative_base()
 
@@ -25,9 +69,23 @@ async def get_async_session() -> AsyncSession:
     async with AsyncSessionLocal() as session:
         yield session
 
+# зависимость для read-only эндпоинтов (реплика, если настроена)
+async def get_read_session() -> AsyncSession:
+    async with ReadSessionLocal() as session:
+        yield session
+
 # Function to create tables (for initial setup, not for production use)
 async def init_models():
+    # докат схемы импортирует модели, а модели импортируют этот модуль (locks — тоже этот модуль)
+    from app.common.migrations import upgrade_schema
+    from app.common.locks import advisory_key
+
     async with engine.begin() as conn:
+        # воркеры стартуют одновременно: DDL и бэкфилл выполняет по очереди каждый, под
+        # транзакционной блокировкой (снимется на коммите) — следующие видят готовую схему и ничего не делают
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": advisory_key("schema-init")})
         # await conn.run_sync(Base.metadata.drop_all)  # use with caution
         await conn.run_sync(Base.metadata.create_all)
+        # create_all не меняет существующие таблицы — новые колонки/индексы докатываем сами
+        await upgrade_schema(conn)
         
\ No newline at end of file
@@ -1,116 +1,623 @@
 # app/common/files.py
 from __future__ import annotations
 
-import mimetypes
+import abc
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import re
 import secrets
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Sequence
+from urllib.parse import quote, unquote, urlparse
 
 import aiofiles
-from fastapi import UploadFile, Request
+import aiofiles.os
+import aiohttp
+from fastapi import HTTPException, UploadFile, Request
+
+from app.quizes.media import ALLOWED_CT, MAX_BYTES
 
 # где лежат файлы на диске
 MEDIA_ROOT = Path("media")
 # публичный префикс (обязательно смонтируй в FastAPI: app.mount("/media", StaticFiles(...)))
 MEDIA_URL = "/media"
+# контентно-адресуемое хранилище: media/cas/<sha256[:2]>/<sha256>.<ext>
+CAS_DIR = MEDIA_ROOT / "cas"
+# сюда пишутся недокачанные файлы (та же ФС, что и CAS — rename атомарный)
+CAS_TMP_DIR = CAS_DIR / ".tmp"
+
+# читаем загрузки кусками — в памяти одновременно держим не больше одного чанка
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# сколько файлов одного запроса пишем параллельно
+UPLOAD_CONCURRENCY = int(os.getenv("MEDIA_UPLOAD_CONCURRENCY", "8"))
 
+# MIME (определённый по сигнатуре) → расширение; заголовку Content-Type от клиента не доверяем
+_EXT_BY_CT = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
+_CT_BY_EXT = {ext: ct for ct, ext in _EXT_BY_CT.items()}
 
-def _safe_ext(filename: str | None, content_type: str | None) -> str:
+
+def _sniff_content_type(head: bytes) -> Optional[str]:
     """
-    Определить безопасное расширение: сначала из имени, если пусто — из MIME.
+    Определить тип картинки по первым байтам файла.
     """
-    ext = ""
-    if filename:
-        ext = Path(filename).suffix
-    if not ext and content_type:
-        guessed = mimetypes.guess_extension(content_type)
-        if guessed:
-            ext = guessed
-    return ext or ".bin"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
 
 
-async def _async_write_bytes(path: Path, data: bytes) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    async with aiofiles.open(path, "wb") as f:
-        await f.write(data)
+def media_url_for(path: Path) -> str:
+    """
+    media/quizes/1/A.jpg -> /media/quizes/1/A.jpg
+    """
+    return f"{MEDIA_URL}/{path.relative_to(MEDIA_ROOT).as_posix()}"
 
 
-async def save_file_for_quiz(quiz_id: int, file: UploadFile, filename: Optional[str] = None) -> str:
+async def _iter_upload(file: UploadFile) -> AsyncIterator[bytes]:
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+
+class StoredMedia(NamedTuple):
+    key: str        # ключ в хранилище: cas/ab/ab12....jpg
+    sha256: str
+    created: bool   # False — такой контент уже лежал в хранилище
+    # пин этой загрузки (None — блоб держит более поздний пин другой загрузки), см. pin_blob
+    pinned_until: Optional[datetime] = None
+
+    @property
+    def url(self) -> str:
+        return get_storage().url_for(self.key)
+
+
+# /media/cas/ab/<sha256>.jpg (URL может быть и абсолютным — смотрим только на path)
+_CAS_URL_RE = re.compile(rf"^{re.escape(MEDIA_URL)}/cas/[0-9a-f]{{2}}/([0-9a-f]{{64}})(\.[a-z0-9]+)$")
+_CAS_KEY_RE = re.compile(r"^cas/[0-9a-f]{2}/([0-9a-f]{64})(\.[a-z0-9]+)$")
+
+
+def cas_key(sha256: str, ext: str) -> str:
+    return f"cas/{sha256[:2]}/{sha256}{ext}"
+
+
+def cas_path(sha256: str, ext: str) -> Path:
+    """Путь файла в локальном CAS (MEDIA_STORAGE=local)."""
+    return MEDIA_ROOT / cas_key(sha256, ext)
+
+
+def parse_cas_key(key: str) -> Optional[tuple[str, str]]:
+    """Ключ CAS -> (sha256, ext); для прочих ключей — None."""
+    m = _CAS_KEY_RE.match(key or "")
+    return (m.group(1), m.group(2)) if m else None
+
+
+def parse_cas_url(url: str) -> Optional[tuple[str, str]]:
+    """
+    URL файла из CAS (локального или в хранилище MEDIA_STORAGE) -> (sha256, ext);
+    для любых других URL — None.
     """
-    Сохраняет файл в media/quizes/<quiz_id>/<filename> и возвращает относительный URL
-    вида /media/quizes/<quiz_id>/<filename>.
+    try:
+        m = _CAS_URL_RE.match(urlparse(url).path)
+    except Exception:
+        return None
+    if m is not None:
+        return m.group(1), m.group(2)
+    key = get_storage().key_for_url(url)
+    return parse_cas_key(key) if key else None
+
 
-    Если filename не указан — генерим случайное.
+async def store_stream(
+    chunks: AsyncIterator[bytes],
+    *,
+    max_bytes: int = MAX_BYTES,
+    allowed_ct: set[str] = ALLOWED_CT,
+    label: str = "upload",
+) -> StoredMedia:
     """
-    quiz_dir = MEDIA_ROOT / "quizes" / str(quiz_id)
-    quiz_dir.mkdir(parents=True, exist_ok=True)
+    Единый пайплайн записи в CAS: пишет поток чанков во временный файл, попутно считая
+    sha256, и кладёт его в хранилище (get_storage) под ключом cas/<sha[:2]>/<sha>.<ext>.
+    - тип определяется по первым байтам (415, если не из allowed_ct), расширение берётся из него;
+    - как только превышен max_bytes — обрываем запись и отдаём 413;
+    - если такой контент уже есть — временный файл выбрасываем и отдаём существующий путь
+      (один и тот же файл всегда получает один и тот же URL);
+    - блоб закрепляется за загрузкой (pin_blob): наличие объекта проверяется под блокировкой
+      его строки media_blobs, и параллельное удаление не может его стереть, пока ссылка
+      на него не закоммичена;
+    - временный файл удаляется в любом случае.
+    Источник — UploadFile (stream_upload) или HTTP-ответ (app/media/mirror.py).
+    Счётчики ссылок (media_blobs) ведёт вызывающий код — см. app/media/services.py.
+    """
+    # app.media.services импортирует этот модуль
+    from app.media.services import pin_blob
+
+    CAS_TMP_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = CAS_TMP_DIR / f"{secrets.token_hex(8)}.part"
+
+    digest = hashlib.sha256()
+    size = 0
+    ext: Optional[str] = None
+    head = b""
+    try:
+        async with aiofiles.open(tmp, "wb") as out:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"File too large (max {max_bytes} bytes)")
+                if ext is None:
+                    # сигнатуре нужно ~12 байт — сетевой поток может отдать их не одним чанком
+                    head += chunk
+                    if len(head) < 16:
+                        continue
+                    ext = _check_type(head, allowed_ct, label)
+                    chunk, head = head, b""
+                digest.update(chunk)
+                await out.write(chunk)
+            if ext is None:
+                ext = _check_type(head, allowed_ct, label)
+                digest.update(head)
+                await out.write(head)
+
+        sha = digest.hexdigest()
+        created, pinned_until = await pin_blob(sha, ext, lambda key: get_storage().put_file(key, tmp, _CT_BY_EXT[ext]))
+        return StoredMedia(cas_key(sha, ext), sha, created, pinned_until)
+    finally:
+        try:
+            await aiofiles.os.remove(tmp)
+        except FileNotFoundError:
+            pass
 
-    ext = _safe_ext(file.filename, file.content_type)
-    name = filename or f"{secrets.token_hex(8)}{ext}"
-    dest = quiz_dir / name
 
-    content = await file.read()
-    await _async_write_bytes(dest, content)
+def _check_type(head: bytes, allowed_ct: set[str], label: str) -> str:
+    content_type = _sniff_content_type(head)
+    if content_type not in allowed_ct:
+        raise HTTPException(status_code=415, detail=f"Unsupported file type: {label}")
+    return _EXT_BY_CT.get(content_type, ".bin")
 
-    return f"{MEDIA_URL}/quizes/{quiz_id}/{name}"
+
+async def stream_upload(
+    file: UploadFile,
+    *,
+    max_bytes: int = MAX_BYTES,
+    allowed_ct: set[str] = ALLOWED_CT,
+) -> StoredMedia:
+    """
+    Загрузка UploadFile в CAS чанками по UPLOAD_CHUNK_SIZE — в памяти не больше одного чанка.
+    Проверки типа/размера и дедупликация — см. store_stream.
+    """
+    # размер известен заранее (multipart уже разобран) — не читаем зря
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File too large (max {max_bytes} bytes)")
+
+    return await store_stream(
+        _iter_upload(file), max_bytes=max_bytes, allowed_ct=allowed_ct, label=file.filename or "upload"
+    )
+
+
+async def stream_uploads(files: Sequence[UploadFile]) -> List[StoredMedia]:
+    """
+    Параллельно (не больше UPLOAD_CONCURRENCY одновременно) прогоняет файлы через stream_upload.
+    Порядок результата совпадает с порядком files.
+    Если хотя бы один файл не сохранился — снимаем пины этого вызова и пробрасываем первую
+    ошибку; блобы удаляются, только если на них никто не ссылается и их не закрепила
+    параллельная загрузка (см. discard_stored).
+    """
+    if not files:
+        return []
+    sem = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+    async def _one(file: UploadFile) -> StoredMedia:
+        async with sem:
+            return await stream_upload(file)
+
+    results = await asyncio.gather(*(_one(f) for f in files), return_exceptions=True)
+
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        from app.media.services import discard_stored
+
+        await discard_stored([r for r in results if isinstance(r, StoredMedia)])
+        raise errors[0]
+    return list(results)
+
+
+async def save_file_for_quiz(quiz_id: int, file: UploadFile, filename: Optional[str] = None) -> str:
+    """
+    Сохраняет файл квиза и возвращает относительный URL вида /media/cas/<sha[:2]>/<sha>.<ext>.
+
+    quiz_id / filename оставлены для совместимости: файлы теперь лежат в CAS,
+    и одинаковое содержимое всегда получает один и тот же (канонический) URL.
+    """
+    stored = await stream_upload(file)
+    return stored.url
 
 
 async def save_files_for_quiz_with_labels(quiz_id: int, files: List[UploadFile]) -> List[str]:
     """
-    Сохраняет файлы в media/quizes/<quiz_id>/ с именами A.jpg, B.png, C..., по порядку.
-    Возвращает список относительных URL-ов в том же порядке.
+    Сохраняет файлы квиза (варианты A, B, C... — по порядку) и возвращает список
+    канонических URL-ов в том же порядке, что и files: метка = позиция в списке.
     """
-    urls: List[str] = []
-    for i, f in enumerate(files):
-        # A..Z, дальше — extra_<i>
-        label = chr(ord("A") + i) if i < 26 else f"extra_{i}"
-        ext = _safe_ext(f.filename, f.content_type)
-        filename = f"{label}{ext}"
-        url = await save_file_for_quiz(quiz_id, f, filename=filename)
-        urls.append(url)
-    return urls
+    saved = await stream_uploads(files)
+    return [m.url for m in saved]
 
 
 async def save_upload(request: Request, file: UploadFile, subdir: str) -> str:
     """
-    Универсальное сохранение в media/<subdir>/..., возвращает АБСОЛЮТНЫЙ URL.
+    Универсальное сохранение в CAS, возвращает АБСОЛЮТНЫЙ URL.
     Подходит, если нужно вернуть полный URL (например, для фронта на другом домене).
+    subdir оставлен для совместимости.
     """
-    target_dir = MEDIA_ROOT / subdir
-    target_dir.mkdir(parents=True, exist_ok=True)
+    stored = await stream_upload(file)
+    url = stored.url
+    if url.startswith("/"):
+        # локальное хранилище отдаёт относительные URL; у S3 они уже абсолютные
+        url = f"{str(request.base_url).rstrip('/')}{url}"
+    return url
 
-    ext = _safe_ext(file.filename, file.content_type)
-    name = f"{secrets.token_hex(8)}{ext}"
-    dest = target_dir / name
+async def _save_uploads(request: Request, files: List[UploadFile], subdir: str = "questions") -> List[str]:
+    """
+    Сохраняет набор UploadFile в CAS и возвращает СПИСОК ОТНОСИТЕЛЬНЫХ URL’ов
+    в порядке files: [/media/cas/ab/<sha1>.jpg, /media/cas/cd/<sha2>.png, ...].
 
-    content = await file.read()
-    await _async_write_bytes(dest, content)
+    Сигнатура совместима с твоим использованием в сервисе.
+    """
+    saved = await stream_uploads(files)
+    return [m.url for m in saved]
 
-    base = str(request.base_url).rstrip("/")
-    return f"{base}{MEDIA_URL}/{subdir}/{name}"
 
-async def _save_uploads(request: Request, files: List[UploadFile], subdir: str = "questions") -> List[str]:
+# ---------------------------------------------------------------------------
+# Хранилище файлов: CAS (store_stream) и прямые загрузки — клиент кладёт файл сразу
+# в хранилище по подписанной форме (presign), API только проверяет и записывает ключ.
+# Производные картинок и GC работают только с локальным диском (MEDIA_ROOT).
+# ---------------------------------------------------------------------------
+
+# local — текущее поведение (файлы в MEDIA_ROOT); s3 — любое S3-совместимое хранилище (AWS, MinIO...)
+MEDIA_STORAGE = os.getenv("MEDIA_STORAGE", "local").lower()
+# сколько живёт подписанная форма загрузки
+MEDIA_PRESIGN_TTL = int(os.getenv("MEDIA_PRESIGN_TTL", "900"))
+# все прямые загрузки лежат под этим префиксом — чужие ключи привязать к вопросу нельзя
+UPLOADS_PREFIX = "uploads/"
+
+_UPLOAD_KEY_RE = re.compile(r"^uploads/\d{4}/\d{2}/[0-9a-f]{32}\.[a-z0-9]+$")
+
+
+class StoredObject(NamedTuple):
+    size: int
+    content_type: Optional[str]
+
+
+class PresignedUpload(NamedTuple):
+    key: str
+    url: str
+    method: str
+    fields: Dict[str, str]   # поля multipart-формы; файл — последним полем "file"
+    expires_in: int
+
+
+def new_upload_key(content_type: str) -> str:
+    """uploads/2025/01/<random>.jpg — расширение по заявленному типу (проверяется при attach)."""
+    if content_type not in ALLOWED_CT:
+        raise HTTPException(status_code=415, detail=f"Unsupported content type: {content_type}")
+    now = datetime.now(timezone.utc)
+    return f"{UPLOADS_PREFIX}{now:%Y/%m}/{secrets.token_hex(16)}{_EXT_BY_CT[content_type]}"
+
+
+def is_upload_key(key: str) -> bool:
+    return bool(_UPLOAD_KEY_RE.match(key or ""))
+
+
+class StorageBackend(abc.ABC):
     """
-    Сохраняет набор UploadFile в media/<subdir>/ и возвращает СПИСОК ОТНОСИТЕЛЬНЫХ URL’ов:
-    [/media/<subdir>/<name1>, /media/<subdir>/<name2>, ...].
+    Минимальный интерфейс хранилища. Ключ — относительный путь ("uploads/2025/01/ab.jpg").
+    """
+    name = "base"
 
-    Сигнатура совместима с твоим использованием в сервисе.
+    @abc.abstractmethod
+    def url_for(self, key: str) -> str:
+        ...
+
+    @abc.abstractmethod
+    def key_for_url(self, url: str) -> Optional[str]:
+        """Ключ, если URL указывает в это хранилище, иначе None."""
+
+    async def presign_upload(self, key: str, content_type: str, max_bytes: int = MAX_BYTES) -> PresignedUpload:
+        raise HTTPException(status_code=501, detail=f"Direct uploads are not supported by '{self.name}' storage")
+
+    @abc.abstractmethod
+    async def stat(self, key: str) -> Optional[StoredObject]:
+        ...
+
+    @abc.abstractmethod
+    async def read_head(self, key: str, n: int = 32) -> bytes:
+        ...
+
+    @abc.abstractmethod
+    async def put_file(self, key: str, path: Path, content_type: str) -> None:
+        """Положить локальный файл под ключ (файл после вызова можно удалять)."""
+
+    async def touch(self, key: str) -> None:
+        """Отметить, что объект снова используется (для grace-периода GC)."""
+
+    @abc.abstractmethod
+    async def delete(self, key: str) -> None:
+        """Удалить объект; отсутствующий объект — не ошибка."""
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalStorage(StorageBackend):
+    """Файлы в MEDIA_ROOT, раздаются через /media. Прямые загрузки не поддерживает."""
+    name = "local"
+
+    def __init__(self, root: Path = MEDIA_ROOT, url_prefix: str = MEDIA_URL):
+        self.root = root
+        self.url_prefix = url_prefix
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if not path.is_relative_to(self.root.resolve()):
+            raise HTTPException(status_code=400, detail="Invalid storage key")
+        return path
+
+    def url_for(self, key: str) -> str:
+        return f"{self.url_prefix}/{key}"
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        try:
+            parsed = urlparse(url)
+        except Exception:
+            return None
+        # абсолютные URL — чужие хосты (свои абсолютные URL из save_upload указывают в CAS)
+        path = parsed.path
+        if parsed.netloc or not path.startswith(self.url_prefix + "/"):
+            return None
+        return path[len(self.url_prefix) + 1:]
+
+    async def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            st = await aiofiles.os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        return StoredObject(st.st_size, None)
+
+    async def read_head(self, key: str, n: int = 32) -> bytes:
+        async with aiofiles.open(self._path(key), "rb") as f:
+            return await f.read(n)
+
+    async def put_file(self, key: str, path: Path, content_type: str) -> None:
+        # временные файлы лежат на той же ФС (CAS_TMP_DIR) — rename атомарный
+        dest = self._path(key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        await aiofiles.os.replace(path, dest)
+
+    async def touch(self, key: str) -> None:
+        try:
+            await asyncio.to_thread(os.utime, self._path(key))
+        except FileNotFoundError:
+            pass
+
+    async def delete(self, key: str) -> None:
+        try:
+            await aiofiles.os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+def _hmac_sha256(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+class S3Storage(StorageBackend):
     """
-    if not files:
-        return []
+    S3-совместимое хранилище (path-style: <endpoint>/<bucket>/<key>, как у MinIO).
+    Подпись AWS SigV4 считается вручную — без boto3, запросы идут через один aiohttp-сеанс.
+    Прямые загрузки — presigned POST: политика ограничивает ключ, Content-Type и размер.
+    """
+    name = "s3"
+
+    def __init__(
+        self,
+        endpoint: str,
+        bucket: str,
+        access_key: str,
+        secret_key: str,
+        region: str = "us-east-1",
+        public_url: Optional[str] = None,
+    ):
+        self.endpoint = endpoint.rstrip("/")
+        self.host = urlparse(self.endpoint).netloc
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        # откуда клиенты читают файлы (CDN/публичный бакет); по умолчанию — сам endpoint
+        self.public_url = (public_url or f"{self.endpoint}/{bucket}").rstrip("/")
+        self._http: Optional[aiohttp.ClientSession] = None
+
+    def _session(self) -> aiohttp.ClientSession:
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30, sock_connect=10))
+        return self._http
+
+    async def close(self) -> None:
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    def _object_path(self, key: str) -> str:
+        return f"/{quote(self.bucket)}/{quote(key)}"
+
+    def _scope(self, date: str) -> str:
+        return f"{date}/{self.region}/s3/aws4_request"
+
+    def _signing_key(self, date: str) -> bytes:
+        k = _hmac_sha256(f"AWS4{self.secret_key}".encode("utf-8"), date)
+        k = _hmac_sha256(k, self.region)
+        k = _hmac_sha256(k, "s3")
+        return _hmac_sha256(k, "aws4_request")
+
+    def _signed_headers(self, method: str, path: str) -> Dict[str, str]:
+        amz_date = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        date = amz_date[:8]
+        headers = {
+            "host": self.host,
+            "x-amz-content-sha256": "UNSIGNED-PAYLOAD",
+            "x-amz-date": amz_date,
+        }
+        names = sorted(headers)
+        signed = ";".join(names)
+        canonical = "\n".join([
+            method,
+            path,
+            "",  # query string
+            "".join(f"{n}:{headers[n]}\n" for n in names),
+            signed,
+            "UNSIGNED-PAYLOAD",
+        ])
+        to_sign = "\n".join([
+            "AWS4-HMAC-SHA256",
+            amz_date,
+            self._scope(date),
+            hashlib.sha256(canonical.encode("utf-8")).hexdigest(),
+        ])
+        signature = hmac.new(self._signing_key(date), to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+        headers["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{self._scope(date)}, "
+            f"SignedHeaders={signed}, Signature={signature}"
+        )
+        return headers
 
-    target_dir = MEDIA_ROOT / subdir
-    target_dir.mkdir(parents=True, exist_ok=True)
+    def _request(self, method: str, key: str, extra_headers: Optional[Dict[str, str]] = None, data=None):
+        path = self._object_path(key)
+        headers = self._signed_headers(method, path)
+        headers.update(extra_headers or {})
+        return self._session().request(method, f"{self.endpoint}{path}", headers=headers, data=data)
 
-    urls: List[str] = []
-    for f in files:
-        ext = _safe_ext(f.filename, f.content_type)
-        name = f"{secrets.token_hex(8)}{ext}"
-        dest = target_dir / name
+    def url_for(self, key: str) -> str:
+        return f"{self.public_url}/{quote(key)}"
 
-        content = await f.read()
-        await _async_write_bytes(dest, content)
+    def key_for_url(self, url: str) -> Optional[str]:
+        if not url.startswith(self.public_url + "/"):
+            return None
+        return unquote(url[len(self.public_url) + 1:].split("?", 1)[0])
 
-        urls.append(f"{MEDIA_URL}/{subdir}/{name}")
+    async def presign_upload(self, key: str, content_type: str, max_bytes: int = MAX_BYTES) -> PresignedUpload:
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date = amz_date[:8]
+        credential = f"{self.access_key}/{self._scope(date)}"
+        policy = {
+            "expiration": (now + timedelta(seconds=MEDIA_PRESIGN_TTL)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "conditions": [
+                {"bucket": self.bucket},
+                {"key": key},
+                {"Content-Type": content_type},
+                ["content-length-range", 1, max_bytes],
+                {"x-amz-algorithm": "AWS4-HMAC-SHA256"},
+                {"x-amz-credential": credential},
+                {"x-amz-date": amz_date},
+            ],
+        }
+        policy_b64 = base64.b64encode(json.dumps(policy).encode("utf-8")).decode("ascii")
+        signature = hmac.new(self._signing_key(date), policy_b64.encode("ascii"), hashlib.sha256).hexdigest()
+        return PresignedUpload(
+            key=key,
+            url=f"{self.endpoint}/{self.bucket}",
+            method="POST",
+            fields={
+                "key": key,
+                "Content-Type": content_type,
+                "x-amz-algorithm": "AWS4-HMAC-SHA256",
+                "x-amz-credential": credential,
+                "x-amz-date": amz_date,
+                "policy": policy_b64,
+                "x-amz-signature": signature,
+            },
+            expires_in=MEDIA_PRESIGN_TTL,
+        )
 
-    return urls
\ No newline at end of file
+    async def stat(self, key: str) -> Optional[StoredObject]:
+        async with self._request("HEAD", key) as resp:
+            if resp.status == 404:
+                return None
+            if resp.status >= 400:
+                raise HTTPException(status_code=502, detail=f"Storage error: HTTP {resp.status}")
+            return StoredObject(int(resp.headers.get("Content-Length", "0")), resp.headers.get("Content-Type"))
+
+    async def read_head(self, key: str, n: int = 32) -> bytes:
+        async with self._request("GET", key, {"Range": f"bytes=0-{n - 1}"}) as resp:
+            if resp.status >= 400:
+                raise HTTPException(status_code=502, detail=f"Storage error: HTTP {resp.status}")
+            return await resp.content.read(n)
+
+    async def put_file(self, key: str, path: Path, content_type: str) -> None:
+        # файловый объект aiohttp отправляет чанками с Content-Length (S3 не принимает chunked)
+        with open(path, "rb") as f:
+            async with self._request("PUT", key, {"Content-Type": content_type}, data=f) as resp:
+                if resp.status >= 400:
+                    raise HTTPException(status_code=502, detail=f"Storage error: HTTP {resp.status}")
+
+    async def delete(self, key: str) -> None:
+        async with self._request("DELETE", key) as resp:
+            if resp.status >= 400 and resp.status != 404:
+                raise HTTPException(status_code=502, detail=f"Storage error: HTTP {resp.status}")
+
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """Бэкенд по MEDIA_STORAGE (создаётся один раз на процесс)."""
+    global _storage
+    if _storage is None:
+        if MEDIA_STORAGE == "s3":
+            _storage = S3Storage(
+                endpoint=os.environ["S3_ENDPOINT_URL"],
+                bucket=os.environ["S3_BUCKET"],
+                access_key=os.environ["S3_ACCESS_KEY"],
+                secret_key=os.environ["S3_SECRET_KEY"],
+                region=os.getenv("S3_REGION", "us-east-1"),
+                public_url=os.getenv("S3_PUBLIC_URL"),
+            )
+        else:
+            _storage = LocalStorage()
+    return _storage
+
+
+async def close_storage() -> None:
+    if _storage is not None:
+        await _storage.close()
+
+
+async def verify_upload(key: str, *, max_bytes: int = MAX_BYTES, allowed_ct: set[str] = ALLOWED_CT) -> str:
+    """
+    Проверить файл, загруженный клиентом напрямую: ключ наш, объект есть, размер в лимите,
+    тип по сигнатуре из allowed_ct (Content-Type клиента не в счёт). Возвращает публичный URL.
+    """
+    if not is_upload_key(key):
+        raise HTTPException(status_code=400, detail=f"Invalid upload key: {key}")
+    storage = get_storage()
+    obj = await storage.stat(key)
+    if obj is None:
+        raise HTTPException(status_code=404, detail=f"Upload not found: {key}")
+    if obj.size > max_bytes:
+        await storage.delete(key)
+        raise HTTPException(status_code=413, detail=f"File too large (max {max_bytes} bytes)")
+    if _sniff_content_type(await storage.read_head(key)) not in allowed_ct:
+        await storage.delete(key)
+        raise HTTPException(status_code=415, detail=f"Unsupported file type: {key}")
+    return storage.url_for(key)
@@ -0,0 +1,128 @@
+import os
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Sequence
+
+from sqlalchemy import func, lambda_stmt, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.common import pubsub
+from app.users.models import User
+
+# сколько живёт запись кеша; изменения прав приходят через NOTIFY раньше, TTL — страховка
+IDENTITY_CACHE_TTL = float(os.getenv("IDENTITY_CACHE_TTL_SECONDS", "30"))
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "10000"))
+
+_CHANNEL = "identity_changed"
+# payload pg_notify ограничен 8000 байт — столько telegram_id через запятую точно влезет
+_NOTIFY_CHUNK = 350
+
+
+class Identity(NamedTuple):
+    """Всё, что нужно для авторизации запроса — без ORM-объекта и его связей."""
+    id: int
+    telegram_id: int
+    is_admin: bool
+    is_active: bool
+
+
+# telegram_id -> (expires_at, Identity, tokens_valid_after); порядок = LRU
+_cache: "OrderedDict[int, tuple[float, Identity, Optional[int]]]" = OrderedDict()
+
+
+def _drop(payload: Optional[str]) -> None:
+    if payload is None:
+        _cache.clear()
+        return
+    # один telegram_id или несколько через запятую (identities_changed)
+    for part in payload.split(","):
+        try:
+            telegram_id = int(part)
+        except ValueError:
+            continue
+        _cache.pop(telegram_id, None)
+
+
+pubsub.subscribe(_CHANNEL, _drop)
+
+
+async def _lookup(session: AsyncSession, telegram_id: int) -> Optional[tuple[float, Identity, Optional[int]]]:
+    """
+    Запись кеша по telegram_id: из кеша процесса, иначе один узкий SELECT.
+    Отсутствующих пользователей не кешируем — сразу после регистрации они должны находиться.
+    """
+    now = time.monotonic()
+    hit = _cache.get(telegram_id)
+    if hit is not None:
+        if hit[0] > now:
+            _cache.move_to_end(telegram_id)
+            return hit
+        del _cache[telegram_id]
+
+    # lambda_stmt: конструкция запроса и его ключ кеша строятся один раз на процесс
+    res = await session.execute(lambda_stmt(
+        lambda: select(
+            User.id, User.telegram_id, User.is_admin, User.is_active, User.tokens_valid_after
+        ).where(User.telegram_id == telegram_id)
+    ))
+    row = res.first()
+    if row is None:
+        return None
+
+    identity = Identity(row.id, row.telegram_id, bool(row.is_admin), bool(row.is_active))
+    entry = (now + IDENTITY_CACHE_TTL, identity, row.tokens_valid_after)
+    _cache[telegram_id] = entry
+    if len(_cache) > IDENTITY_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return entry
+
+
+async def get_identity(session: AsyncSession, telegram_id: int) -> Optional[Identity]:
+    """Identity по telegram_id (кеш процесса, см. _lookup)."""
+    entry = await _lookup(session, telegram_id)
+    return entry[1] if entry is not None else None
+
+
+async def token_revoked(session: AsyncSession, telegram_id: int, issued_at: int) -> bool:
+    """
+    Отозван ли токен (см. app/users/auth.py): пользователь удалён или его права поменялись
+    после выдачи. Отметка хранится в users.tokens_valid_after — общая для всех воркеров и
+    переживает рестарт; читается через тот же кеш, что и Identity.
+    """
+    entry = await _lookup(session, telegram_id)
+    if entry is None:
+        return True
+    valid_after = entry[2]
+    return valid_after is not None and issued_at < valid_after
+
+
+async def _revoke_tokens(session: AsyncSession, telegram_ids: Sequence[int]) -> None:
+    # clock_timestamp, а не now(): now() — время начала транзакции, токен, выданный между
+    # началом транзакции и сменой прав, остался бы действительным
+    await session.execute(
+        update(User)
+        .where(User.telegram_id.in_(telegram_ids))
+        .values(tokens_valid_after=func.floor(func.extract("epoch", func.clock_timestamp())))
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def identity_changed(session: AsyncSession, telegram_id: int) -> None:
+    """
+    Права/статус пользователя поменялись (или он удалён): вызвать в той же транзакции,
+    что и само изменение. Выданные ему токены отзываются (users.tokens_valid_after),
+    локальная запись кеша сбрасывается сразу, остальные воркеры получат NOTIFY после коммита.
+    """
+    await _revoke_tokens(session, [telegram_id])
+    _drop(str(telegram_id))
+    await pubsub.publish(session, _CHANNEL, str(telegram_id))
+
+
+async def identities_changed(session: AsyncSession, telegram_ids: Sequence[int]) -> None:
+    """identity_changed для многих пользователей сразу: один UPDATE и один NOTIFY на пачку id."""
+    for i in range(0, len(telegram_ids), _NOTIFY_CHUNK):
+        chunk = list(telegram_ids[i:i + _NOTIFY_CHUNK])
+        await _revoke_tokens(session, chunk)
+        payload = ",".join(str(tid) for tid in chunk)
+        _drop(payload)
+        await pubsub.publish(session, _CHANNEL, payload)
@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Awaitable, Callable
+
+import asyncpg
+
+from app.common.db import asyncpg_dsn
+
+logger = logging.getLogger("uvicorn.error")
+
+# как часто не-лидер пробует взять блокировку
+LEADER_RETRY_SECONDS = float(os.getenv("LEADER_RETRY_SECONDS", "5"))
+# как часто лидер проверяет, что его соединение (а значит и блокировка) живо
+LEADER_HEARTBEAT_SECONDS = float(os.getenv("LEADER_HEARTBEAT_SECONDS", "10"))
+
+
+def advisory_key(name: str) -> int:
+    """Стабильный bigint-ключ pg_advisory_lock из имени."""
+    return int.from_bytes(hashlib.sha256(name.encode("utf-8")).digest()[:8], "big", signed=True)
+
+
+async def _heartbeat(conn: asyncpg.Connection) -> None:
+    while True:
+        await asyncio.sleep(LEADER_HEARTBEAT_SECONDS)
+        await conn.fetchval("SELECT 1")
+
+
+async def run_as_leader(name: str, job: Callable[[], Awaitable[None]]) -> None:
+    """
+    Выполнять job только в одном процессе из всех (воркеры uvicorn, реплики).
+    Лидер держит сессионный pg_advisory_lock на отдельном соединении asyncpg:
+    если процесс умер или соединение оборвалось, Postgres снимает блокировку сам,
+    и её забирает следующий кандидат (failover за ~LEADER_RETRY_SECONDS).
+    Если job завершилась (или упала) — блокировка отпускается, выборы начинаются заново.
+    """
+    key = advisory_key(name)
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(asyncpg_dsn())
+            while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", key):
+                await asyncio.sleep(LEADER_RETRY_SECONDS)
+
+            logger.info(f"Leader '{name}': acquired (pid={os.getpid()})")
+            job_task = asyncio.create_task(job())
+            beat_task = asyncio.create_task(_heartbeat(conn))
+            try:
+                done, _ = await asyncio.wait({job_task, beat_task}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for t in (job_task, beat_task):
+                    t.cancel()
+                await asyncio.gather(job_task, beat_task, return_exceptions=True)
+
+            if beat_task in done:
+                logger.warning(f"Leader '{name}': lost DB connection, stepping down")
+            elif job_task.exception() is not None:
+                logger.error(f"Leader '{name}': job failed: {job_task.exception()!r}")
+            else:
+                logger.info(f"Leader '{name}': job finished, releasing")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"Leader '{name}': election failed")
+        finally:
+            if conn is not None and not conn.is_closed():
+                # закрытие соединения снимает и блокировку
+                await conn.close()
+        await asyncio.sleep(LEADER_RETRY_SECONDS)
+
+
+class AdvisoryLocks:
+    """
+    Набор сессионных pg_advisory_lock на одном выделенном соединении — владение сразу
+    многими объектами (например, событиями в планировщике таймеров). Соединение
+    оборвалось — Postgres снял все блокировки, и ping() упадёт: владение потеряно.
+    Соединение одно, поэтому вызывать методы из одной задачи.
+    """
+
+    def __init__(self):
+        self._conn: asyncpg.Connection | None = None
+        self.held: set[str] = set()
+
+    async def connect(self) -> None:
+        await self.close()
+        self._conn = await asyncpg.connect(asyncpg_dsn())
+
+    async def try_acquire(self, name: str) -> bool:
+        if name in self.held:
+            return True
+        if await self._conn.fetchval("SELECT pg_try_advisory_lock($1)", advisory_key(name)):
+            self.held.add(name)
+            return True
+        return False
+
+    async def release(self, name: str) -> None:
+        if name in self.held:
+            self.held.discard(name)
+            await self._conn.fetchval("SELECT pg_advisory_unlock($1)", advisory_key(name))
+
+    async def ping(self) -> None:
+        await self._conn.fetchval("SELECT 1")
+
+    async def close(self) -> None:
+        self.held.clear()
+        if self._conn is not None and not self._conn.is_closed():
+            # закрытие соединения снимает и все блокировки
+            await self._conn.close()
+        self._conn = None
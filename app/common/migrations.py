@@ -0,0 +1,96 @@
+"""
+Докат схемы для уже существующих БД. Таблицы создаёт Base.metadata.create_all, но
+существующие таблицы он не меняет: колонки и индексы, добавленные в модели позже,
+добавляются здесь идемпотентным DDL, а их данные — досчитываются. Каждый шаг безопасно
+выполнять на каждом старте (см. init_models).
+"""
+import logging
+
+from sqlalchemy import bindparam, select, text, update
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.media.images import variants_for
+from app.quizes.hashing import question_content_hash
+from app.quizes.models import QuizQuestion
+
+logger = logging.getLogger("uvicorn.error")
+
+# по порядку; только IF NOT EXISTS / IF EXISTS — повтор ничего не меняет
+_DDL = [
+    # хеш контента вопроса: повторный импорт того же пакета — upsert, а не дубликаты
+    "ALTER TABLE quiz_questions ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    # на новой БД create_all уже создал одноимённое ограничение (и его индекс) — шаг пропустится
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_quiz_questions_quiz_content_hash ON quiz_questions (quiz_id, content_hash)",
+    # URL уменьшенных копий картинок вопроса (заполняется вместе с images_urls)
+    "ALTER TABLE quiz_questions ADD COLUMN IF NOT EXISTS images_variants JSON",
+    # отзыв токенов при смене прав — общий для всех воркеров
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS tokens_valid_after BIGINT",
+    # защита свежих загрузок от параллельного удаления блоба (app/media/services.py)
+    "ALTER TABLE media_blobs ADD COLUMN IF NOT EXISTS pinned_until TIMESTAMPTZ",
+    # закончившийся квиз держит закрытое окно ответа (таймер без вопроса и дедлайна)
+    "ALTER TABLE event_timers ALTER COLUMN question_id DROP NOT NULL",
+    "ALTER TABLE event_timers ALTER COLUMN deadline DROP NOT NULL",
+]
+
+
+async def _backfill_content_hash(conn: AsyncConnection) -> None:
+    """
+    Досчитать content_hash вопросам, созданным до его появления. Дубликаты внутри квиза
+    (их раньше ничто не запрещало) оставляем с NULL — уникальный индекс NULL не сравнивает.
+    """
+    t = QuizQuestion.__table__
+    rows = (await conn.execute(
+        select(t.c.id, t.c.quiz_id, t.c.type, t.c.text_i18n, t.c.options_i18n, t.c.correct_answers_i18n)
+        .where(t.c.content_hash.is_(None))
+        .order_by(t.c.id)
+    )).all()
+    if not rows:
+        return
+    taken = set((await conn.execute(
+        select(t.c.quiz_id, t.c.content_hash).where(t.c.content_hash.is_not(None))
+    )).all())
+
+    params = []
+    for qid, quiz_id, qtype, text_i18n, options_i18n, correct_i18n in rows:
+        h = question_content_hash(qtype, text_i18n, options_i18n, correct_i18n)
+        if (quiz_id, h) in taken:
+            continue
+        taken.add((quiz_id, h))
+        params.append({"qid": qid, "h": h})
+    if params:
+        await conn.execute(
+            update(t).where(t.c.id == bindparam("qid")).values(content_hash=bindparam("h")),
+            params,
+        )
+    logger.info(f"Schema upgrade: content_hash backfilled for {len(params)} of {len(rows)} questions")
+
+
+async def _backfill_images_variants(conn: AsyncConnection) -> None:
+    """images_variants для строк, созданных до появления колонки (там NULL)."""
+    t = QuizQuestion.__table__
+    rows = (await conn.execute(
+        select(t.c.id, t.c.images_urls).where(t.c.images_variants.is_(None))
+    )).all()
+    if not rows:
+        return
+    params = []
+    for qid, urls in rows:
+        variants = {}
+        for url in urls or []:
+            v = variants_for(url)
+            if v:
+                variants[url] = v
+        params.append({"qid": qid, "v": variants})
+    await conn.execute(
+        update(t).where(t.c.id == bindparam("qid")).values(images_variants=bindparam("v", type_=t.c.images_variants.type)),
+        params,
+    )
+    logger.info(f"Schema upgrade: images_variants backfilled for {len(params)} questions")
+
+
+async def upgrade_schema(conn: AsyncConnection) -> None:
+    """Выполнить докат схемы в транзакции init_models (после create_all)."""
+    for stmt in _DDL:
+        await conn.execute(text(stmt))
+    await _backfill_content_hash(conn)
+    await _backfill_images_variants(conn)
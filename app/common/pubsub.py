@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+import asyncpg
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.common.db import asyncpg_dsn
+
+logger = logging.getLogger("uvicorn.error")
+
+# пауза перед переподключением слушателя
+_RECONNECT_SECONDS = 5.0
+
+# канал -> обработчики; payload=None значит «могли что-то пропустить — сбросьте всё»
+_handlers: Dict[str, List[Callable[[Optional[str]], None]]] = {}
+
+
+def subscribe(channel: str, handler: Callable[[Optional[str]], None]) -> None:
+    """
+    Подписать обработчик на канал Postgres NOTIFY. Вызывать при импорте модуля —
+    до старта run_listener(). Обработчик синхронный и быстрый (он на event loop).
+    """
+    _handlers.setdefault(channel, []).append(handler)
+
+
+async def publish(session: AsyncSession, channel: str, payload: str) -> None:
+    """
+    pg_notify в транзакции вызывающего кода: сообщение уйдёт всем воркерам только
+    после коммита (и не уйдёт вовсе при откате).
+    """
+    await session.execute(select(func.pg_notify(channel, payload)))
+
+
+def _dispatch(channel: str, payload: Optional[str]) -> None:
+    for handler in _handlers.get(channel, []):
+        try:
+            handler(payload)
+        except Exception:
+            logger.exception(f"PubSub handler failed for {channel!r}")
+
+
+async def run_listener() -> None:
+    """
+    Фоновый цикл: отдельное соединение asyncpg (вне пула SQLAlchemy) слушает все
+    подписанные каналы. После обрыва переподключается и рассылает payload=None —
+    уведомления за время простоя потеряны, кеши нужно сбросить целиком.
+    """
+    def on_notify(_conn, _pid, channel: str, payload: str) -> None:
+        _dispatch(channel, payload)
+
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(asyncpg_dsn())
+            for channel in _handlers:
+                await conn.add_listener(channel, on_notify)
+                _dispatch(channel, None)
+            closed = asyncio.Event()
+            conn.add_termination_listener(lambda _conn: closed.set())
+            await closed.wait()
+            logger.warning("PubSub listener: connection lost, reconnecting")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("PubSub listener failed")
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(_RECONNECT_SECONDS)
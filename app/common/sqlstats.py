@@ -0,0 +1,149 @@
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger("uvicorn.error")
+
+# запросы дольше этого пишем в лог (мс); 0 — выключено
+SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "200"))
+# одинаковый SQL столько раз за запрос — похоже на N+1
+NPLUS1_THRESHOLD = int(os.getenv("SQL_NPLUS1_THRESHOLD", "5"))
+SERVER_TIMING = os.getenv("SQL_SERVER_TIMING", "true").lower() == "true"
+
+_STATEMENT_PREVIEW = 300
+
+
+class QueryStats:
+    """Счётчики SQL за один HTTP-запрос (или за блок assert_queries)."""
+    __slots__ = ("count", "total_ms", "slowest_ms", "slowest_sql", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_sql: Optional[str] = None
+        self.statements: Counter = Counter()
+
+    def record(self, statement: str, duration_ms: float) -> None:
+        self.count += 1
+        self.total_ms += duration_ms
+        self.statements[statement] += 1
+        if duration_ms > self.slowest_ms:
+            self.slowest_ms = duration_ms
+            self.slowest_sql = statement
+
+    def repeated(self, threshold: int = NPLUS1_THRESHOLD) -> list[tuple[str, int]]:
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.total_ms:.1f};desc="{self.count} queries", db-slowest;dur={self.slowest_ms:.1f}'
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("sql_query_stats", default=None)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+
+def _preview(statement: str) -> str:
+    s = " ".join(statement.split())
+    return s if len(s) <= _STATEMENT_PREVIEW else s[:_STATEMENT_PREVIEW] + "…"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    duration_ms = (time.perf_counter() - starts.pop()) * 1000
+
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, duration_ms)
+    if SLOW_QUERY_MS and duration_ms >= SLOW_QUERY_MS:
+        logger.warning(f"Slow SQL ({duration_ms:.1f} ms): {_preview(statement)}")
+
+
+def _handle_error(exception_context):
+    # запрос упал — after_cursor_execute не будет, снимаем его отметку времени
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+def instrument_engine(engine) -> None:
+    """Подключить счётчики к движку (AsyncEngine или Engine)."""
+    sync_engine: Engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+def _report(stats: QueryStats, label: str) -> None:
+    for sql, n in stats.repeated():
+        logger.warning(f"Possible N+1 in {label}: {n}x {_preview(sql)}")
+
+
+class SQLStatsMiddleware:
+    """
+    ASGI-middleware: собирает QueryStats на время запроса, отдаёт их в заголовке
+    Server-Timing (видно в DevTools → Timing) и пишет в лог повторяющиеся запросы.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = QueryStats()
+        token = _current.set(stats)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and SERVER_TIMING:
+                MutableHeaders(scope=message).append("Server-Timing", stats.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            _report(stats, f"{scope['method']} {scope['path']}")
+
+
+@contextmanager
+def assert_queries(max_count: Optional[int] = None, max_repeats: Optional[int] = None) -> Iterator[QueryStats]:
+    """
+    Для тестов: считает SQL внутри блока и падает AssertionError, если запросов больше
+    max_count или какой-то запрос повторился больше max_repeats раз (N+1).
+
+        with assert_queries(max_count=3, max_repeats=1) as stats:
+            await svc.list_questions_by_quiz(quiz_id)
+    """
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+    if max_count is not None and stats.count > max_count:
+        raise AssertionError(f"Expected at most {max_count} queries, got {stats.count}")
+    if max_repeats is not None:
+        repeated = stats.repeated(max_repeats + 1)
+        if repeated:
+            sql, n = repeated[0]
+            raise AssertionError(f"Statement repeated {n}x (max {max_repeats}): {_preview(sql)}")
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.common import pubsub
+from app.common.db import AsyncSessionLocal
+from app.events.models import Event, EventTimer
+from app.quizes.models import Quiz
+
+logger = logging.getLogger("uvicorn.error")
+
+# комментарий-пинг в SSE, чтобы прокси не закрывали простаивающее соединение
+EVENT_STREAM_KEEPALIVE_SECONDS = float(os.getenv("EVENT_STREAM_KEEPALIVE_SECONDS", "15"))
+# сколько состояние живёт в памяти без NOTIFY: не всякое изменение события его публикует
+# (например, событие удалилось каскадом вместе с создателем) — потом перечитываем из БД
+EVENT_STATE_TTL_SECONDS = float(os.getenv("EVENT_STATE_TTL_SECONDS", "30"))
+
+_CHANNEL = "event_state"
+_MAX_STATES = 10_000
+
+# event_id -> (когда перечитать из БД, последнее состояние в JSON)
+_states: Dict[int, Tuple[float, str]] = {}
+# event_id -> очереди подключённых клиентов этого воркера
+_listeners: Dict[int, Set[asyncio.Queue]] = {}
+_resync_task: Optional[asyncio.Task] = None
+
+
+async def load_state(session: AsyncSession, event_id: int) -> Optional[dict]:
+    """Статус события, индекс вопроса, активный квиз и открытый вопрос таймера — одним запросом."""
+    active_quiz = (
+        select(Quiz.id)
+        .where(Quiz.event_id == Event.id, Quiz.is_active.is_(True))
+        .order_by(Quiz.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    row = (await session.execute(
+        select(
+            Event.status, Event.current_question_index, active_quiz,
+            EventTimer.quiz_id, EventTimer.question_id, EventTimer.deadline,
+        )
+        .outerjoin(EventTimer, EventTimer.event_id == Event.id)
+        .where(Event.id == event_id)
+    )).first()
+    if row is None:
+        return None
+    return {
+        "event_id": event_id,
+        "game_status": row[0].value,
+        "current_question_index": row[1],
+        "active_quiz_id": row[2],
+        # серверный таймер: квиз под ним (None — вопросы переключает ведущий вручную),
+        # открытый вопрос и дедлайн (None при таймере — вопросы кончились, ответы закрыты)
+        "timer_quiz_id": row[3],
+        "question_id": row[4],
+        "deadline": row[5].isoformat() if row[5] is not None else None,
+    }
+
+
+def _deleted_payload(event_id: int) -> str:
+    """Событие удалено: воркеры забудут его состояние, SSE-клиенты получат event: deleted."""
+    return json.dumps({"event_id": event_id, "deleted": True})
+
+
+async def publish_state(session: AsyncSession, event_id: int) -> None:
+    """
+    Разослать новое состояние события всем воркерам. Вызывать в транзакции изменения
+    (после изменения полей): NOTIFY уйдёт только после коммита.
+    """
+    await session.flush()
+    state = await load_state(session, event_id)
+    payload = json.dumps(state) if state is not None else _deleted_payload(event_id)
+    await pubsub.publish(session, _CHANNEL, payload)
+
+
+def _remember(event_id: int, payload: str) -> None:
+    if event_id not in _states and len(_states) >= _MAX_STATES:
+        now = time.monotonic()
+        for eid in [eid for eid, (expires, _) in _states.items() if expires <= now]:
+            del _states[eid]
+    _states[event_id] = (time.monotonic() + EVENT_STATE_TTL_SECONDS, payload)
+
+
+def _broadcast(event_id: int, payload: str) -> None:
+    for queue in _listeners.get(event_id, ()):
+        # клиенту нужно только последнее состояние: непрочитанное заменяем
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(payload)
+
+
+async def _resync() -> None:
+    # слушатель переподключался — переходы за это время могли потеряться
+    for event_id in list(_listeners):
+        try:
+            async with AsyncSessionLocal() as session:
+                state = await load_state(session, event_id)
+        except Exception:
+            logger.exception(f"Event stream: failed to resync event {event_id}")
+            continue
+        if state is None:
+            _states.pop(event_id, None)
+            continue
+        payload = json.dumps(state)
+        _remember(event_id, payload)
+        _broadcast(event_id, payload)
+
+
+def _on_notify(payload: Optional[str]) -> None:
+    global _resync_task
+    if payload is None:
+        _states.clear()
+        if _listeners and (_resync_task is None or _resync_task.done()):
+            _resync_task = asyncio.create_task(_resync())
+        return
+    try:
+        state = json.loads(payload)
+        event_id = int(state["event_id"])
+    except (ValueError, KeyError, TypeError):
+        return
+    if state.get("deleted"):
+        _states.pop(event_id, None)
+    else:
+        _remember(event_id, payload)
+    _broadcast(event_id, payload)
+
+
+pubsub.subscribe(_CHANNEL, _on_notify)
+
+
+async def get_state(event_id: int) -> Optional[str]:
+    """
+    Текущее состояние (JSON) из памяти воркера; в БД идём при первом обращении к событию
+    после старта или переподключения слушателя и раз в EVENT_STATE_TTL_SECONDS.
+    None — события нет.
+    """
+    entry = _states.get(event_id)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+    async with AsyncSessionLocal() as session:
+        state = await load_state(session, event_id)
+    if state is None:
+        _states.pop(event_id, None)
+        return None
+    # пока ждали БД, мог прийти NOTIFY — он новее
+    if _states.get(event_id) is not entry:
+        return _states[event_id][1] if event_id in _states else None
+    payload = json.dumps(state)
+    _remember(event_id, payload)
+    return payload
+
+
+def listen(event_id: int) -> asyncio.Queue:
+    queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+    _listeners.setdefault(event_id, set()).add(queue)
+    return queue
+
+
+def unlisten(event_id: int, queue: asyncio.Queue) -> None:
+    queues = _listeners.get(event_id)
+    if queues is not None:
+        queues.discard(queue)
+        if not queues:
+            del _listeners[event_id]
+
+
+async def stream_states(event_id: int, queue: asyncio.Queue, initial: str) -> AsyncIterator[str]:
+    """
+    SSE-поток: сразу последнее известное состояние, дальше — каждый переход.
+    Простаивающий клиент не стоит ни одного запроса к БД.
+    """
+    try:
+        yield f"event: state\ndata: {initial}\n\n"
+        while True:
+            try:
+                payload = await asyncio.wait_for(queue.get(), EVENT_STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if payload == _deleted_payload(event_id):
+                yield f"event: deleted\ndata: {payload}\n\n"
+                return
+            yield f"event: state\ndata: {payload}\n\n"
+    finally:
+        unlisten(event_id, queue)
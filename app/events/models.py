@@ -1,8 +1,9 @@
 import enum
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
-from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Enum, ForeignKey, Column, Table, Integer
+from sqlalchemy.orm import Mapped, mapped_column, relationship, selectinload
+from sqlalchemy import String, Enum, ForeignKey, Column, Table, Integer, DateTime, func
 
 from app.common.db import Base
 import app.quizes.models
@@ -33,7 +34,7 @@ class Event(Base):
 
     # создатель (как у вас было)
     creator_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id", ondelete="CASCADE"), nullable=False)
-    creator = relationship("User", back_populates="created_events", lazy="selectin")
+    creator = relationship("User", back_populates="created_events", lazy="raise_on_sql")
 
     # ВАЖНО: больше НЕТ 'questions'. Теперь связь с квизами:
     quizes: Mapped[List["Quiz"]] = relationship(
@@ -41,7 +42,7 @@ class Event(Base):
         back_populates="event",
         cascade="all, delete-orphan",
         passive_deletes=True,
-        lazy="selectin",
+        lazy="raise_on_sql",
     )
 
     # игроки (many-to-many) как у вас было  
@@ -49,6 +50,33 @@ class Event(Base):
         "User",
         secondary="event_players",
         back_populates="events",
-        lazy="selectin",
+        passive_deletes=True,
+        lazy="raise_on_sql",
     )
+
+
+class EventTimer(Base):
+    """
+    Серверный таймер события: какой вопрос активного квиза сейчас открыт и до какого
+    момента принимаются ответы. Пока строка есть — планировщик (app/events/timer.py)
+    сам двигает current_question_index по duration_seconds; нет строки — ручной режим.
+    question_id и deadline NULL — вопросы квиза кончились: ответы закрыты, пока таймер
+    не остановят (stop_timer) или не запустят заново.
+    """
+    __tablename__ = "event_timers"
+
+    event_id: Mapped[int] = mapped_column(ForeignKey("events.id", ondelete="CASCADE"), primary_key=True)
+    quiz_id: Mapped[int] = mapped_column(ForeignKey("quizes.id", ondelete="CASCADE"), nullable=False, index=True)
+    question_id: Mapped[Optional[int]] = mapped_column(ForeignKey("quiz_questions.id", ondelete="CASCADE"), nullable=True)
+    question_index: Mapped[int] = mapped_column(Integer, nullable=False)
+    opened_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    deadline: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+# профили загрузки связей (по умолчанию связи не грузятся — см. lazy="raise_on_sql").
+# Функции, а не константы: опции нельзя строить при импорте, пока не сконфигурированы все мапперы.
+
+def event_list_load() -> tuple:
+    """Список событий с квизами (EventOut.quizes)."""
+    return (selectinload(Event.quizes),)
     
\ No newline at end of file
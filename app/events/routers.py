@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends
+import json
 
-from app.events import schemas
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.common.db import get_read_session
+from app.events import live, schemas
 from app.events.services import EventService
 from app.common.common import CurrentUser
-from app.users.models import User
+from app.common.identity import Identity
 
 router = APIRouter(prefix="/events", tags=["events"])
 
@@ -12,7 +17,7 @@ router = APIRouter(prefix="/events", tags=["events"])
 async def create_event(
     name: str,
     service: EventService = Depends(),
-    user: User = Depends(CurrentUser()),
+    user: Identity = Depends(CurrentUser()),
 ):
     return await service.create_event(name=name)
 
@@ -21,7 +26,7 @@ async def create_event(
 async def next_event_phase(
     event_id: int,
     service: EventService = Depends(),
-    user: User = Depends(CurrentUser(require_admin=True)),
+    user: Identity = Depends(CurrentUser(require_admin=True)),
 ):
     event = await service.next_phase(event_id)
     return {
@@ -30,16 +35,65 @@ async def next_event_phase(
     }
 
 
-@router.get("/{event_id}")
-async def get_event_status(event_id: int, service: EventService = Depends()):
-    event = await service.get_event_status(event_id)
+@router.post("/{event_id}/timer/start", summary="Запустить серверный таймер вопросов (только для админов)")
+async def start_event_timer(
+    event_id: int,
+    question_index: int = Query(0, ge=0),
+    service: EventService = Depends(),
+    user: Identity = Depends(CurrentUser(require_admin=True)),
+):
+    event = await service.start_timer(event_id, question_index)
+    return {
+        "game_status": event.status,
+        "current_question_index": event.current_question_index,
+    }
+
+
+@router.post("/{event_id}/timer/stop", summary="Остановить серверный таймер (только для админов)")
+async def stop_event_timer(
+    event_id: int,
+    service: EventService = Depends(),
+    user: Identity = Depends(CurrentUser(require_admin=True)),
+):
+    event = await service.stop_timer(event_id)
     return {
         "game_status": event.status,
         "current_question_index": event.current_question_index,
     }
 
+
+@router.get("/{event_id}")
+async def get_event_status(event_id: int, user: Identity = Depends(CurrentUser())):
+    # из памяти воркера (обновляется через NOTIFY) — опрос не ходит в БД
+    state = await live.get_state(event_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    state = json.loads(state)
+    return {
+        "game_status": state["game_status"],
+        "current_question_index": state["current_question_index"],
+    }
+
+
+@router.get("/{event_id}/stream", summary="Поток состояния события (SSE) вместо опроса GET /events/{event_id}")
+async def stream_event_state(event_id: int, user: Identity = Depends(CurrentUser())):
+    queue = live.listen(event_id)
+    initial = await live.get_state(event_id)
+    if initial is None:
+        live.unlisten(event_id, queue)
+        raise HTTPException(status_code=404, detail="Event not found")
+    return StreamingResponse(
+        live.stream_states(event_id, queue, initial),
+        media_type="text/event-stream",
+        # nginx не должен буферизовать поток
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get("/", response_model=list[schemas.EventOut], summary="Список событий с квизами")
-async def list_events(service: EventService = Depends()):
-    events = await service.list_events()
+async def list_events(
+    session: AsyncSession = Depends(get_read_session),
+    current_user: Identity = Depends(CurrentUser()),
+):
+    events = await EventService(session, current_user).list_events()
     # важный момент — валидируем в схемы (без циклов)
     return [schemas.EventOut.model_validate(e) for e in events]
\ No newline at end of file
@@ -1,23 +1,23 @@
 from fastapi import Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
 
 from app.common.db import get_async_session
 from app.common.common import CurrentUser
-from app.users.models import User
-from app.events.models import Event, EventStatus
+from app.common.identity import Identity
+from app.events.live import publish_state
+from app.events import timer
+from app.events.models import Event, EventStatus, event_list_load
+from app.quizes.models import Quiz
 
 
 class EventService:
-    def __init__(self, session: AsyncSession = Depends(get_async_session), current_user: User = Depends(CurrentUser())):
+    def __init__(self, session: AsyncSession = Depends(get_async_session), current_user: Identity = Depends(CurrentUser())):
         self.session = session
         self.current_user = current_user
 
     async def list_events(self) -> list[Event]:
-        stmt = select(Event).options(
-            selectinload(Event.quizes)
-        ).order_by(Event.id)
+        stmt = select(Event).options(*event_list_load()).order_by(Event.id)
         res = await self.session.execute(stmt)
         return res.scalars().all()
 
@@ -56,23 +56,52 @@ class EventService:
             event.status = EventStatus.STARTED
         elif event.status == EventStatus.STARTED:
             event.status = EventStatus.FINISHED
+            await timer.stop_timer(self.session, event.id)
         else:
             raise HTTPException(status_code=400, detail="Event already finished")
 
+        await publish_state(self.session, event.id)
         await self.session.commit()
         await self.session.refresh(event)
         return event
     
+    async def start_timer(self, event_id: int, question_index: int = 0) -> Event:
+        """
+        Серверный таймер: открыть вопрос question_index активного квиза, дальше вопросы
+        переключаются сами по duration_seconds (app/events/timer.py).
+        """
+        if not self.current_user.is_admin:
+            raise HTTPException(status_code=403, detail="Admin rights required")
+        event = await self.session.get(Event, event_id, with_for_update=True)
+        if not event:
+            raise HTTPException(status_code=404, detail="Event not found")
+        if event.status != EventStatus.STARTED:
+            raise HTTPException(status_code=400, detail="Event is not started")
+        quiz_id = await self.session.scalar(
+            select(Quiz.id).where(Quiz.event_id == event_id, Quiz.is_active.is_(True)).order_by(Quiz.id).limit(1)
+        )
+        if quiz_id is None:
+            raise HTTPException(status_code=400, detail="No active quiz in this event")
+
+        await timer.start_timer(self.session, event, quiz_id, question_index)
+        await self.session.commit()
+        await self.session.refresh(event)
+        return event
+
+    async def stop_timer(self, event_id: int) -> Event:
+        """Остановить таймер — вопросы снова переключает ведущий."""
+        if not self.current_user.is_admin:
+            raise HTTPException(status_code=403, detail="Admin rights required")
+        event = await self.session.get(Event, event_id)
+        if not event:
+            raise HTTPException(status_code=404, detail="Event not found")
+        await timer.stop_timer(self.session, event_id)
+        await self.session.commit()
+        return event
+
     # async def trigger_event(self, event_id: int, status = "STARTED"):
     #     if not self.current_user.is_admin:
     #         raise HTTPException(status_code=403, detail="Admin rights required")
     #     result = await self.session.execute(select(Event).where(Event.id == event_id))
         
         
-
-    async def get_event_status(self, event_id: int) -> Event:
-        result = await self.session.execute(select(Event).where(Event.id == event_id))
-        event = result.scalar_one_or_none()
-        if not event:
-            raise HTTPException(status_code=404, detail="Event not found")
-        return event
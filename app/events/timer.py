@@ -0,0 +1,284 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.common import pubsub
+from app.common.db import AsyncSessionLocal
+from app.common.locks import AdvisoryLocks
+from app.events.live import publish_state
+from app.events.models import Event, EventTimer
+from app.quizes.models import QuizQuestion
+
+logger = logging.getLogger("uvicorn.error")
+
+# как часто планировщик ищет таймеры без владельца (новые и брошенные упавшим воркером)
+EVENT_TIMER_SCAN_SECONDS = float(os.getenv("EVENT_TIMER_SCAN_SECONDS", "5"))
+# длительность вопроса, если duration_seconds не задан
+DEFAULT_QUESTION_SECONDS = int(os.getenv("DEFAULT_QUESTION_SECONDS", "60"))
+# ответ, отправленный перед самым дедлайном, ещё в пути — принимаем с небольшим запасом
+ANSWER_GRACE_SECONDS = float(os.getenv("ANSWER_GRACE_SECONDS", "2"))
+
+_STATE_CHANNEL = "event_state"
+_RECONNECT_SECONDS = 5.0
+
+_wakeup = asyncio.Event()
+# event_id -> сигнал «таймер поменяли» для задачи, которая ведёт это событие
+_nudges: Dict[int, asyncio.Event] = {}
+
+# quiz_id -> (открытый question_id, дедлайн в unix time) — из уведомлений event_state;
+# (None, None) — квиз под таймером закончился, ответы закрыты
+_windows: Dict[int, tuple[Optional[int], Optional[float]]] = {}
+# event_id -> quiz_id его окна (чтобы убрать окно, когда таймер остановили)
+_window_quiz: Dict[int, int] = {}
+_windows_loaded = False
+_reload_task: Optional[asyncio.Task] = None
+
+
+def _lock_name(event_id: int) -> str:
+    return f"event-timer:{event_id}"
+
+
+# ===== окно ответа =====
+
+def _set_window(event_id: int, quiz_id: Optional[int], question_id: Optional[int], deadline: Optional[float]) -> None:
+    old_quiz = _window_quiz.pop(event_id, None)
+    if old_quiz is not None:
+        _windows.pop(old_quiz, None)
+    if quiz_id is not None:
+        _windows[quiz_id] = (question_id, deadline)
+        _window_quiz[event_id] = quiz_id
+
+
+async def _reload_windows() -> None:
+    global _windows_loaded
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(
+            select(EventTimer.event_id, EventTimer.quiz_id, EventTimer.question_id, EventTimer.deadline)
+        )).all()
+    _windows.clear()
+    _window_quiz.clear()
+    for event_id, quiz_id, question_id, deadline in rows:
+        _set_window(event_id, quiz_id, question_id, deadline.timestamp() if deadline is not None else None)
+    _windows_loaded = True
+
+
+def _on_state(payload: Optional[str]) -> None:
+    global _windows_loaded, _reload_task
+    if payload is None:
+        # могли пропустить уведомления — перечитываем все таймеры
+        _windows_loaded = False
+        if _reload_task is None or _reload_task.done():
+            _reload_task = asyncio.create_task(_reload_windows())
+        _wakeup.set()
+        return
+    try:
+        state = json.loads(payload)
+        event_id = int(state["event_id"])
+    except (ValueError, KeyError, TypeError):
+        return
+    deadline = state.get("deadline")
+    _set_window(
+        event_id,
+        state.get("timer_quiz_id"),
+        state.get("question_id"),
+        datetime.fromisoformat(deadline).timestamp() if deadline else None,
+    )
+    # таймер запустили/остановили/продлили: будим планировщик и владельца события
+    _wakeup.set()
+    nudge = _nudges.get(event_id)
+    if nudge is not None:
+        nudge.set()
+
+
+pubsub.subscribe(_STATE_CHANNEL, _on_state)
+
+
+async def answer_window_open(quiz_id: int, question_id: int) -> bool:
+    """
+    Можно ли сейчас ответить на вопрос. Квиз без серверного таймера — всегда можно
+    (ручной режим, как раньше); с таймером — только на открытый вопрос до дедлайна,
+    а после последнего вопроса — никогда, пока таймер не остановят.
+    Проверка по памяти воркера; в БД — только пока окна не загружены после старта.
+    """
+    if _windows_loaded:
+        window = _windows.get(quiz_id)
+    else:
+        async with AsyncSessionLocal() as session:
+            row = (await session.execute(
+                select(EventTimer.question_id, EventTimer.deadline).where(EventTimer.quiz_id == quiz_id)
+            )).first()
+        window = (row[0], row[1].timestamp() if row[1] is not None else None) if row is not None else None
+    if window is None:
+        return True
+    open_question_id, deadline = window
+    if open_question_id is None or deadline is None:
+        return False
+    return open_question_id == question_id and time.time() <= deadline + ANSWER_GRACE_SECONDS
+
+
+# ===== управление таймером (в транзакции вызывающего кода) =====
+
+async def _question_at(session: AsyncSession, quiz_id: int, index: int) -> Optional[tuple[int, int]]:
+    # порядок вопросов — как в выдаче клиенту (по id)
+    row = (await session.execute(
+        select(QuizQuestion.id, QuizQuestion.duration_seconds)
+        .where(QuizQuestion.quiz_id == quiz_id)
+        .order_by(QuizQuestion.id)
+        .offset(index)
+        .limit(1)
+    )).first()
+    if row is None:
+        return None
+    return row[0], row[1] or DEFAULT_QUESTION_SECONDS
+
+
+async def start_timer(session: AsyncSession, event: Event, quiz_id: int, index: int) -> None:
+    """Открыть вопрос index квиза и запустить отсчёт; событие дальше двигает планировщик."""
+    question = await _question_at(session, quiz_id, index)
+    if question is None:
+        raise HTTPException(status_code=400, detail="Question index out of range")
+    question_id, duration = question
+
+    timer = await session.get(EventTimer, event.id, with_for_update=True)
+    if timer is None:
+        timer = EventTimer(event_id=event.id)
+        session.add(timer)
+    timer.quiz_id = quiz_id
+    timer.question_id = question_id
+    timer.question_index = index
+    timer.opened_at = func.now()
+    timer.deadline = func.now() + timedelta(seconds=duration)
+    event.current_question_index = index
+    await publish_state(session, event.id)
+
+
+async def stop_timer(session: AsyncSession, event_id: int, quiz_id: Optional[int] = None) -> bool:
+    """Остановить таймер (вернуть ручной режим). quiz_id — только если таймер этого квиза."""
+    stmt = delete(EventTimer).where(EventTimer.event_id == event_id)
+    if quiz_id is not None:
+        stmt = stmt.where(EventTimer.quiz_id == quiz_id)
+    res = await session.execute(stmt)
+    if not res.rowcount:
+        return False
+    await publish_state(session, event_id)
+    return True
+
+
+# ===== планировщик =====
+
+async def _advance(event_id: int) -> Optional[datetime]:
+    """
+    Дедлайн прошёл — открыть следующий вопрос. Возвращает новый дедлайн или None,
+    если таймер остановлен/квиз закончился.
+    """
+    async with AsyncSessionLocal() as session:
+        timer = await session.get(EventTimer, event_id, with_for_update=True)
+        if timer is None or timer.deadline is None:
+            return None
+        now = await session.scalar(select(func.now()))
+        if timer.deadline > now:
+            # таймер перезапустили/продлили, пока мы спали
+            return timer.deadline
+
+        event = await session.get(Event, event_id)
+        nxt = timer.question_index + 1
+        question = await _question_at(session, timer.quiz_id, nxt)
+        event.current_question_index = nxt
+        if question is None:
+            # вопросы кончились: индекс за последним вопросом, окно ответа закрыто. Строку
+            # не удаляем — без неё квиз вернулся бы в ручной режим и принимал ответы на любой
+            # вопрос; ручной режим — только явным stop_timer
+            timer.question_id = None
+            timer.question_index = nxt
+            timer.deadline = deadline = None
+        else:
+            timer.question_id, duration = question
+            timer.question_index = nxt
+            timer.opened_at = now
+            timer.deadline = deadline = now + timedelta(seconds=duration)
+        await publish_state(session, event_id)
+        await session.commit()
+        return deadline
+
+
+async def _drive(event_id: int) -> None:
+    """Вести одно событие: спать до дедлайна и переключать вопросы, пока таймер есть."""
+    nudge = _nudges.setdefault(event_id, asyncio.Event())
+    try:
+        async with AsyncSessionLocal() as session:
+            deadline = await session.scalar(select(EventTimer.deadline).where(EventTimer.event_id == event_id))
+        while deadline is not None:
+            nudge.clear()
+            delay = (deadline - datetime.now(timezone.utc)).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(nudge.wait(), delay)
+                    # таймер поменяли — перечитываем дедлайн
+                    async with AsyncSessionLocal() as session:
+                        deadline = await session.scalar(select(EventTimer.deadline).where(EventTimer.event_id == event_id))
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+            deadline = await _advance(event_id)
+    finally:
+        _nudges.pop(event_id, None)
+
+
+async def run_event_scheduler() -> None:
+    """
+    Фоновый цикл в каждом воркере. Событие с таймером ведёт ровно один воркер — тот,
+    кто взял его pg_advisory_lock; упал воркер или оборвалось его соединение —
+    блокировку берёт другой при следующем сканировании и продолжает с сохранённого
+    дедлайна (просроченный вопрос переключится сразу).
+    """
+    locks = AdvisoryLocks()
+    drivers: Dict[int, asyncio.Task] = {}
+    while True:
+        try:
+            await locks.connect()
+            while True:
+                _wakeup.clear()
+                async with AsyncSessionLocal() as session:
+                    # закончившиеся таймеры (без дедлайна) вести некому
+                    timed = set((await session.execute(
+                        select(EventTimer.event_id).where(EventTimer.deadline.is_not(None))
+                    )).scalars().all())
+
+                # закончившиеся задачи (таймер снят или ошибка) — отпускаем событие
+                for event_id, task in list(drivers.items()):
+                    if task.done():
+                        del drivers[event_id]
+                        if not task.cancelled() and task.exception() is not None:
+                            logger.error(f"Event timer {event_id} failed: {task.exception()!r}")
+                        await locks.release(_lock_name(event_id))
+
+                for event_id in timed - drivers.keys():
+                    if await locks.try_acquire(_lock_name(event_id)):
+                        logger.info(f"Event timer {event_id}: driving (pid={os.getpid()})")
+                        drivers[event_id] = asyncio.create_task(_drive(event_id))
+
+                await locks.ping()
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), EVENT_TIMER_SCAN_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Event scheduler failed, dropping owned events")
+        finally:
+            # без соединения блокировок больше нет — вести события нельзя
+            for task in drivers.values():
+                task.cancel()
+            await asyncio.gather(*drivers.values(), return_exceptions=True)
+            drivers.clear()
+            await locks.close()
+        await asyncio.sleep(_RECONNECT_SECONDS)
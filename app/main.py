@@ -4,21 +4,37 @@ import os
 import re
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
 from app.common.db import init_models, AsyncSessionLocal
 from app.common.common import init_admin
-from app.common.files import MEDIA_ROOT
+from app.common.files import MEDIA_ROOT, close_storage
+from app.common.locks import run_as_leader
+from app.common.sqlstats import SQLStatsMiddleware
+from app.common.pubsub import run_listener as run_pubsub_listener
 
 # ваши API-роутеры
 from app.users.routers import router as user_router
 from app.users.routers import admin_router as admin_chat_router
 from app.events.routers import router as event_router
 from app.quizes.routers import router as quiz_router
+from app.media.routers import router as media_router
+from app.media.gc import GC_ENABLED, gc_supported, run_gc_worker
+from app.media.images import shutdown_image_pool
+from app.media.mirror import MIRROR_ENABLED, run_mirror_worker
+from app.media.static import MediaFiles
+from app.quizes.batcher import answer_batcher
+from app.quizes.live import live_engine
+from app.events.timer import run_event_scheduler
 
 # Telegram ядро
+from aiogram.exceptions import TelegramNetworkError, TelegramUnauthorizedError
 from telegram.core import bot, dp
-from telegram import moderation  # + если есть другие: auth, debug и т.п.
+from telegram import moderation, quiz_play  # + если есть другие: auth, debug и т.п.
+from telegram.outbox import run_outbox_dispatcher
+from telegram.webhook import (
+    TELEGRAM_MODE, register_webhook, start_webhook_workers, stop_webhook_workers,
+    router as telegram_webhook_router,
+)
 
 app = FastAPI(title="Music Schedule Bot 6")
 
@@ -26,7 +42,7 @@ MEDIA_ROOT.mkdir(parents=True, exist_ok=True)
 
 app.mount(
     "/media",
-    StaticFiles(directory=str(MEDIA_ROOT)),
+    MediaFiles(directory=str(MEDIA_ROOT)),
     name="media",
 )
 
@@ -35,6 +51,8 @@ app.include_router(user_router)
 app.include_router(admin_chat_router)
 app.include_router(event_router)
 app.include_router(quiz_router)
+app.include_router(media_router)
+app.include_router(telegram_webhook_router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -42,13 +60,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+# число/время SQL-запросов на запрос → заголовок Server-Timing
+app.add_middleware(SQLStatsMiddleware)
 
 # регистрируем tg-роутеры в диспетчере
 dp.include_router(moderation.router)
+dp.include_router(quiz_play.router)
 # dp.include_router(auth.router)
 
 bot_task: asyncio.Task | None = None
+# прочие фоновые циклы (зеркало медиа и т.п.) — гасим на shutdown
+background_tasks: list[asyncio.Task] = []
 logger = logging.getLogger("uvicorn.error")
 app_state_started = False  # защита от двойного запуска
 
@@ -64,7 +88,14 @@ async def verify_bot_identity():
         raise RuntimeError("❌ BOT_TOKEN format looks invalid")
 
     # проверка соответствия id в токене и id из getMe()
-    me = await bot.get_me()  # упадёт Unauthorized, если токен неверен
+    try:
+        me = await bot.get_me()
+    except TelegramUnauthorizedError:
+        raise RuntimeError("❌ BOT_TOKEN rejected by Telegram (Unauthorized)")
+    except TelegramNetworkError as e:
+        # Telegram недоступен — это не ошибка конфигурации; формат токена уже проверен
+        logger.warning(f"Bot identity check skipped, Telegram unreachable: {e}")
+        return
     token_bot_id = token.split(":")[0]
     if str(me.id) != token_bot_id:
         raise RuntimeError(
@@ -82,22 +113,54 @@ async def startup_event():
         return
     app_state_started = True
 
-    # жёсткая проверка токена до любых сетапов бота
+    # неверный токен — ошибка конфигурации: воркер не стартует (а не перезапускает лидера вечно)
     await verify_bot_identity()
 
-    # БД/сиды
+    # БД
     await init_models()
-    asyncio.create_task(seed_admins())
 
-    # Запуск бота фоном
+    # LISTEN/NOTIFY между воркерами (сброс кеша identity и т.п.)
+    background_tasks.append(asyncio.create_task(run_pubsub_listener()))
+
+    # фоновое скачивание внешних картинок в локальное хранилище
+    if MIRROR_ENABLED:
+        background_tasks.append(asyncio.create_task(run_mirror_worker()))
+    # уборка файлов без ссылок в media/ — ведёт один воркер, курсор прохода в БД
+    if GC_ENABLED and not gc_supported():
+        logger.warning("MEDIA_GC_ENABLED is ignored: the sweep only walks local MEDIA_ROOT (MEDIA_STORAGE=local)")
+    elif GC_ENABLED:
+        background_tasks.append(asyncio.create_task(run_as_leader("media-gc", run_gc_worker)))
+    # серверные таймеры вопросов: каждое событие ведёт один воркер (по pg_advisory_lock)
+    background_tasks.append(asyncio.create_task(run_event_scheduler()))
+    # пакетная запись ответов из игры в чате бота
+    background_tasks.append(asyncio.create_task(answer_batcher.run()))
+    # живые сессии активных квизов: каждую ведёт один воркер, ответы — в памяти
+    background_tasks.append(asyncio.create_task(live_engine.run()))
+    # уведомления админам из outbox — отправляет один воркер
+    background_tasks.append(asyncio.create_task(run_as_leader("telegram-outbox", run_outbox_dispatcher)))
+
+    # webhook: апдейты принимает любой воркер, обработчики очереди — в каждом
+    if TELEGRAM_MODE == "webhook":
+        start_webhook_workers()
+
+    # Бот — только в одном воркере (лидер по pg_advisory_lock), остальные обслуживают только HTTP.
+    # Лидер умер — блокировку забирает другой воркер и поднимает polling у себя.
     async def run_bot():
         try:
+            await seed_admins()
+
+            if TELEGRAM_MODE == "webhook":
+                # лидер только регистрирует webhook и держит лидерство (повторно не регистрируем)
+                await register_webhook()
+                await asyncio.Event().wait()
+
             me = await bot.get_me()
             logger.info(f"🤖 Bot: @{me.username} (id={me.id}) starting…")
-            # сброс вебхука, чтобы исключить 409 и висящие апдейты
+            # снимаем webhook (polling с ним не работает); накопившиеся апдейты не выбрасываем —
+            # иначе теряются нажатия модерации, сделанные во время деплоя
             info = await bot.get_webhook_info()
             logger.info(f"Webhook before delete: url={info.url!r}, pending={info.pending_update_count}")
-            await bot.delete_webhook(drop_pending_updates=True)
+            await bot.delete_webhook(drop_pending_updates=False)
 
             used = dp.resolve_used_update_types()
             logger.info(f"ALLOWED_UPDATES = {used}")
@@ -106,10 +169,12 @@ async def startup_event():
             logger.info("Bot polling cancelled (shutdown).")
             raise
         except Exception as e:
+            # run_as_leader отпустит блокировку и через паузу выберет лидера заново
             logger.exception(f"Bot crashed: {e}")
+            raise
 
     if not bot_task or bot_task.done():
-        bot_task = asyncio.create_task(run_bot())
+        bot_task = asyncio.create_task(run_as_leader("telegram-bot-poller", run_bot))
 
 
 @app.on_event("shutdown")
@@ -124,6 +189,20 @@ async def shutdown_event():
         except asyncio.CancelledError:
             pass
 
+    # дорабатываем уже принятые webhook-апдейты
+    if TELEGRAM_MODE == "webhook":
+        await stop_webhook_workers()
+
+    # фоновые циклы
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
+    # пул процессов для ресайза картинок и HTTP-сеанс хранилища
+    shutdown_image_pool()
+    await close_storage()
+
     # закрываем сессию aiogram
     try:
         await bot.session.close()
@@ -0,0 +1,362 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlparse
+
+from fastapi import HTTPException
+from sqlalchemy import literal, or_, select, delete, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.common.db import AsyncSessionLocal
+from app.common.files import MEDIA_ROOT, MEDIA_STORAGE, MEDIA_URL, parse_cas_url
+from app.media.models import ExternalMedia, MediaBlob, MediaGcState
+from app.media.services import lock_blobs
+from app.quizes.models import QuizQuestion
+
+logger = logging.getLogger("uvicorn.error")
+
+# фоновая уборка файлов в MEDIA_ROOT, на которые больше никто не ссылается (по умолчанию выключена)
+GC_ENABLED = os.getenv("MEDIA_GC_ENABLED", "false").lower() == "true"
+GC_INTERVAL_SECONDS = float(os.getenv("MEDIA_GC_INTERVAL_SECONDS", "3600"))
+GC_BATCH = int(os.getenv("MEDIA_GC_BATCH", "500"))
+# файлы моложе этого не трогаем: загрузка могла ещё не закоммитить ссылку на себя
+GC_GRACE_SECONDS = float(os.getenv("MEDIA_GC_GRACE_SECONDS", str(24 * 3600)))
+
+# пауза между пачками одного прохода — не грузим диск и БД подряд
+_BATCH_PAUSE = 1.0
+# pg_try_advisory_xact_lock: пачку удаляет только один воркер uvicorn
+_LOCK_KEY = 0x6D6564_6763
+_REPORT_SAMPLE = 200
+# строка media_gc_state с курсором фонового прохода
+_STATE_NAME = "sweep"
+# сколько кандидатов в сироты перепроверять одним запросом
+_RECHECK_CHUNK = 100
+_PRECOMPRESSED = (".br", ".gz")
+# каталоги CAS/производных не удаляем даже пустыми — store_stream/ensure_variant пишут в них без блокировок
+_SHARED_DIRS = ("cas", "variants")
+
+
+class _Busy(Exception):
+    """Пачку уже обрабатывает другой воркер."""
+
+
+def gc_supported() -> bool:
+    """
+    Проход умеет только локальный MEDIA_ROOT. В S3 лежат CAS и прямые загрузки, которых он
+    не видит, а их URL не попадают в индекс — локальные производные сочлись бы сиротами.
+    Уборку бакета там ведут правилами жизненного цикла хранилища.
+    """
+    return MEDIA_STORAGE == "local"
+
+
+class _MediaIndex:
+    """
+    Все пути внутри MEDIA_ROOT, на которые есть ссылки в БД, и sha256 файлов CAS.
+    Строится один раз на проход; к поздним пачкам он устаревает, поэтому найденных
+    по нему сирот перед удалением перепроверяем в БД (_recheck).
+    """
+
+    def __init__(self):
+        self.paths: set[str] = set()
+        self.shas: set[str] = set()
+
+    def add(self, url: Optional[str]) -> None:
+        if not url:
+            return
+        try:
+            path = urlparse(url).path.lstrip("/")
+        except Exception:
+            return
+        prefix = MEDIA_URL.strip("/") + "/"
+        if not path.startswith(prefix):
+            return
+        self.paths.add(path[len(prefix):])
+        key = parse_cas_url(url)
+        if key:
+            self.shas.add(key[0])
+
+    def is_orphan(self, parts: tuple[str, ...]) -> bool:
+        if parts[0] == "cas":
+            if len(parts) > 1 and parts[1] == ".tmp":
+                # недописанные загрузки
+                return True
+            return parts[-1].split(".", 1)[0] not in self.shas
+        if parts[0] == "variants":
+            return parts[-1].split(".", 1)[0] not in self.shas
+        rel = "/".join(parts)
+        for suffix in _PRECOMPRESSED:
+            if rel.endswith(suffix) and rel[: -len(suffix)] in self.paths:
+                return False
+        return rel not in self.paths
+
+
+async def _load_index(session: AsyncSession) -> _MediaIndex:
+    index = _MediaIndex()
+    rows = await session.stream_scalars(
+        select(QuizQuestion.images_urls).execution_options(yield_per=1000)
+    )
+    async for urls in rows:
+        for url in urls or []:
+            index.add(url)
+    # локальные копии внешних картинок: в images_urls лежит исходный URL
+    res = await session.scalars(select(ExternalMedia.local_url).where(ExternalMedia.local_url.is_not(None)))
+    for url in res:
+        index.add(url)
+    return index
+
+
+def _needle(parts: tuple[str, ...]) -> Optional[str]:
+    """Подстрока, которая есть в любом URL, ссылающемся на этот файл; None — ссылок быть не может."""
+    if parts[0] in _SHARED_DIRS:
+        if parts[0] == "cas" and len(parts) > 1 and parts[1] == ".tmp":
+            return None
+        return parts[-1].split(".", 1)[0]
+    rel = "/".join(parts)
+    for suffix in _PRECOMPRESSED:
+        if rel.endswith(suffix):
+            return rel[: -len(suffix)]
+    return rel
+
+
+async def _recheck(session: AsyncSession, orphans: list[tuple[str, ...]]) -> list[tuple[str, ...]]:
+    """
+    Оставить из кандидатов только тех, на кого в БД и сейчас нет ссылок. Читаются лишь
+    строки, где встречается имя кандидата, — а не все images_urls, как при построении индекса.
+    """
+    needles = sorted({n for n in map(_needle, orphans) if n})
+    fresh = _MediaIndex()
+    for i in range(0, len(needles), _RECHECK_CHUNK):
+        chunk = needles[i:i + _RECHECK_CHUNK]
+        url = func.json_array_elements_text(QuizQuestion.images_urls).column_valued("url")
+        hit = select(literal(1)).where(or_(*(url.contains(n, autoescape=True) for n in chunk))).exists()
+        for urls in await session.scalars(select(QuizQuestion.images_urls).where(hit)):
+            for u in urls or []:
+                fresh.add(u)
+        res = await session.scalars(
+            select(ExternalMedia.local_url)
+            .where(or_(*(ExternalMedia.local_url.contains(n, autoescape=True) for n in chunk)))
+        )
+        for u in res:
+            fresh.add(u)
+    return [p for p in orphans if fresh.is_orphan(p)]
+
+
+def _scan_batch(root: Path, after: tuple[str, ...], limit: int) -> list[tuple[tuple[str, ...], int, float]]:
+    """
+    Следующие limit файлов после курсора after в порядке обхода (каталоги по имени, в глубину).
+    Поддеревья целиком до курсора пропускаются без чтения. Выполняется в потоке.
+    """
+    out: list[tuple[tuple[str, ...], int, float]] = []
+
+    def walk(directory: str, prefix: tuple[str, ...]) -> bool:
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except FileNotFoundError:
+            return True
+        for entry in entries:
+            parts = prefix + (entry.name,)
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if parts < after[: len(parts)]:
+                        continue
+                    if not walk(entry.path, parts):
+                        return False
+                elif entry.is_file(follow_symlinks=False):
+                    if parts <= after:
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                    out.append((parts, st.st_size, st.st_mtime))
+                    if len(out) >= limit:
+                        return False
+            except FileNotFoundError:
+                # файл удалили, пока мы шли по каталогу
+                continue
+        return True
+
+    walk(str(root), ())
+    return out
+
+
+def _remove_files(items: list[tuple[str, ...]]) -> int:
+    removed = 0
+    for parts in items:
+        path = MEDIA_ROOT.joinpath(*parts)
+        try:
+            path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+        if parts[0] in _SHARED_DIRS:
+            continue
+        # пустые папки удалённых вопросов/квизов
+        parent = path.parent
+        while parent != MEDIA_ROOT:
+            try:
+                parent.rmdir()
+            except OSError:
+                break
+            parent = parent.parent
+    return removed
+
+
+def _new_report(dry_run: bool) -> dict:
+    return {
+        "dry_run": dry_run,
+        "scanned": 0,
+        "orphans": 0,
+        "orphan_bytes": 0,
+        "deleted": 0,
+        "skipped_recent": 0,
+        "complete": False,
+        "sample": [],
+    }
+
+
+async def _build_index() -> _MediaIndex:
+    async with AsyncSessionLocal() as session:
+        return await _load_index(session)
+
+
+async def _sweep_batch(
+    cursor: tuple[str, ...], index: _MediaIndex, *, dry_run: bool, report: dict,
+) -> Optional[tuple[str, ...]]:
+    """
+    Одна пачка: прочитать следующие GC_BATCH файлов, сверить с индексом прохода, перепроверить
+    сирот в БД и удалить тех, что старше grace-периода. Возвращает новый курсор или None,
+    если проход закончен.
+    """
+    entries = await asyncio.to_thread(_scan_batch, MEDIA_ROOT, cursor, GC_BATCH)
+    if not entries:
+        return None
+
+    async with AsyncSessionLocal() as session:
+        if not dry_run:
+            locked = await session.scalar(select(func.pg_try_advisory_xact_lock(_LOCK_KEY)))
+            if not locked:
+                raise _Busy()
+
+        deadline = time.time() - GC_GRACE_SECONDS
+        candidates: dict[tuple[str, ...], int] = {}
+        for parts, size, mtime in entries:
+            report["scanned"] += 1
+            if not index.is_orphan(parts):
+                continue
+            if mtime > deadline:
+                report["skipped_recent"] += 1
+                continue
+            candidates[parts] = size
+        orphans = await _recheck(session, list(candidates)) if candidates else []
+        for parts in orphans:
+            report["orphans"] += 1
+            report["orphan_bytes"] += candidates[parts]
+            if len(report["sample"]) < _REPORT_SAMPLE:
+                report["sample"].append("/".join(parts))
+
+        if orphans and not dry_run:
+            # блобы CAS — под блокировкой их строк (как в unlink_media): закреплённые свежей
+            # загрузкой (pin_blob) не трогаем, её ссылка ещё не видна в индексе
+            blobs = {}
+            for p in orphans:
+                if p[0] == "cas" and len(p) == 3 and "." in p[-1]:
+                    sha, ext = p[-1].split(".", 1)
+                    blobs[sha] = f".{ext}"
+            state = await lock_blobs(session, blobs)
+            now = datetime.now(timezone.utc)
+            pinned = {sha for sha, (_, pinned_until) in state.items() if pinned_until is not None and pinned_until > now}
+            if pinned:
+                orphans = [p for p in orphans if not (p[0] == "cas" and p[-1].split(".", 1)[0] in pinned)]
+            # счётчики ссылок для стёртых блобов больше не нужны (в т.ч. «утёкшие» после сбоев)
+            gone = set(blobs) - pinned
+            if gone:
+                await session.execute(delete(MediaBlob).where(MediaBlob.sha256.in_(gone)))
+            report["deleted"] += await asyncio.to_thread(_remove_files, orphans)
+            await session.commit()
+
+    return entries[-1][0]
+
+
+async def collect_garbage(*, dry_run: bool = True, max_batches: Optional[int] = None) -> dict:
+    """
+    Проход по MEDIA_ROOT с начала (админский эндпоинт). dry_run — только отчёт, ничего не удаляется.
+    max_batches ограничивает размер прохода; complete=False значит, что дошли не до конца.
+    """
+    if not gc_supported():
+        raise HTTPException(status_code=501, detail=f"Media GC is not supported for '{MEDIA_STORAGE}' storage")
+    report = _new_report(dry_run)
+    cursor: tuple[str, ...] = ()
+    index = await _build_index()
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        try:
+            cursor = await _sweep_batch(cursor, index, dry_run=dry_run, report=report)
+        except _Busy:
+            raise HTTPException(status_code=409, detail="Media GC is already running")
+        batches += 1
+        if cursor is None:
+            report["complete"] = True
+            break
+    return report
+
+
+async def _load_cursor() -> tuple[str, ...]:
+    async with AsyncSessionLocal() as session:
+        cursor = await session.scalar(select(MediaGcState.cursor).where(MediaGcState.name == _STATE_NAME))
+    return tuple(cursor or ())
+
+
+async def _save_cursor(cursor: tuple[str, ...]) -> None:
+    async with AsyncSessionLocal() as session:
+        stmt = insert(MediaGcState).values(name=_STATE_NAME, cursor=list(cursor))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[MediaGcState.name],
+            set_={"cursor": stmt.excluded.cursor, "updated_at": func.now()},
+        )
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def run_gc_worker() -> None:
+    """
+    Фоновый цикл (запускается через run_as_leader — один на все процессы): идёт по MEDIA_ROOT
+    пачками по GC_BATCH файлов, сохраняя курсор в БД после каждой — после рестарта или смены
+    лидера проход продолжается с того же места. Индекс ссылок строится раз на проход.
+    Между проходами ждёт GC_INTERVAL_SECONDS.
+    """
+    cursor = await _load_cursor()
+    index: Optional[_MediaIndex] = None
+    report = _new_report(False)
+    while True:
+        try:
+            if index is None:
+                index = await _build_index()
+            next_cursor = await _sweep_batch(cursor, index, dry_run=False, report=report)
+        except asyncio.CancelledError:
+            raise
+        except _Busy:
+            await asyncio.sleep(GC_INTERVAL_SECONDS)
+            continue
+        except Exception:
+            logger.exception("Media GC: batch failed")
+            await asyncio.sleep(GC_INTERVAL_SECONDS)
+            continue
+
+        if next_cursor is None:
+            if report["orphans"]:
+                logger.info(
+                    f"Media GC: scanned={report['scanned']} deleted={report['deleted']} "
+                    f"bytes={report['orphan_bytes']} skipped_recent={report['skipped_recent']}"
+                )
+            cursor, index, report = (), None, _new_report(False)
+            await _save_cursor(cursor)
+            await asyncio.sleep(GC_INTERVAL_SECONDS)
+            continue
+
+        cursor = next_cursor
+        await _save_cursor(cursor)
+        await asyncio.sleep(_BATCH_PAUSE)
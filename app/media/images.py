@@ -0,0 +1,150 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.common.files import MEDIA_ROOT, MEDIA_STORAGE, MEDIA_URL, CAS_DIR, parse_cas_url
+
+# ширины «корзин», под которые режем картинки; клиент просит ближайшую не меньше нужной
+VARIANT_WIDTHS = (320, 640, 1280)
+# формат производной -> (формат Pillow, параметры сохранения)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+DEFAULT_VARIANT_FORMAT = "webp"
+# media/variants/<width>/<sha[:2]>/<sha>.<fmt>
+VARIANTS_DIR = MEDIA_ROOT / "variants"
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+# защита от параллельной генерации одной и той же производной в этом воркере
+_inflight: Dict[Path, asyncio.Future] = {}
+
+
+def variant_path(sha256: str, width: int, fmt: str) -> Path:
+    return VARIANTS_DIR / str(width) / sha256[:2] / f"{sha256}.{fmt}"
+
+
+def _cas_sha(url: str) -> Optional[str]:
+    # производные режутся из локального CAS; в S3 исходников на диске нет — отдаём оригинал
+    if MEDIA_STORAGE != "local":
+        return None
+    key = parse_cas_url(url)
+    return key[0] if key else None
+
+
+def variant_url(url: str, width: int, fmt: str = DEFAULT_VARIANT_FORMAT) -> Optional[str]:
+    """
+    URL производной для картинки из CAS; для внешних/старых URL — None.
+    Сам файл появится при первом запросе (см. ensure_variant).
+    """
+    sha = _cas_sha(url)
+    if not sha:
+        return None
+    return f"{MEDIA_URL}/variants/{width}/{sha[:2]}/{sha}.{fmt}"
+
+
+def variants_for(url: str) -> Dict[str, str]:
+    """
+    {"320": url, "640": url, "1280": url} для картинки из CAS, иначе {}.
+    """
+    out: Dict[str, str] = {}
+    for w in VARIANT_WIDTHS:
+        v = variant_url(url, w)
+        if v:
+            out[str(w)] = v
+    return out
+
+
+def pick_variant(url: str, width: Optional[int], fmt: str = DEFAULT_VARIANT_FORMAT) -> str:
+    """
+    Подобрать производную под запрошенную ширину: ближайшая корзина не меньше width,
+    иначе самая большая. Если width не задан или картинка не из CAS — исходный URL.
+    """
+    if not width:
+        return url
+    bucket = next((w for w in VARIANT_WIDTHS if w >= width), VARIANT_WIDTHS[-1])
+    return variant_url(url, bucket, fmt) or url
+
+
+def _render_variant(src: str, dst: str, width: int, fmt: str) -> None:
+    """
+    Выполняется в процессе пула: ресайз по ширине (без увеличения) и запись во временный
+    файл с атомарным переименованием — параллельные воркеры не увидят недописанный файл.
+    """
+    from PIL import Image, ImageOps
+
+    pil_format, save_kwargs = VARIANT_FORMATS[fmt]
+    with Image.open(src) as im:
+        im = ImageOps.exif_transpose(im)
+        if im.width > width:
+            height = max(1, round(im.height * width / im.width))
+            im = im.resize((width, height), Image.LANCZOS)
+        if pil_format == "JPEG" and im.mode not in ("RGB", "L"):
+            im = im.convert("RGB")
+        elif im.mode not in ("RGB", "RGBA", "L", "LA"):
+            im = im.convert("RGBA")
+
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = f"{dst}.{os.getpid()}.part"
+        im.save(tmp, format=pil_format, **save_kwargs)
+    os.replace(tmp, dst)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: не форкаем процесс с запущенным event loop и потоками
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_image_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _find_source(sha256: str) -> Optional[Path]:
+    folder = CAS_DIR / sha256[:2]
+    for p in folder.glob(f"{sha256}.*"):
+        if p.is_file():
+            return p
+    return None
+
+
+async def ensure_variant(sha256: str, width: int, fmt: str) -> Path:
+    """
+    Вернуть путь производной, сгенерировав её в пуле процессов при первом запросе.
+    Готовые файлы кешируются на диске и дальше отдаются как есть.
+    FileNotFoundError — если исходника нет в CAS.
+    """
+    dst = variant_path(sha256, width, fmt)
+    if dst.is_file():
+        return dst
+
+    pending = _inflight.get(dst)
+    if pending is not None:
+        await asyncio.shield(pending)
+        return dst
+
+    src = await asyncio.to_thread(_find_source, sha256)
+    if src is None:
+        raise FileNotFoundError(sha256)
+
+    loop = asyncio.get_running_loop()
+    fut = loop.run_in_executor(_get_pool(), _render_variant, str(src), str(dst), width, fmt)
+    _inflight[dst] = fut
+    try:
+        await asyncio.shield(fut)
+    finally:
+        if fut.done():
+            _inflight.pop(dst, None)
+        else:
+            fut.add_done_callback(lambda _: _inflight.pop(dst, None))
+    return dst
@@ -0,0 +1,292 @@
+import asyncio
+import ipaddress
+import logging
+import os
+import socket
+from datetime import timedelta
+from typing import Iterable
+from urllib.parse import urljoin, urlparse
+
+import aiohttp
+from fastapi import HTTPException
+from sqlalchemy import select, update, or_, and_, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.common.db import AsyncSessionLocal
+from app.common.files import UPLOAD_CHUNK_SIZE, get_storage, parse_cas_url, store_stream
+from app.media.models import ExternalMedia, MirrorStatus
+from app.media.services import retain_media
+from app.quizes.media import MAX_BYTES
+
+logger = logging.getLogger("uvicorn.error")
+
+# фоновое зеркалирование внешних картинок в локальный CAS (по умолчанию выключено)
+MIRROR_ENABLED = os.getenv("MEDIA_MIRROR_ENABLED", "false").lower() == "true"
+MIRROR_CONCURRENCY = int(os.getenv("MEDIA_MIRROR_CONCURRENCY", "4"))
+MIRROR_PER_HOST = int(os.getenv("MEDIA_MIRROR_PER_HOST", "2"))
+MIRROR_MAX_ATTEMPTS = int(os.getenv("MEDIA_MIRROR_MAX_ATTEMPTS", "5"))
+MIRROR_TIMEOUT = float(os.getenv("MEDIA_MIRROR_TIMEOUT", "30"))
+MIRROR_POLL_SECONDS = float(os.getenv("MEDIA_MIRROR_POLL_SECONDS", "30"))
+
+# быстрые повторы внутри одной попытки (сетевые ошибки, 429, 5xx)
+_QUICK_RETRIES = 3
+# запись в статусе fetching дольше этого — воркер умер посреди скачивания, берём заново
+_STALE_FETCH = timedelta(minutes=5)
+# редиректы проходим вручную: каждый адрес заново проверяется на публичность
+_MAX_REDIRECTS = 5
+_REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+_wakeup = asyncio.Event()
+
+
+class _PermanentError(Exception):
+    """Повторять бессмысленно: 404, не картинка, слишком большой файл."""
+
+
+class _RetryableError(Exception):
+    pass
+
+
+def _is_public_ip(addr: str) -> bool:
+    """
+    Только глобальные unicast-адреса: никаких private/loopback/link-local (169.254.169.254 —
+    метаданные облака), CGNAT и зарезервированных диапазонов.
+    """
+    try:
+        ip = ipaddress.ip_address(addr.split("%", 1)[0])
+    except ValueError:
+        return False
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def _host_allowed(host: str) -> bool:
+    """Быстрая проверка без DNS: IP-литералы и localhost. Имена проверяет _check_public."""
+    host = host.lower().rstrip(".")
+    if host == "localhost" or host.endswith(".localhost"):
+        return False
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return True
+    return _is_public_ip(host)
+
+
+def is_external(url: str) -> bool:
+    try:
+        p = urlparse(url)
+        host = p.hostname
+    except Exception:
+        return False
+    return (
+        p.scheme in ("http", "https")
+        and bool(host)
+        and _host_allowed(host)
+        and parse_cas_url(url) is None
+        # прямые загрузки уже лежат в нашем хранилище
+        and get_storage().key_for_url(url) is None
+    )
+
+
+async def _check_public(url: str) -> None:
+    """
+    Перед каждым запросом (и каждым редиректом): хост должен резолвиться только в публичные
+    адреса — иначе через зеркалирование можно достучаться до внутренних сервисов (SSRF).
+    """
+    try:
+        p = urlparse(url)
+        host, port = p.hostname, p.port
+    except ValueError:
+        raise _PermanentError(f"Invalid URL: {url}")
+    if p.scheme not in ("http", "https") or not host or not _host_allowed(host):
+        raise _PermanentError(f"URL not allowed: {url}")
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            host, port or (443 if p.scheme == "https" else 80), type=socket.SOCK_STREAM
+        )
+    except socket.gaierror as e:
+        raise _RetryableError(f"DNS error for {host}: {e}")
+    if not infos or not all(_is_public_ip(info[4][0]) for info in infos):
+        raise _PermanentError(f"Non-public address: {host}")
+
+
+class _PublicResolver(aiohttp.ThreadedResolver):
+    """
+    Резолвер пула соединений: повторная проверка в момент connect — DNS мог смениться
+    после _check_public (DNS rebinding).
+    """
+
+    async def resolve(self, host, *args, **kwargs):
+        hosts = await super().resolve(host, *args, **kwargs)
+        if not hosts or not all(_is_public_ip(h["host"]) for h in hosts):
+            raise OSError(f"Non-public address: {host}")
+        return hosts
+
+
+async def enqueue_external(session: AsyncSession, urls: Iterable[str]) -> None:
+    """
+    Поставить внешние URL в очередь на зеркалирование (в транзакции вызывающего кода).
+    После коммита стоит дёрнуть wake_mirror(), чтобы не ждать очередного опроса.
+    """
+    if not MIRROR_ENABLED:
+        return
+    external = [u for u in dict.fromkeys(urls) if is_external(u)]
+    if not external:
+        return
+    await session.execute(
+        insert(ExternalMedia)
+        .values([{"source_url": u} for u in external])
+        .on_conflict_do_nothing(index_elements=[ExternalMedia.source_url])
+    )
+
+
+def wake_mirror() -> None:
+    if MIRROR_ENABLED:
+        _wakeup.set()
+
+
+async def mirrored_urls(session: AsyncSession, urls: Iterable[str]) -> dict[str, str]:
+    """
+    {внешний URL: локальный URL} для уже скачанных картинок — одним запросом.
+    """
+    if not MIRROR_ENABLED:
+        return {}
+    external = [u for u in set(urls) if is_external(u)]
+    if not external:
+        return {}
+    res = await session.execute(
+        select(ExternalMedia.source_url, ExternalMedia.local_url).where(
+            ExternalMedia.source_url.in_(external),
+            ExternalMedia.status == MirrorStatus.done.value,
+        )
+    )
+    return {src: local for src, local in res.all() if local}
+
+
+async def _claim(limit: int) -> list:
+    """
+    Забрать пачку URL на скачивание. SKIP LOCKED — несколько воркеров uvicorn
+    не скачивают одно и то же.
+    """
+    async with AsyncSessionLocal() as session:
+        due = (
+            select(ExternalMedia.id)
+            .where(or_(
+                and_(ExternalMedia.status == MirrorStatus.pending.value, ExternalMedia.next_attempt_at <= func.now()),
+                and_(ExternalMedia.status == MirrorStatus.fetching.value, ExternalMedia.updated_at < func.now() - _STALE_FETCH),
+            ))
+            .order_by(ExternalMedia.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        res = await session.execute(
+            update(ExternalMedia)
+            .where(ExternalMedia.id.in_(due.scalar_subquery()))
+            .values(status=MirrorStatus.fetching.value, attempts=ExternalMedia.attempts + 1)
+            .returning(ExternalMedia.id, ExternalMedia.source_url, ExternalMedia.attempts)
+        )
+        rows = res.all()
+        await session.commit()
+        return rows
+
+
+async def _download(http: aiohttp.ClientSession, url: str):
+    source = url
+    for _ in range(_MAX_REDIRECTS + 1):
+        await _check_public(url)
+        async with http.get(url, allow_redirects=False) as resp:
+            if resp.status in _REDIRECT_STATUSES:
+                location = resp.headers.get("Location")
+                if not location:
+                    raise _PermanentError(f"HTTP {resp.status} without Location")
+                url = urljoin(url, location)
+                continue
+            if resp.status == 429 or resp.status >= 500:
+                raise _RetryableError(f"HTTP {resp.status}")
+            if resp.status >= 400:
+                raise _PermanentError(f"HTTP {resp.status}")
+            if resp.content_length is not None and resp.content_length > MAX_BYTES:
+                raise _PermanentError(f"Too large: {resp.content_length} bytes")
+            try:
+                return await store_stream(resp.content.iter_chunked(UPLOAD_CHUNK_SIZE), label=source)
+            except HTTPException as e:
+                # 413/415 из пайплайна
+                raise _PermanentError(str(e.detail))
+    raise _PermanentError(f"Too many redirects (> {_MAX_REDIRECTS})")
+
+
+async def _process(http: aiohttp.ClientSession, row_id: int, url: str, attempts: int) -> None:
+    error: str | None = None
+    permanent = False
+    stored = None
+    for i in range(_QUICK_RETRIES):
+        try:
+            stored = await _download(http, url)
+            break
+        except _PermanentError as e:
+            error, permanent = str(e), True
+            break
+        except (_RetryableError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = str(e) or e.__class__.__name__
+            await asyncio.sleep(0.5 * 2 ** i)
+
+    async with AsyncSessionLocal() as session:
+        if stored is not None:
+            local_url = stored.url
+            await retain_media(session, [local_url])
+            values = {"status": MirrorStatus.done.value, "local_url": local_url, "last_error": None}
+        elif permanent or attempts >= MIRROR_MAX_ATTEMPTS:
+            values = {"status": MirrorStatus.failed.value, "last_error": error}
+        else:
+            # экспоненциальная пауза между попытками: 2, 4, 8... минут
+            values = {
+                "status": MirrorStatus.pending.value,
+                "last_error": error,
+                "next_attempt_at": func.now() + timedelta(minutes=2 ** attempts),
+            }
+        await session.execute(update(ExternalMedia).where(ExternalMedia.id == row_id).values(**values))
+        await session.commit()
+
+    if stored is None:
+        logger.warning(f"Media mirror failed for {url!r} (attempt {attempts}): {error}")
+
+
+async def run_mirror_worker() -> None:
+    """
+    Фоновый цикл: забирает пачки внешних URL и скачивает их с ограниченной параллельностью
+    через один пул соединений. Между пачками ждёт wake_mirror() или MIRROR_POLL_SECONDS.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=MIRROR_CONCURRENCY,
+        limit_per_host=MIRROR_PER_HOST,
+        ttl_dns_cache=300,
+        resolver=_PublicResolver(),
+    )
+    timeout = aiohttp.ClientTimeout(total=MIRROR_TIMEOUT, sock_connect=10)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+        while True:
+            try:
+                rows = await _claim(MIRROR_CONCURRENCY * 4)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Media mirror: failed to claim batch")
+                rows = []
+
+            if rows:
+                results = await asyncio.gather(
+                    *(_process(http, r.id, r.source_url, r.attempts) for r in rows),
+                    return_exceptions=True,
+                )
+                for r in results:
+                    if isinstance(r, Exception):
+                        logger.error(f"Media mirror: {r!r}")
+                continue
+
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), MIRROR_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,76 @@
+import enum
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import String, Integer, BigInteger, Text, DateTime, JSON, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.common.db import Base
+
+
+class MediaBlob(Base):
+    """
+    Файл в контентно-адресуемом хранилище media/cas/<sha[:2]>/<sha><ext>
+    и число ссылок на него (сколько вопросов держат его URL в images_urls).
+    """
+    __tablename__ = "media_blobs"
+
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    ext: Mapped[str] = mapped_column(String(10), nullable=False)
+    refcount: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # «пин» свежей загрузки: до этого момента блоб не удаляется даже с refcount=0 —
+    # store_stream уже отдал его URL, ссылка на него вот-вот закоммитится (см. pin_blob)
+    pinned_until: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class MediaGcState(Base):
+    """
+    Курсор фоновой уборки media/ (app/media/gc.py): путь последнего проверенного файла.
+    Общий для всех процессов — после рестарта или смены лидера проход продолжается с него.
+    """
+    __tablename__ = "media_gc_state"
+
+    name: Mapped[str] = mapped_column(String(32), primary_key=True)
+    cursor: Mapped[list] = mapped_column(JSON, nullable=False, default=list)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class MirrorStatus(str, enum.Enum):
+    pending = "pending"
+    fetching = "fetching"
+    done = "done"
+    failed = "failed"
+
+
+class ExternalMedia(Base):
+    """
+    Внешняя картинка (images_urls с чужого хоста) и её локальная копия в CAS.
+    Исходный URL в вопросе не меняется — подмена на local_url происходит при выдаче.
+    """
+    __tablename__ = "external_media"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    source_url: Mapped[str] = mapped_column(Text, unique=True, nullable=False)
+    local_url: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    status: Mapped[str] = mapped_column(String(16), default=MirrorStatus.pending.value, nullable=False, index=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class TelegramFile(Base):
+    """
+    file_id, который Telegram выдал после первой загрузки файла ботом: повторные
+    отправки того же содержимого идут по file_id, без загрузки байтов.
+    file_id действителен только для своего бота, поэтому bot_id входит в ключ.
+    """
+    __tablename__ = "telegram_files"
+
+    bot_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    # photo / document: file_id одного вида не подходит для другого метода
+    kind: Mapped[str] = mapped_column(String(16), primary_key=True)
+    file_id: Mapped[str] = mapped_column(String(255), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
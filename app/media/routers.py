@@ -0,0 +1,19 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+
+from app.common.common import CurrentUser
+from app.common.identity import Identity
+from app.media.gc import collect_garbage
+
+# не под /media — этот префикс целиком занят StaticFiles
+router = APIRouter(prefix="/admin/media", tags=["media"])
+
+
+@router.post("/gc", summary="Найти (и удалить) файлы без ссылок из БД (только для админов)")
+async def run_media_gc(
+    dry_run: bool = Query(True, description="Только отчёт, без удаления"),
+    max_batches: Optional[int] = Query(None, ge=1, description="Ограничить проход N пачками"),
+    _: Identity = Depends(CurrentUser(require_admin=True)),
+):
+    return await collect_garbage(dry_run=dry_run, max_batches=max_batches)
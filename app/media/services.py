@@ -0,0 +1,240 @@
+import logging
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Iterable, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import cast, select, update, delete, func
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.common.db import AsyncSessionLocal
+from app.common.files import StoredMedia, cas_key, get_storage, is_upload_key, parse_cas_key, parse_cas_url
+from app.media.models import MediaBlob
+from app.events.models import Event
+from app.quizes.models import Quiz, QuizQuestion
+
+logger = logging.getLogger("uvicorn.error")
+
+# сколько свежая загрузка держит блоб (pin_blob): за это время ссылка на него должна закоммититься
+MEDIA_PIN_SECONDS = int(os.getenv("MEDIA_PIN_SECONDS", "3600"))
+
+
+def _count_cas(urls: Iterable[str]) -> Counter:
+    counts: Counter = Counter()
+    for url in urls:
+        key = parse_cas_url(url)
+        if key:
+            counts[key] += 1
+    return counts
+
+
+async def retain_media(session: AsyncSession, urls: Iterable[str]) -> None:
+    """
+    +1 к счётчику ссылок для каждого CAS-URL (не-CAS URL игнорируются).
+    Выполняется в транзакции вызывающего кода — коммитит он же.
+    """
+    counts = _count_cas(urls)
+    if not counts:
+        return
+    stmt = insert(MediaBlob).values([
+        {"sha256": sha, "ext": ext, "refcount": n} for (sha, ext), n in counts.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MediaBlob.sha256],
+        set_={"refcount": MediaBlob.refcount + stmt.excluded.refcount},
+    )
+    await session.execute(stmt)
+
+
+async def release_media(session: AsyncSession, urls: Iterable[str]) -> list[str]:
+    """
+    -1 к счётчику ссылок для каждого CAS-URL. Возвращает ключи блобов, у которых счётчик
+    дошёл до нуля, — удалить их нужно ПОСЛЕ коммита (см. unlink_media), чтобы откат
+    транзакции не оставил ссылки на стёртые файлы. Строки остаются: unlink_media заново
+    проверит счётчик под их блокировкой.
+    """
+    released: list[str] = []
+    for (sha, ext), n in _count_cas(urls).items():
+        res = await session.execute(
+            update(MediaBlob)
+            .where(MediaBlob.sha256 == sha)
+            .values(refcount=MediaBlob.refcount - n)
+            .returning(MediaBlob.refcount)
+        )
+        left = res.scalar_one_or_none()
+        if left is not None and left <= 0:
+            released.append(cas_key(sha, ext))
+    return released
+
+
+async def lock_blobs(session: AsyncSession, blobs: dict[str, str]) -> dict[str, tuple[int, Optional[datetime]]]:
+    """
+    Заблокировать строки media_blobs ({sha256: ext}) до конца транзакции и вернуть
+    {sha256: (refcount, pinned_until)}. Недостающие строки создаются с refcount=0: строку,
+    которой нет, не заблокировать, и параллельный pin_blob проскочил бы мимо удаления.
+    Порядок (по sha256) одинаков у всех — без взаимных блокировок.
+    """
+    if not blobs:
+        return {}
+    shas = sorted(blobs)
+    await session.execute(
+        insert(MediaBlob)
+        .values([{"sha256": sha, "ext": blobs[sha], "refcount": 0} for sha in shas])
+        .on_conflict_do_nothing(index_elements=[MediaBlob.sha256])
+    )
+    rows = await session.execute(
+        select(MediaBlob.sha256, MediaBlob.refcount, MediaBlob.pinned_until)
+        .where(MediaBlob.sha256.in_(shas))
+        .order_by(MediaBlob.sha256)
+        .with_for_update()
+    )
+    return {sha: (refcount, pinned_until) for sha, refcount, pinned_until in rows.all()}
+
+
+def blob_unused(refcount: int, pinned_until: Optional[datetime], now: datetime) -> bool:
+    return refcount <= 0 and (pinned_until is None or pinned_until <= now)
+
+
+async def pin_blob(sha: str, ext: str, put: Callable[[str], Awaitable[None]]) -> tuple[bool, Optional[datetime]]:
+    """
+    Закрепить блоб за загрузкой (store_stream) и убедиться, что объект есть в хранилище.
+    Загрузка (put — для S3 это сетевой запрос) идёт без блокировок и транзакций; затем
+    короткая транзакция ставит пин под блокировкой строки media_blobs. Удаление (unlink_media,
+    GC) идёт под той же блокировкой и пропускает закреплённые блобы, но могло успеть стереть
+    объект между загрузкой и пином — поэтому после коммита наличие проверяется ещё раз.
+    Объект, загруженный без пина (запрос упал), — сирота: его соберёт GC.
+    Возвращает (создан ли объект, свой пин или None, если блоб держит более поздний чужой пин).
+    """
+    key = cas_key(sha, ext)
+    storage = get_storage()
+
+    async def ensure() -> bool:
+        if await storage.stat(key) is not None:
+            # сборщик мусора (app/media/gc.py) не тронет файл, пока идёт grace-период
+            await storage.touch(key)
+            return False
+        await put(key)
+        return True
+
+    created = await ensure()
+    mine = datetime.now(timezone.utc) + timedelta(seconds=MEDIA_PIN_SECONDS)
+    async with AsyncSessionLocal() as session:
+        stmt = insert(MediaBlob).values(sha256=sha, ext=ext, refcount=0, pinned_until=mine)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[MediaBlob.sha256],
+            set_={"pinned_until": func.greatest(MediaBlob.pinned_until, stmt.excluded.pinned_until)},
+        ).returning(MediaBlob.pinned_until)
+        pinned_until = (await session.execute(stmt)).scalar_one()
+        await session.commit()
+    # пин виден удалению — дальше объект не сотрут; стёрли до пина — кладём заново
+    created = await ensure() or created
+    return created, (mine if pinned_until == mine else None)
+
+
+async def discard_stored(items: Iterable[StoredMedia]) -> int:
+    """
+    Загрузка не удалась: снять её пины и удалить блобы, которые никому не нужны. Пин снимается,
+    только если его не продлила параллельная загрузка того же содержимого (иначе он уже не наш).
+    """
+    items = list(items)
+    mine = [m for m in items if m.pinned_until is not None]
+    if mine:
+        async with AsyncSessionLocal() as session:
+            for m in mine:
+                await session.execute(
+                    update(MediaBlob)
+                    .where(MediaBlob.sha256 == m.sha256, MediaBlob.pinned_until == m.pinned_until)
+                    .values(pinned_until=None)
+                )
+            await session.commit()
+    return await unlink_media(m.key for m in items)
+
+
+def questions_of_creators(telegram_ids: Iterable[int]):
+    """Условие на вопросы событий этих создателей — удалятся каскадом вместе с ними."""
+    return QuizQuestion.quiz_id.in_(
+        select(Quiz.id)
+        .join(Event, Event.id == Quiz.event_id)
+        .where(Event.creator_id.in_(list(telegram_ids)))
+    )
+
+
+async def cascade_media_urls(session: AsyncSession, condition) -> list[str]:
+    """
+    URL картинок вопросов, которые удалятся каскадом (ondelete="CASCADE" от квиза, события или
+    его создателя — мимо delete_question). Собрать ДО удаления, после flush удаления снять
+    ссылки через release_cascade_media.
+    """
+    rows = await session.execute(select(QuizQuestion.images_urls).where(condition))
+    return [url for (urls,) in rows.all() for url in dict.fromkeys(urls or [])]
+
+
+async def release_cascade_media(session: AsyncSession, urls: list[str]) -> list[str]:
+    """
+    Снять ссылки вопросов, удалённых каскадом (urls — из cascade_media_urls). Ключи, которые
+    больше никому не нужны, удалить после коммита (unlink_media).
+    """
+    return await release_media(session, urls) + await release_uploads(session, urls)
+
+
+async def release_uploads(session: AsyncSession, urls: Iterable[str]) -> list[str]:
+    """
+    Ключи прямых загрузок (images:presign) из urls, на которые больше не ссылается ни один
+    вопрос. Вызывать после flush изменений вопросов; удалять — так же после коммита (unlink_media).
+    """
+    storage = get_storage()
+    released: list[str] = []
+    for url in dict.fromkeys(urls):
+        key = storage.key_for_url(url)
+        if not key or not is_upload_key(key):
+            continue
+        used = await session.scalar(
+            select(QuizQuestion.id)
+            .where(cast(QuizQuestion.images_urls, JSONB).contains([url]))
+            .limit(1)
+        )
+        if used is None:
+            released.append(key)
+    return released
+
+
+async def _delete_object(key: str) -> bool:
+    try:
+        await get_storage().delete(key)
+        return True
+    except HTTPException as e:
+        # ссылки уже сняты — откатывать нечего, объект остаётся сиротой в хранилище
+        logger.warning(f"Media: failed to delete {key!r}: {e.detail}")
+        return False
+
+
+async def unlink_media(keys: Iterable[str]) -> int:
+    """
+    Удалить объекты после коммита, снявшего ссылки. Блобы CAS удаляются под блокировкой
+    своих строк и только если счётчик всё ещё 0 и нет живого пина — между коммитом и
+    удалением их мог снова взять параллельный запрос. Прямые загрузки — как есть.
+    """
+    blobs: dict[str, str] = {}
+    deleted = 0
+    for key in dict.fromkeys(keys):
+        parsed = parse_cas_key(key)
+        if parsed is None:
+            deleted += await _delete_object(key)
+        else:
+            blobs[parsed[0]] = parsed[1]
+    if not blobs:
+        return deleted
+
+    async with AsyncSessionLocal() as session:
+        state = await lock_blobs(session, blobs)
+        now = datetime.now(timezone.utc)
+        gone = []
+        for sha, (refcount, pinned_until) in state.items():
+            if blob_unused(refcount, pinned_until, now) and await _delete_object(cas_key(sha, blobs[sha])):
+                gone.append(sha)
+        if gone:
+            await session.execute(delete(MediaBlob).where(MediaBlob.sha256.in_(gone)))
+        await session.commit()
+    return deleted + len(gone)
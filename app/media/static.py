@@ -0,0 +1,113 @@
+import mimetypes
+import os
+import re
+from pathlib import Path
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from app.media.images import VARIANT_FORMATS, VARIANT_WIDTHS, ensure_variant
+
+# файлы в этих подпапках адресуются хешем содержимого: по одному URL всегда одни и те же байты
+IMMUTABLE_DIRS = ("cas", "variants")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# всё остальное (старые A.jpg, B.png, которые перезаписываются на месте) — только с ревалидацией
+MUTABLE_CACHE = "public, no-cache"
+
+# предсжатые копии рядом с оригиналом: file.svg.br / file.svg.gz
+_PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+_SHA_NAME_RE = re.compile(r"^([0-9a-f]{64})\.([a-z0-9]+)$")
+
+
+def _accepted_encodings(headers: Headers) -> set[str]:
+    out = set()
+    for part in headers.get("accept-encoding", "").split(","):
+        enc, _, params = part.strip().partition(";")
+        if enc and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            out.add(enc.lower())
+    return out
+
+
+def _etag(parts: tuple, sha: str, ext: str, encoding: str | None) -> str:
+    """
+    Сильный ETag файла из cas/ или variants/. sha — хеш исходника, а у одной картинки
+    много производных: ширина и формат входят в ETag, иначе кеш отдаст не тот вариант.
+    """
+    etag = sha if parts[0] == "cas" else f"{sha}-{parts[1]}w-{ext}"
+    return etag if encoding is None else f"{etag}-{encoding}"
+
+
+class MediaFiles(StaticFiles):
+    """
+    StaticFiles для /media с правильным кешированием:
+    - variants/<w>/<sha[:2]>/<sha>.<fmt> генерируются при первом запросе (см. app/media/images.py);
+    - cas/ и variants/ отдаются с Cache-Control: immutable и сильным ETag (sha256 исходника,
+      у производных — вместе с шириной и форматом);
+    - остальные файлы — no-cache + ETag, клиент получает 304, если файл не менялся;
+    - если клиент принимает br/gzip и рядом лежит предсжатая копия — отдаём её;
+    - Range и If-None-Match обрабатывает FileResponse/StaticFiles; на серверах с расширением
+      http.response.pathsend (например, granian) FileResponse отдаёт файл без копирования в Python.
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        parts = Path(path).parts
+        if len(parts) == 4 and parts[0] == "variants":
+            await self._ensure_variant(*parts[1:])
+        return await super().get_response(path, scope)
+
+    @staticmethod
+    async def _ensure_variant(width: str, prefix: str, name: str) -> None:
+        m = _SHA_NAME_RE.match(name)
+        if not width.isdigit() or int(width) not in VARIANT_WIDTHS:
+            return
+        if not m or m.group(2) not in VARIANT_FORMATS or m.group(1)[:2] != prefix:
+            return
+        try:
+            await ensure_variant(m.group(1), int(width), m.group(2))
+        except FileNotFoundError:
+            pass  # исходника нет — StaticFiles ответит 404
+
+    def file_response(
+        self,
+        full_path: os.PathLike | str,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        path = Path(full_path)
+        rel = os.path.relpath(full_path, os.path.realpath(self.directory))
+        immutable = Path(rel).parts[0] in IMMUTABLE_DIRS
+
+        media_type = None
+        encoding = None
+        accepted = _accepted_encodings(request_headers)
+        for enc, suffix in _PRECOMPRESSED:
+            if enc not in accepted:
+                continue
+            candidate = path.with_name(path.name + suffix)
+            try:
+                candidate_stat = os.stat(candidate)
+            except OSError:
+                continue
+            media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+            path, stat_result, encoding = candidate, candidate_stat, enc
+            break
+
+        response = FileResponse(path, status_code=status_code, stat_result=stat_result, media_type=media_type)
+
+        m = _SHA_NAME_RE.match(Path(full_path).name)
+        if immutable and m:
+            etag = _etag(Path(rel).parts, m.group(1), m.group(2), encoding)
+            response.headers["etag"] = f'"{etag}"'
+        response.headers["cache-control"] = IMMUTABLE_CACHE if immutable else MUTABLE_CACHE
+        if encoding:
+            response.headers["content-encoding"] = encoding
+        response.headers["vary"] = "Accept-Encoding"
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Sequence
+
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.common import pubsub
+from app.common.db import AsyncSessionLocal
+from app.quizes.models import QuizUserAnswer
+from app.users.models import User
+
+logger = logging.getLogger("uvicorn.error")
+
+# сколько ответов максимум в одной транзакции и сколько ждём, пока пачка наберётся
+ANSWER_BATCH_SIZE = int(os.getenv("ANSWER_BATCH_SIZE", "200"))
+ANSWER_BATCH_WAIT_MS = float(os.getenv("ANSWER_BATCH_WAIT_MS", "100"))
+
+# ответы, записанные мимо живой сессии квиза; payload — "quiz_id:user_id:question_id:points,..."
+LIVE_ANSWERS_CHANNEL = "live_answers"
+# пачка в один NOTIFY (payload pg_notify ограничен 8000 байт)
+_NOTIFY_CHUNK = 200
+
+
+class PendingAnswer(NamedTuple):
+    user_id: int
+    quiz_id: int
+    question_id: int
+    answers: List[str]
+    locale: str
+    points: int  # уже посчитаны score_answer
+
+
+async def publish_answers(session: AsyncSession, answers: Sequence[PendingAnswer]) -> None:
+    """
+    Сообщить владельцу живой сессии квиза (app/quizes/live.py) об ответах, записанных
+    мимо неё (другим воркером), — чтобы его счётчики ответов и очков не отставали.
+    """
+    items = [f"{a.quiz_id}:{a.user_id}:{a.question_id}:{a.points}" for a in answers]
+    for i in range(0, len(items), _NOTIFY_CHUNK):
+        await pubsub.publish(session, LIVE_ANSWERS_CHANNEL, ",".join(items[i:i + _NOTIFY_CHUNK]))
+
+
+async def write_answers(session: AsyncSession, answers: Sequence[PendingAnswer], *, publish: bool = True) -> Dict[int, int]:
+    """
+    INSERT пачки ответов и прибавка очков игрокам в транзакции вызывающего кода
+    (без коммита). Возвращает прибавку очков по игрокам.
+    """
+    gained: Dict[int, int] = defaultdict(int)
+    for a in answers:
+        gained[a.user_id] += a.points
+
+    await session.execute(insert(QuizUserAnswer), [
+        {
+            "user_id": a.user_id,
+            "quiz_id": a.quiz_id,
+            "question_id": a.question_id,
+            "answers": a.answers,
+            "locale": a.locale,
+        }
+        for a in answers
+    ])
+    users = User.__table__
+    await session.execute(
+        update(users)
+        .where(users.c.id == bindparam("uid"))
+        .values(points=func.coalesce(users.c.points, 0) + bindparam("pts")),
+        # по возрастанию id — одинаковый порядок блокировок во всех транзакциях
+        [{"uid": uid, "pts": pts} for uid, pts in sorted(gained.items())],
+    )
+    if publish:
+        await publish_answers(session, answers)
+    return gained
+
+
+class AnswerBatcher:
+    """
+    Запись ответов пачками: когда весь зал жмёт кнопки одновременно, вместо транзакции
+    на каждое нажатие — одна транзакция на пачку (INSERT всех ответов, UPDATE очков
+    по игрокам через executemany). submit() ждёт коммита своей пачки и возвращает
+    новый счёт игрока.
+    """
+
+    def __init__(self, max_size: int = ANSWER_BATCH_SIZE, max_wait_ms: float = ANSWER_BATCH_WAIT_MS):
+        self.max_size = max_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue()
+        # набираемая пачка — на виду у run(), чтобы при остановке не потерять уже вынутое из очереди
+        self._batch: list = []
+
+    async def submit(self, answer: PendingAnswer) -> int:
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((answer, future))
+        return await future
+
+    async def _collect(self) -> None:
+        self._batch.append(await self._queue.get())
+        deadline = time.monotonic() + self.max_wait
+        while len(self._batch) < self.max_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                self._batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+    async def _flush(self, batch: list) -> None:
+        answers = [a for a, _ in batch]
+        try:
+            async with AsyncSessionLocal() as session:
+                gained = await write_answers(session, answers)
+                res = await session.execute(select(User.id, User.points).where(User.id.in_(list(gained))))
+                totals = dict(res.all())
+                await session.commit()
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            if len(batch) > 1:
+                # транзакция пачки откатилась целиком — одна плохая строка (вопрос удалили,
+                # игрока удалили...) не должна ронять остальные: повторяем по одной
+                logger.warning(f"AnswerBatcher: batch of {len(batch)} failed ({e!r}), retrying row by row")
+                for item in batch:
+                    await self._flush([item])
+                return
+            logger.exception("AnswerBatcher: failed to write answer")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for a, future in batch:
+            if not future.done():
+                future.set_result(totals.get(a.user_id, 0))
+
+    async def run(self) -> None:
+        """Фоновый цикл записи; при остановке дописывает то, что уже в очереди."""
+        try:
+            while True:
+                await self._collect()
+                batch, self._batch = self._batch, []
+                await self._flush(batch)
+        finally:
+            rest, self._batch = self._batch, []
+            while not self._queue.empty():
+                rest.append(self._queue.get_nowait())
+            if rest:
+                await self._flush(rest)
+
+
+answer_batcher = AnswerBatcher()
@@ -0,0 +1,52 @@
+import hashlib
+import json
+import unicodedata
+from typing import Dict, List, Optional
+
+from app.quizes.models import QuestionType
+
+
+def _norm(s: Optional[str]) -> str:
+    """
+    Нормализация строки для хеша: NFKC, схлопывание пробелов, casefold.
+    Правки вида «лишний пробел» / «другой регистр» не считаются изменением контента.
+    """
+    s = unicodedata.normalize("NFKC", str(s or ""))
+    return " ".join(s.split()).casefold()
+
+
+def _digest(payload: dict) -> str:
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def question_content_hash(
+    qtype: QuestionType | str,
+    text_i18n: Optional[Dict[str, str]],
+    options_i18n: Optional[Dict[str, List[str]]],
+    correct_answers_i18n: Optional[Dict[str, List[str]]],
+) -> str:
+    """
+    Стабильный хеш содержимого вопроса: тип + нормализованные текст, варианты и ответы.
+    - порядок локалей не важен;
+    - порядок вариантов важен (его видит игрок);
+    - правильные ответы сравниваются как множество.
+    duration_seconds / points / images_urls в хеш не входят — это атрибуты,
+    которые при повторном импорте просто обновляются.
+    """
+    t = qtype.value if isinstance(qtype, QuestionType) else str(qtype)
+    payload = {
+        "type": t,
+        "text": {loc: _norm(v) for loc, v in (text_i18n or {}).items() if _norm(v)},
+        "options": {loc: [_norm(o) for o in opts] for loc, opts in (options_i18n or {}).items() if opts},
+        "correct": {loc: sorted(_norm(a) for a in ans) for loc, ans in (correct_answers_i18n or {}).items() if ans},
+    }
+    return _digest(payload)
+
+
+def question_text_key(text_i18n: Optional[Dict[str, str]]) -> str:
+    """
+    Ключ «того же вопроса» по одному только тексту — чтобы при повторном импорте
+    отличить отредактированный вопрос (поменялись варианты/ответы) от нового.
+    """
+    return _digest({loc: _norm(v) for loc, v in (text_i18n or {}).items() if _norm(v)})
@@ -0,0 +1,657 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.common import pubsub
+from app.common.db import AsyncSessionLocal
+from app.common.locks import AdvisoryLocks
+from app.quizes.batcher import ANSWER_BATCH_SIZE, LIVE_ANSWERS_CHANNEL, PendingAnswer, write_answers
+from app.quizes.models import LiveQuizEpoch, Quiz, QuizQuestion, QuizUserAnswer
+from app.quizes.scoring import compile_answer_key, locale_values
+from app.users.models import User
+
+logger = logging.getLogger("uvicorn.error")
+
+# журналы живых сессий: абсолютный путь на постоянном диске (volume), общем для всех
+# воркеров хоста, — после падения владельца его журнал дописывает в БД тот, кто захватил
+# квиз следующим. Не задан — живые сессии выключены, ответы пишутся прямо в БД
+# (на диске контейнера журнал не переживёт рестарт, это не crash-safe).
+LIVE_JOURNAL_DIR = os.getenv("LIVE_JOURNAL_DIR", "")
+# сколько ждём, пока наберётся пачка для записи в БД, и сколько ответов максимум в пачке
+LIVE_FLUSH_WAIT_MS = float(os.getenv("LIVE_FLUSH_WAIT_MS", "200"))
+LIVE_FLUSH_SIZE = int(os.getenv("LIVE_FLUSH_SIZE", str(ANSWER_BATCH_SIZE)))
+# как часто воркер ищет активные квизы без владельца и проверяет свои
+LIVE_SCAN_SECONDS = float(os.getenv("LIVE_SCAN_SECONDS", "5"))
+
+# квиз включили/выключили/поменяли лимит или вопросы; payload — quiz_id
+LIVE_QUIZ_CHANNEL = "live_quiz"
+
+_RECONNECT_SECONDS = 5.0
+_RETRY_MAX_SECONDS = 30.0
+_FALLBACK_LOCALE = "ru"
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _lock_name(quiz_id: int) -> str:
+    return f"live-quiz:{quiz_id}"
+
+
+def _journal_path(quiz_id: int, epoch: int) -> Path:
+    return Path(LIVE_JOURNAL_DIR) / f"quiz-{quiz_id}.{epoch}.jsonl"
+
+
+def _taken_path(path: Path) -> Path:
+    return path.with_suffix(".taken")
+
+
+def _rejected_path(quiz_id: int) -> Path:
+    return Path(LIVE_JOURNAL_DIR) / f"quiz-{quiz_id}.rejected.jsonl"
+
+
+def _reject(quiz_id: int, records: List[dict]) -> None:
+    """Отложить ответы, которые в БД не записать никогда (вопрос или игрока удалили). В потоке."""
+    path = _rejected_path(quiz_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "ab") as f:
+        for rec in records:
+            f.write(json.dumps(rec, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+def _take_journal(path: Path, after_seq: int) -> List[dict]:
+    """
+    Забрать журнал прежней эпохи: переименовать (прежний владелец, если ещё жив, увидит
+    это после fsync и перестанет подтверждать ответы сам) и прочитать записи с номером
+    больше after_seq. Синхронно — через asyncio.to_thread.
+    """
+    taken = _taken_path(path)
+    try:
+        os.replace(path, taken)
+    except FileNotFoundError:
+        # журнала нет или его уже забрал прошлый (неудачный) захват
+        pass
+    try:
+        f = open(taken, "rb")
+    except FileNotFoundError:
+        return []
+    records = []
+    with f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                # недописанная строка (процесс упал посреди записи) — ответ не был подтверждён
+                continue
+            if rec.get("seq", 0) > after_seq:
+                records.append(rec)
+    return records
+
+
+def _pending(quiz_id: int, rec: dict) -> PendingAnswer:
+    return PendingAnswer(rec["user_id"], quiz_id, rec["question_id"], rec["answers"], rec["locale"], rec["points"])
+
+
+async def _write_records(session: AsyncSession, quiz_id: int, records: List[dict], *, publish: bool) -> None:
+    """
+    Записать ответы журнала в транзакции вызывающего (под строкой эпохи). Пачка упала на
+    ограничении (вопрос или игрока удалили после ответа) — повторяем по одной под SAVEPOINT,
+    как AnswerBatcher._flush: иначе одна такая строка навсегда застопорит запись квиза.
+    Строки, которые не записать, уходят в quiz-<id>.rejected.jsonl рядом с журналом.
+    """
+    try:
+        async with session.begin_nested():
+            await write_answers(session, [_pending(quiz_id, rec) for rec in records], publish=publish)
+        return
+    except IntegrityError as e:
+        if len(records) == 1:
+            rejected = records
+        else:
+            logger.warning(f"Live quiz {quiz_id}: batch of {len(records)} answers failed ({e.orig!r}), retrying row by row")
+            rejected = []
+            for rec in records:
+                try:
+                    async with session.begin_nested():
+                        await write_answers(session, [_pending(quiz_id, rec)], publish=publish)
+                except IntegrityError:
+                    rejected.append(rec)
+    logger.error(
+        f"Live quiz {quiz_id}: {len(rejected)} answers reference deleted questions or players, "
+        f"moved to {_rejected_path(quiz_id)}"
+    )
+    await asyncio.to_thread(_reject, quiz_id, rejected)
+
+
+class Fenced(Exception):
+    """Эпоха квиза сменилась: сессию захватил другой воркер, этот больше не владелец."""
+
+
+class Journal:
+    """
+    Журнал упреждающей записи сессии (JSON Lines, файл на эпоху). append() возвращается
+    после fsync; записи, пришедшие, пока идёт fsync, уходят следующим — одним на всех.
+    on_durable получает записи, уже лежащие на диске, в порядке номеров.
+    fenced — файл забрал новый владелец (_take_journal): записанное после этого он мог
+    не прочитать, такие ответы подтверждаются только после записи в БД.
+    """
+
+    def __init__(self, path: Path, on_durable: Callable[[List[dict]], None]):
+        self.path = path
+        self.fenced = False
+        self._on_durable = on_durable
+        self._fh = None
+        self._ino: Optional[int] = None
+        self._buf: list = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def open(self) -> None:
+        def _open():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            return open(self.path, "ab")
+        self._fh = await asyncio.to_thread(_open)
+        self._ino = os.fstat(self._fh.fileno()).st_ino
+
+    def _write(self, data: bytes) -> bool:
+        """Дописать и fsync; False — файл под нашим путём уже не наш (его забрали)."""
+        self._fh.write(data)
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        # проверка после fsync: захват переименовывает файл до чтения, значит всё,
+        # что записано до успешной проверки, новый владелец прочитает
+        try:
+            return os.stat(self.path).st_ino == self._ino
+        except FileNotFoundError:
+            return False
+
+    async def _sync(self) -> None:
+        while self._buf:
+            batch, self._buf = self._buf, []
+            try:
+                owned = await asyncio.to_thread(self._write, b"".join(data for _, data, _ in batch))
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            if not owned:
+                self.fenced = True
+            self._on_durable([rec for rec, _, _ in batch])
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+    async def append(self, record: dict) -> None:
+        future = asyncio.get_running_loop().create_future()
+        data = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+        self._buf.append((record, data, future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._sync())
+        # отмена запроса не отменяет запись: ответ уже учтён в памяти
+        await asyncio.shield(future)
+
+    async def close(self) -> None:
+        while self._task is not None and not self._task.done():
+            await self._task
+        if self._fh is not None:
+            await asyncio.to_thread(self._fh.close)
+            self._fh = None
+
+
+class LiveQuestion(NamedTuple):
+    id: int
+    # локаль -> скомпилированный ключ; только локали с непустыми правильными ответами
+    keys: Dict[str, Callable]
+    fallback: Callable
+
+    def score(self, answers: str | List[str], locale: str) -> int:
+        # как locale_values: нет ответов под локаль — берём ответы фолбэк-локали
+        return (self.keys.get(locale) or self.fallback)(answers)
+
+
+def compile_question(qid: int, qtype, points: int, correct_i18n: Optional[Dict[str, List[str]]]) -> LiveQuestion:
+    """Ключи вопроса на все локали; оценка та же, что у QuizService.calculate_points."""
+    keys = {
+        loc: compile_answer_key(qtype, points, values)
+        for loc, values in (correct_i18n or {}).items() if values
+    }
+    fallback = compile_answer_key(qtype, points, locale_values(correct_i18n, _FALLBACK_LOCALE))
+    return LiveQuestion(qid, keys, fallback)
+
+
+class _Player:
+    __slots__ = ("answered", "questions", "total")
+
+    def __init__(self):
+        self.answered = 0  # ответов в этом квизе (как в _get_quiz_limits)
+        self.questions: set[int] = set()  # на какие вопросы отвечал (игра в чате не даёт ответить дважды)
+        self.total: Optional[int] = None  # users.points; читаем из БД при первом ответе в сессии
+
+    def add(self, question_id: int) -> None:
+        self.answered += 1
+        self.questions.add(question_id)
+
+
+class LiveQuiz:
+    """
+    Живая сессия одного квиза в воркере-владельце: вопросы со скомпилированными
+    ключами ответов и прогресс игроков в памяти. Ответ проверяется и оценивается без
+    обращения к БД, подтверждается после fsync журнала, а в БД уходит пачкой в фоне.
+    """
+
+    def __init__(self, quiz_id: int, epoch: int, answer_limit: Optional[int],
+                 questions: Dict[int, LiveQuestion], players: Dict[int, _Player]):
+        self.quiz_id = quiz_id
+        self.epoch = epoch
+        self.answer_limit = answer_limit
+        self.questions = questions
+        self.players = players
+        self.journal = Journal(_journal_path(quiz_id, epoch), self._durable)
+        self.closed = False
+        # квиз поменяли (вопросы, лимит) — сессию перезагрузит ближайшее сканирование,
+        # а до тех пор ответы идут прямо в БД
+        self.stale = False
+        self.writer: Optional[asyncio.Task] = None
+        self._seq = 0
+        # на диске, но ещё не в БД
+        self._unpersisted: List[dict] = []
+        # flush() зовут writer, close() и submit() вытесненной сессии — по одному
+        self._flush_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+
+    @property
+    def effective_limit(self) -> int:
+        return self.answer_limit if self.answer_limit is not None else len(self.questions)
+
+    def limits(self, player: _Player) -> dict:
+        effective_limit = self.effective_limit
+        return {
+            "total_questions": len(self.questions),
+            "answered": player.answered,
+            "effective_limit": effective_limit,
+            "remaining_allowed": max(effective_limit - player.answered, 0),
+        }
+
+    def count_external(self, user_id: int, question_id: int, points: int) -> None:
+        """Ответ записан мимо сессии (другой воркер) — учесть в прогрессе игрока."""
+        player = self.players.setdefault(user_id, _Player())
+        player.add(question_id)
+        if player.total is not None:
+            player.total += points
+
+    def answered_questions(self, user_id: int) -> tuple[set[int], int]:
+        """(id отвеченных вопросов, число ответов) игрока — включая ещё не записанные в БД."""
+        player = self.players.get(user_id)
+        return (set(player.questions), player.answered) if player is not None else (set(), 0)
+
+    async def submit(self, user_id: int, question_id: int, answers: str | List[str], locale: str) -> Optional[dict]:
+        """
+        Принять ответ (тот же результат, что у QuizService.submit_answer). None — сессия
+        закрывается, ответ надо писать в БД напрямую. answer_id нет: строка появится
+        в БД с ближайшей пачкой.
+        """
+        question = self.questions[question_id]
+        player = self.players.setdefault(user_id, _Player())
+        if player.total is None:
+            async with AsyncSessionLocal() as session:
+                points = await session.scalar(select(User.points).where(User.id == user_id)) or 0
+            if player.total is None:
+                player.total = points
+        if self.closed:
+            return None
+
+        # дальше до записи в журнал — без await: проверка лимита и учёт ответа атомарны
+        remaining_before = max(self.effective_limit - player.answered, 0)
+        pts = question.score(answers, locale) if remaining_before > 0 else 0
+        self._seq += 1
+        record = {
+            "seq": self._seq,
+            "user_id": user_id,
+            "question_id": question_id,
+            "answers": answers if isinstance(answers, list) else [str(answers)],
+            "locale": locale,
+            "points": pts,
+        }
+        repeated = question_id in player.questions
+        player.add(question_id)
+        player.total += pts
+        try:
+            await self.journal.append(record)
+        except Exception:
+            player.answered -= 1
+            if not repeated:
+                player.questions.discard(question_id)
+            player.total -= pts
+            logger.exception(f"Live quiz {self.quiz_id}: journal write failed")
+            raise HTTPException(status_code=503, detail="Failed to save answer, try again")
+        if self.journal.fenced:
+            # журнал забрал новый владелец — подтверждаем, только когда ответ в БД
+            self.closed = True
+            try:
+                await self.flush()
+            except Fenced:
+                pass
+            except Exception:
+                logger.exception(f"Live quiz {self.quiz_id}: failed to persist answers after takeover")
+                raise HTTPException(status_code=503, detail="Failed to save answer, try again")
+
+        limits = self.limits(player)
+        remaining = limits["remaining_allowed"]
+        return {
+            "answer_id": None,
+            "awarded_points": pts,
+            "user_total_points": player.total,
+            "remaining_questions": remaining,
+            "isCompleted": remaining <= 0,
+            "limits": limits,
+        }
+
+    def _durable(self, records: List[dict]) -> None:
+        self._unpersisted.extend(records)
+        self._wake.set()
+
+    async def _persist(self, batch: List[dict]) -> bool:
+        """Записать пачку в БД. True — у квиза уже новая эпоха (пачка всё равно записана)."""
+        async with AsyncSessionLocal() as session:
+            # строка эпохи под FOR UPDATE: захват читает журнал и дописывает хвост под ней же
+            row = await session.get(LiveQuizEpoch, (self.quiz_id, self.epoch), with_for_update=True)
+            if row is None:
+                # квиз удалён (каскадом ушли и эпохи) — ответы писать некуда
+                return True
+            newer = await session.scalar(
+                select(LiveQuizEpoch.epoch)
+                .where(LiveQuizEpoch.quiz_id == self.quiz_id, LiveQuizEpoch.epoch > self.epoch)
+                .limit(1)
+            )
+            # уже записанное (повтор после обрыва на коммите, хвост, дописанный новым владельцем) пропускаем
+            fresh = [rec for rec in batch if rec["seq"] > row.persisted_seq]
+            if fresh:
+                # после вытеснения новый владелец должен учесть эти ответы в прогрессе игроков
+                await _write_records(session, self.quiz_id, fresh, publish=newer is not None)
+                row.persisted_seq = max(rec["seq"] for rec in fresh)
+            await session.commit()
+        return newer is not None
+
+    async def flush(self) -> None:
+        """Дописать в БД всё, что уже на диске. Fenced — после записи, если квиз у другого воркера."""
+        async with self._flush_lock:
+            fenced = False
+            while self._unpersisted:
+                batch = self._unpersisted[:LIVE_FLUSH_SIZE]
+                fenced = await self._persist(batch) or fenced
+                del self._unpersisted[:len(batch)]
+        if fenced:
+            self.closed = True
+            raise Fenced(self.quiz_id)
+
+    async def run_writer(self) -> None:
+        """Фоновая запись в БД; сбой БД не теряет ответы — они в журнале, пробуем снова."""
+        delay = 1.0
+        while True:
+            await self._wake.wait()
+            # набираем пачку
+            await asyncio.sleep(LIVE_FLUSH_WAIT_MS / 1000)
+            self._wake.clear()
+            try:
+                await self.flush()
+                delay = 1.0
+            except Fenced:
+                raise
+            except Exception:
+                logger.exception(f"Live quiz {self.quiz_id}: failed to persist {len(self._unpersisted)} answers, retrying")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _RETRY_MAX_SECONDS)
+                self._wake.set()
+
+    async def close(self) -> None:
+        """Перестать принимать ответы, дописать всё в БД и удалить журнал."""
+        self.closed = True
+        if self.writer is not None:
+            self.writer.cancel()
+            await asyncio.gather(self.writer, return_exceptions=True)
+        await self.journal.close()
+        try:
+            await self.flush()
+        except Fenced:
+            # всё записано; квиз уже ведёт другой воркер
+            pass
+        await asyncio.to_thread(self.journal.path.unlink, missing_ok=True)
+
+
+async def _load(quiz_id: int) -> Optional[LiveQuiz]:
+    """
+    Захват квиза (под его advisory lock): забрать журнал прежней эпохи и дописать в БД
+    его хвост, открыть новую эпоху и загрузить вопросы с прогрессом игроков — в одной
+    транзакции.
+    """
+    async with AsyncSessionLocal() as session:
+        quiz = await session.get(Quiz, quiz_id)
+        if quiz is None or not quiz.is_active:
+            return None
+
+        prev = await session.scalar(
+            select(LiveQuizEpoch)
+            .where(LiveQuizEpoch.quiz_id == quiz_id)
+            .order_by(LiveQuizEpoch.epoch.desc())
+            .limit(1)
+            .with_for_update()
+        )
+        epoch, taken = 1, None
+        if prev is not None:
+            epoch = prev.epoch + 1
+            path = _journal_path(quiz_id, prev.epoch)
+            taken = _taken_path(path)
+            tail = await asyncio.to_thread(_take_journal, path, prev.persisted_seq)
+            if tail:
+                logger.warning(f"Live quiz {quiz_id}: replaying {len(tail)} answers from epoch {prev.epoch} journal")
+                await _write_records(session, quiz_id, tail, publish=False)
+                prev.persisted_seq = max(rec["seq"] for rec in tail)
+        # вторая строка той же эпохи (параллельный захват) упадёт на первичном ключе
+        session.add(LiveQuizEpoch(quiz_id=quiz_id, epoch=epoch, persisted_seq=0, owner=_OWNER))
+
+        rows = (await session.execute(
+            select(QuizQuestion.id, QuizQuestion.type, QuizQuestion.points, QuizQuestion.correct_answers_i18n)
+            .where(QuizQuestion.quiz_id == quiz_id)
+        )).all()
+        progress = (await session.execute(
+            select(QuizUserAnswer.user_id, QuizUserAnswer.question_id)
+            .where(QuizUserAnswer.quiz_id == quiz_id)
+        )).all()
+        answer_limit = quiz.answer_limit
+        await session.commit()
+
+    if taken is not None:
+        await asyncio.to_thread(taken.unlink, missing_ok=True)
+
+    questions = {qid: compile_question(qid, qtype, points, correct_i18n) for qid, qtype, points, correct_i18n in rows}
+    players: Dict[int, _Player] = {}
+    for uid, qid in progress:
+        players.setdefault(uid, _Player()).add(qid)
+
+    live = LiveQuiz(quiz_id, epoch, answer_limit, questions, players)
+    await live.journal.open()
+    live.writer = asyncio.create_task(live.run_writer())
+    return live
+
+
+class LiveQuizEngine:
+    """
+    Живые сессии квизов этого воркера. Каждый активный квиз ведёт ровно один воркер —
+    тот, кто взял его pg_advisory_lock (сразу при включении квиза, иначе при
+    сканировании); упал владелец — квиз захватывает другой с новой эпохой.
+    Ответы на квиз без сессии в этом воркере идут прежним путём, прямо в БД.
+    """
+
+    def __init__(self):
+        self._quizes: Dict[int, LiveQuiz] = {}
+        self._locks = AdvisoryLocks()
+        # соединение блокировок одно: сканирование и activate() — по очереди
+        self._mutex = asyncio.Lock()
+        self._connected = False
+        self._wakeup = asyncio.Event()
+
+    def get(self, quiz_id: int) -> Optional[LiveQuiz]:
+        live = self._quizes.get(quiz_id)
+        return live if live is not None and not live.closed and not live.stale else None
+
+    def invalidate(self, quiz_id: Optional[int] = None) -> None:
+        """Квиз поменяли (None — неизвестно какой): его сессию перезагрузить из БД."""
+        for qid, live in self._quizes.items():
+            if quiz_id is None or qid == quiz_id:
+                live.stale = True
+        self.wake()
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def _take(self, quiz_id: int) -> None:
+        if not await self._locks.try_acquire(_lock_name(quiz_id)):
+            return
+        try:
+            live = await _load(quiz_id)
+        except Exception:
+            await self._locks.release(_lock_name(quiz_id))
+            raise
+        if live is None:
+            await self._locks.release(_lock_name(quiz_id))
+            return
+        self._quizes[quiz_id] = live
+        logger.info(f"Live quiz {quiz_id}: owned, epoch {live.epoch}, {len(live.questions)} questions (pid={os.getpid()})")
+
+    async def _drop(self, quiz_id: int) -> None:
+        live = self._quizes.pop(quiz_id)
+        try:
+            # вытесненная сессия тоже дописывает своё: строка эпохи не даст записать дважды
+            await live.close()
+        except Exception:
+            # журнал остаётся на диске — его допишет следующий владелец
+            logger.exception(f"Live quiz {quiz_id}: failed to close, journal kept for replay")
+        finally:
+            try:
+                await self._locks.release(_lock_name(quiz_id))
+            except Exception:
+                # соединение оборвалось — блокировка снята вместе с ним
+                pass
+
+    async def activate(self, quiz_id: int) -> None:
+        """Квиз только что включили — загрузить его сессию в этот воркер, если он свободен."""
+        async with self._mutex:
+            if self._connected and quiz_id not in self._quizes:
+                await self._take(quiz_id)
+
+    async def _scan(self) -> None:
+        async with AsyncSessionLocal() as session:
+            active = dict((await session.execute(
+                select(Quiz.id, Quiz.answer_limit).where(Quiz.is_active.is_(True))
+            )).all())
+
+        latest = {}
+        if self._quizes:
+            async with AsyncSessionLocal() as session:
+                latest = dict((await session.execute(
+                    select(LiveQuizEpoch.quiz_id, func.max(LiveQuizEpoch.epoch))
+                    .where(LiveQuizEpoch.quiz_id.in_(list(self._quizes)))
+                    .group_by(LiveQuizEpoch.quiz_id)
+                )).all())
+
+        for quiz_id, live in list(self._quizes.items()):
+            if latest.get(quiz_id, live.epoch) > live.epoch or live.journal.fenced:
+                logger.warning(f"Live quiz {quiz_id}: taken over by another worker (epoch {live.epoch}), dropping session")
+                await self._drop(quiz_id)
+            elif live.closed or (live.writer is not None and live.writer.done()):
+                exc = live.writer.exception() if live.writer is not None and live.writer.done() and not live.writer.cancelled() else None
+                if exc is not None and not isinstance(exc, Fenced):
+                    logger.error(f"Live quiz {quiz_id}: writer stopped: {exc!r}")
+                await self._drop(quiz_id)
+            elif quiz_id not in active or live.stale:
+                # квиз выключили — дописываем ответы и отпускаем; поменяли — то же, и ниже
+                # захватываем заново с новыми вопросами и ключами
+                await self._drop(quiz_id)
+            else:
+                live.answer_limit = active[quiz_id]
+
+        for quiz_id in active.keys() - self._quizes.keys():
+            try:
+                await self._take(quiz_id)
+            except Exception:
+                logger.exception(f"Live quiz {quiz_id}: failed to load")
+
+        await self._locks.ping()
+
+    async def run(self) -> None:
+        """Фоновый цикл в каждом воркере; при остановке дописывает ответы своих сессий."""
+        if not LIVE_JOURNAL_DIR or not Path(LIVE_JOURNAL_DIR).is_absolute():
+            if LIVE_JOURNAL_DIR:
+                logger.error(f"LIVE_JOURNAL_DIR must be an absolute path on a persistent volume, got {LIVE_JOURNAL_DIR!r}")
+            logger.info("Live quiz sessions disabled (no LIVE_JOURNAL_DIR): answers go straight to the DB")
+            return
+        while True:
+            try:
+                async with self._mutex:
+                    await self._locks.connect()
+                    self._connected = True
+                while True:
+                    self._wakeup.clear()
+                    async with self._mutex:
+                        await self._scan()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), LIVE_SCAN_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Live quiz engine failed, dropping owned quizzes")
+            finally:
+                # без соединения блокировок владения нет; строки эпох не дадут записать дважды
+                async with self._mutex:
+                    self._connected = False
+                    for quiz_id in list(self._quizes):
+                        await self._drop(quiz_id)
+                    await self._locks.close()
+            await asyncio.sleep(_RECONNECT_SECONDS)
+
+
+live_engine = LiveQuizEngine()
+
+
+def _on_quiz(payload: Optional[str]) -> None:
+    # payload None — уведомления могли потеряться: перезагружаем все свои сессии
+    try:
+        quiz_id = int(payload) if payload is not None else None
+    except ValueError:
+        return
+    live_engine.invalidate(quiz_id)
+
+
+def _on_answers(payload: Optional[str]) -> None:
+    # payload None (пропущенные уведомления) не восстановить: счётчики владельца
+    # догонят БД при следующем захвате квиза
+    if payload is None:
+        return
+    for item in payload.split(","):
+        try:
+            quiz_id, user_id, question_id, points = (int(x) for x in item.split(":"))
+        except ValueError:
+            continue
+        live = live_engine.get(quiz_id)
+        if live is not None:
+            live.count_external(user_id, question_id, points)
+
+
+pubsub.subscribe(LIVE_QUIZ_CHANNEL, _on_quiz)
+pubsub.subscribe(LIVE_ANSWERS_CHANNEL, _on_answers)
+
+
+async def quiz_changed(session: AsyncSession, quiz_id: int) -> None:
+    """
+    Квиз включили/выключили, поменяли лимит или вопросы — владелец перезагрузит сессию.
+    В транзакции изменения (NOTIFY уйдёт после коммита).
+    """
+    await pubsub.publish(session, LIVE_QUIZ_CHANNEL, str(quiz_id))
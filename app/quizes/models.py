@@ -2,10 +2,11 @@ import enum
 from typing import Dict, List, Optional
 from datetime import datetime
 
-from sqlalchemy import String, Integer, ForeignKey, Enum, JSON, DateTime, func
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import String, Integer, ForeignKey, Enum, JSON, DateTime, UniqueConstraint, func
+from sqlalchemy.orm import Mapped, mapped_column, relationship, validates
 
 from app.common.db import Base
+from app.media.images import variants_for
 import app.events.models
 
 
@@ -28,7 +29,7 @@ class Quiz(Base):
     event: Mapped["Event"] = relationship(
         "Event",
         back_populates="quizes",
-        lazy="selectin",
+        lazy="raise_on_sql",
     )
 
 
@@ -49,6 +50,27 @@ class QuizQuestion(Base):
 
     # 🔽 Новое: список URL картинок (может быть пустым)
     images_urls: Mapped[List[str]] = mapped_column(JSON, default=list)
+    # уменьшенные копии картинок из CAS: {url: {"320": url, "640": url, "1280": url}};
+    # заполняется автоматически при присвоении images_urls, файлы генерируются лениво
+    images_variants: Mapped[Dict[str, Dict[str, str]]] = mapped_column(JSON, default=dict)
+
+    # sha256 нормализованного содержимого (тип, текст, варианты, ответы) — см. app/quizes/hashing.py;
+    # по нему повторный импорт того же пакета не плодит дубликаты
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("quiz_id", "content_hash", name="uq_quiz_questions_quiz_content_hash"),
+    )
+
+    @validates("images_urls")
+    def _sync_images_variants(self, key, urls):
+        variants = {}
+        for url in urls or []:
+            v = variants_for(url)
+            if v:
+                variants[url] = v
+        self.images_variants = variants
+        return urls
 
 
 class QuizUserAnswer(Base):
@@ -65,3 +87,21 @@ class QuizUserAnswer(Base):
     locale: Mapped[str] = mapped_column(String(10), default="ru")
 
     quiz_id: Mapped[int] = mapped_column(ForeignKey("quizes.id", ondelete="CASCADE"))
+
+
+class LiveQuizEpoch(Base):
+    """
+    Эпохи владения живой сессией квиза (app/quizes/live.py): строка на каждый захват
+    сессии воркером, текущая — с наибольшим epoch. persisted_seq — до какого номера
+    журнала эпохи ответы уже в БД. Ответы эпохи пишет в БД кто угодно (её владелец,
+    тот же владелец после вытеснения, новый владелец из журнала) — но только под
+    FOR UPDATE этой строки и только номера больше persisted_seq, поэтому ровно один раз.
+    """
+    __tablename__ = "live_quiz_epochs"
+
+    quiz_id: Mapped[int] = mapped_column(ForeignKey("quizes.id", ondelete="CASCADE"), primary_key=True)
+    epoch: Mapped[int] = mapped_column(Integer, primary_key=True)
+    persisted_seq: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    owner: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
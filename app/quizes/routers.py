@@ -8,13 +8,14 @@ from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from starlette import status
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.common.db import get_async_session
+from app.common.db import get_async_session, get_read_session
 from app.common.common import CurrentUser
-from app.common.files import save_file_for_quiz
-from app.users.models import User
+from app.common.identity import Identity
+from app.common.files import stream_uploads
 from app.events.models import Event
 from app.quizes import schemas
 from app.quizes.models import Quiz
+from app.quizes.live import quiz_changed
 from app.quizes.services import QuizService, QuizExportService
 
 
@@ -44,12 +45,12 @@ async def list_quizes_by_event(event_id: int, session: AsyncSession = Depends(ge
     return [schemas.QuizOut.model_validate(x) for x in res.scalars().all()]
 
 @router.get("/questions/list", response_model=list[schemas.QuizQuestionOut], summary="Question list by quiz_id")
-async def list_questions(session: AsyncSession = Depends(get_async_session), current_user: User = Depends(CurrentUser()), quiz_id: int = Query(..., description="ID квиза")):
+async def list_questions(session: AsyncSession = Depends(get_read_session), current_user: Identity = Depends(CurrentUser()), quiz_id: int = Query(..., description="ID квиза")):
     service = QuizService(session, current_user)
     return await service.list_questions_by_quiz(quiz_id)
 
 @router.post("/answer")
-async def submit_answer(data: schemas.UserAnswerCreate, session: AsyncSession = Depends(get_async_session), current_user: User = Depends(CurrentUser())):
+async def submit_answer(data: schemas.UserAnswerCreate, session: AsyncSession = Depends(get_async_session), current_user: Identity = Depends(CurrentUser())):
     service = QuizService(session, current_user)
     return await service.submit_answer(data)
 
@@ -120,12 +121,16 @@ async def list_questions_localized(
     quiz_id: int,
     locale: str = Query("ru", description="Код языка, например: ru, kk, en"),
     include_correct: bool = Query(False, description="Включать ли правильные ответы (для админки)"),
-    svc: QuizService = Depends(),
+    image_width: Optional[int] = Query(None, ge=1, description="Ширина экрана в px: images_urls заменятся на уменьшенные копии (320/640/1280)"),
+    session: AsyncSession = Depends(get_read_session),
+    current_user: Identity = Depends(CurrentUser()),
 ):
+    svc = QuizService(session, current_user)
     return await svc.list_questions_by_quiz_locale(
         quiz_id=quiz_id,
         locale=locale,
         include_correct=include_correct,
+        image_width=image_width,
     )
 
 @router.post(
@@ -160,20 +165,18 @@ async def bulk_import_with_images_file(
     except Exception as e:
         raise HTTPException(status_code=422, detail=f"Invalid payload schema: {e}")
 
-    # 2) сохраняем картинки и собираем URL-ы
-    image_urls: list[str] = []
-    for f in images:
-        url = await save_file_for_quiz(quiz_id, f)  # вернёт вида /media/quizes/<quiz_id>/<uuid>.ext
-        image_urls.append(url)
+    # 2) сохраняем картинки параллельно; канонические URL-ы /media/cas/... в порядке images
+    saved = await stream_uploads(images)
+    image_urls = [m.url for m in saved]
 
-    # 3) поиндексно дописываем image_url в элементы
+    # 3) поиндексно дописываем картинку в элементы
     for i, item in enumerate(bulk_in.items):
         if i < len(image_urls):
-            item.image_url = image_urls[i]
+            item.images_urls = [*(item.images_urls or []), image_urls[i]]
 
-    # 4) пишем в БД
+    # 4) пишем в БД (upsert по content_hash — повторный импорт не плодит дубликаты)
     svc = QuizService(session)
-    return await svc.bulk_add_questions_simple(quiz_id, bulk_in)
+    return await svc.bulk_add_questions(quiz_id, bulk_in)
 
 @router.post(
     "/questions/{question_id}/images:attach_files",
@@ -205,6 +208,7 @@ async def attach_images_urls(
     question_id: int,
     body: schemas.AttachUrlsIn,
     session: AsyncSession = Depends(get_async_session),
+    current_user: Identity = Depends(CurrentUser(require_admin=True)),
 ):
     svc = QuizService(session)
     q = await svc.attach_images_to_question(
@@ -216,6 +220,38 @@ async def attach_images_urls(
     return schemas.QuizQuestionOut.model_validate(q)
 
 
+@router.post(
+    "/questions/{question_id}/images:presign",
+    response_model=list[schemas.PresignedUploadOut],
+    summary="Подписанные формы для загрузки изображений напрямую в хранилище (MEDIA_STORAGE=s3)",
+)
+async def presign_images(
+    question_id: int,
+    body: schemas.PresignImagesIn,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: Identity = Depends(CurrentUser(require_admin=True)),
+):
+    svc = QuizService(session)
+    uploads = await svc.presign_question_images(question_id, body.content_types)
+    return [u._asdict() for u in uploads]
+
+
+@router.post(
+    "/questions/{question_id}/images:attach_keys",
+    response_model=schemas.QuizQuestionOut,
+    summary="Прикрепить изображения, загруженные напрямую в хранилище (по ключам из images:presign)",
+)
+async def attach_images_keys(
+    question_id: int,
+    body: schemas.AttachKeysIn,
+    session: AsyncSession = Depends(get_async_session),
+    current_user: Identity = Depends(CurrentUser(require_admin=True)),
+):
+    svc = QuizService(session)
+    q = await svc.attach_image_keys(question_id, body.keys)
+    return schemas.QuizQuestionOut.model_validate(q)
+
+
 @router.get(
     "/leaderboard",
     response_model=list[schemas.UserLeaderboardOut],
@@ -223,7 +259,7 @@ async def attach_images_urls(
 )
 async def get_leaderboard(
     limit: int = Query(10, description="Сколько лучших пользователей вернуть"),
-    session: AsyncSession = Depends(get_async_session),
+    session: AsyncSession = Depends(get_read_session),
 ):
     svc = QuizService(session)
     return await svc.get_leaderboard(limit)
@@ -232,7 +268,7 @@ async def get_leaderboard(
 async def get_quiz_limits(
     quiz_id: int,
     session: AsyncSession = Depends(get_async_session),
-    current_user: User = Depends(CurrentUser()),
+    current_user: Identity = Depends(CurrentUser()),
 ):
     svc = QuizService(session, current_user)
     return await svc.get_quiz_limits_public(quiz_id, current_user.id)
@@ -245,7 +281,7 @@ async def set_quiz_limit(
     quiz_id: int,
     body: QuizLimitUpdateIn,
     session: AsyncSession = Depends(get_async_session),
-    current_user: User = Depends(CurrentUser(require_admin=True)),
+    current_user: Identity = Depends(CurrentUser(require_admin=True)),
 ):
     quiz = await session.get(Quiz, quiz_id)
     if not quiz:
@@ -257,6 +293,8 @@ async def set_quiz_limit(
 
     quiz.answer_limit = body.answer_limit
     session.add(quiz)
+    # лимит читает из памяти живая сессия квиза — пусть перечитает
+    await quiz_changed(session, quiz.id)
     await session.commit()
     await session.refresh(quiz)
 
@@ -266,7 +304,7 @@ async def set_quiz_limit(
 async def get_remaining_for_current_user(
     quiz_id: int,
     session: AsyncSession = Depends(get_async_session),
-    current_user: User = Depends(CurrentUser()),
+    current_user: Identity = Depends(CurrentUser()),
 ) -> dict:
     svc = QuizService(session, current_user)
     limits = await svc.get_quiz_limits_public(quiz_id, current_user.id)
@@ -279,8 +317,8 @@ async def get_remaining_for_current_user(
 )
 async def export_answers_xlsx(
     quiz_id: int,
-    session: AsyncSession = Depends(get_async_session),
-    current_user: User = Depends(CurrentUser(require_admin=True)),
+    session: AsyncSession = Depends(get_read_session),
+    current_user: Identity = Depends(CurrentUser(require_admin=True)),
     question_id: int | None = Query(None, description="ID вопроса для фильтра"),
     q_text: str | None = Query(None, description="Фильтр по названию вопроса (подстрока)"),
     locale: str = Query("ru", description="Локаль для поиска по тексту вопроса (когда используется q_text)"),
@@ -307,7 +345,7 @@ async def delete_question(
     question_id: int,
     remove_files: bool = True,
     session: AsyncSession = Depends(get_async_session),
-    current_user: User = Depends(CurrentUser(require_admin=True)),
+    current_user: Identity = Depends(CurrentUser(require_admin=True)),
 ):
     svc = QuizService(session, current_user)
     return await svc.delete_question(question_id, remove_files=remove_files)
@@ -319,7 +357,7 @@ async def delete_question(
 async def export_leaderboard_xlsx(
     limit: int = Query(100, ge=1, le=1000, description="Сколько верхних строк выгрузить"),
     active_only: bool = Query(False, description="Только активные пользователи"),
-    session: AsyncSession = Depends(get_async_session),
+    session: AsyncSession = Depends(get_read_session),
 ):
     svc = QuizExportService(session)
     file_bytes, filename = await svc.export_leaderboard_xlsx(limit=limit, active_only=active_only)
@@ -70,6 +70,7 @@ class QuizQuestionOut(BaseModel):
     points: int = 1
 
     images_urls: List[str] = []
+    images_variants: Dict[str, Dict[str, str]] = {}
 
     model_config = {
         "from_attributes": True,     # можно пихать ORM объект
@@ -175,6 +176,13 @@ class QuizQuestionsBulkIn(BaseModel):
 class QuizQuestionsBulkOut(BaseModel):
     created: int
     ids: List[int]
+    # diff повторного импорта (сопоставление по content_hash)
+    updated: int = 0
+    updated_ids: List[int] = []
+    updated_fields: Dict[int, List[str]] = {}
+    unchanged: int = 0
+    unchanged_ids: List[int] = []
+    duplicates_in_payload: int = 0
 
 class QuizQuestionLocalizedOut(BaseModel):
     id: int
@@ -184,6 +192,7 @@ class QuizQuestionLocalizedOut(BaseModel):
     duration_seconds: Optional[int] = None
     points: int
     images_urls: List[str] = []
+    images_variants: Dict[str, Dict[str, str]] = {}
 
 
 class UserLeaderboardOut(BaseModel):
@@ -208,4 +217,25 @@ class AttachUrlsIn(BaseModel):
             "https://cdn.site.com/pictures/diagram.jpg"
         ],
         description="Список абсолютных URL изображений, которые нужно прикрепить к вопросу."
-    )
\ No newline at end of file
+    )
+
+
+class PresignImagesIn(BaseModel):
+    """Запрос подписанных форм для прямой загрузки картинок в хранилище."""
+    content_types: List[str] = Field(
+        ..., min_length=1, max_length=20,
+        description="MIME-тип каждого файла (image/jpeg, image/png, image/webp, image/gif)",
+    )
+
+
+class PresignedUploadOut(BaseModel):
+    key: str
+    url: str
+    method: str
+    fields: Dict[str, str] = Field(description="Поля multipart-формы; сам файл — последним полем 'file'")
+    expires_in: int
+
+
+class AttachKeysIn(BaseModel):
+    """Ключи файлов, загруженных напрямую в хранилище (из images:presign)."""
+    keys: List[str] = Field(..., min_length=1)
@@ -0,0 +1,97 @@
+import unicodedata
+from typing import Callable, Dict, List, Optional
+
+from app.quizes.models import QuestionType
+
+
+def normalize_answer(s: Optional[str]) -> str:
+    # мягкая нормализация для open-ended
+    if s is None:
+        return ""
+    s = unicodedata.normalize("NFKC", s).casefold().strip()
+    # при желании — удаление диакритики:
+    s = "".join(ch for ch in unicodedata.normalize("NFD", s) if not unicodedata.combining(ch))
+    return s
+
+
+def locale_values(values_i18n: Optional[Dict[str, List[str]]], locale: str, fallback: str = "ru") -> List[str]:
+    """Значения под локаль с фолбэком (варианты или правильные ответы вопроса)."""
+    values_i18n = values_i18n or {}
+    if not locale:
+        locale = fallback
+    return values_i18n.get(locale) or values_i18n.get(fallback) or []
+
+
+def _answer_list(user_answer: str | List[str]) -> List[str]:
+    # приводим пользовательский ответ к списку строк
+    if isinstance(user_answer, list):
+        return [str(x) for x in user_answer]
+    return [str(user_answer)]
+
+
+def score_answer(qtype: QuestionType, points: int, correct: List[str], user_answer: str | List[str]) -> int:
+    """
+    Очки за ответ. Единый счётчик для HTTP (QuizService.calculate_points) и игры в
+    чате бота — чтобы один и тот же ответ везде оценивался одинаково.
+    """
+    user_list = _answer_list(user_answer)
+
+    if qtype == QuestionType.OPEN:
+        # зачёт, если хоть один из вариантов совпал после нормализации
+        u = normalize_answer(user_list[0]) if user_list else ""
+        return int(any(u == normalize_answer(ans) for ans in correct))
+
+    if qtype == QuestionType.SINGLE:
+        # ожидаем ровно 1 ответ
+        if len(user_list) != 1 or not correct:
+            return 0
+        return points if user_list[0] == correct[0] else 0
+
+    if qtype == QuestionType.MULTIPLE:
+        # сравниваем как множества; частичный зачёт — пропорцией
+        correct_set = set(correct)
+        user_set = set(user_list)
+        if not correct_set:
+            return 0
+        if user_set == correct_set:
+            return points
+        # частичный зачёт (можно отключить, если не надо)
+        overlap = len(user_set & correct_set)
+        return int(points * overlap / len(correct_set))
+
+    return 0  # на всякий случай
+
+
+def compile_answer_key(qtype: QuestionType, points: int, correct: List[str]) -> Callable[[str | List[str]], int]:
+    """
+    score_answer с заранее разобранными правильными ответами (нормализация, множества) —
+    для живой сессии квиза (app/quizes/live.py), где один вопрос оценивают тысячи раз.
+    Результат тот же, что у score_answer.
+    """
+    if qtype == QuestionType.OPEN:
+        accepted = frozenset(normalize_answer(ans) for ans in correct)
+
+        def key(user_answer: str | List[str]) -> int:
+            user_list = _answer_list(user_answer)
+            return int((normalize_answer(user_list[0]) if user_list else "") in accepted)
+        return key
+
+    if qtype == QuestionType.SINGLE and correct:
+        right = correct[0]
+
+        def key(user_answer: str | List[str]) -> int:
+            user_list = _answer_list(user_answer)
+            return points if len(user_list) == 1 and user_list[0] == right else 0
+        return key
+
+    if qtype == QuestionType.MULTIPLE and correct:
+        correct_set = frozenset(correct)
+
+        def key(user_answer: str | List[str]) -> int:
+            user_set = set(_answer_list(user_answer))
+            if user_set == correct_set:
+                return points
+            return int(points * len(user_set & correct_set) / len(correct_set))
+        return key
+
+    return lambda user_answer: 0
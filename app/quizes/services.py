@@ -1,4 +1,5 @@
-from string import ascii_uppercase
+import asyncio
+import logging
 import pandas as pd
 from io import BytesIO
 from pathlib import Path
@@ -10,19 +11,34 @@ from urllib.parse import urlparse
 from typing import List, Optional, Annotated
 from fastapi import UploadFile, Request
 
-import unicodedata, json
+import json
 
 from fastapi import Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, func, literal, update
+from sqlalchemy import select, desc, func, literal, update, lambda_stmt
 from sqlalchemy.exc import IntegrityError
 
 from app.common.db import get_async_session
 from app.common.common import CurrentUser
-from app.users.models import User
+from app.common.identity import Identity
+from app.users.models import User, user_leaderboard_load
 from app.quizes import schemas
 from app.quizes.models import Quiz, QuizQuestion, QuizUserAnswer, QuestionType
-from app.common.files import MEDIA_ROOT, MEDIA_URL, _async_write_bytes, _safe_ext, save_upload, _save_uploads
+from app.quizes.hashing import question_content_hash, question_text_key
+from app.quizes.scoring import locale_values, score_answer
+from app.common.files import (
+    MEDIA_ROOT, MEDIA_URL, parse_cas_url, stream_uploads, save_upload, _save_uploads,
+    get_storage, new_upload_key, verify_upload,
+)
+from app.media.services import retain_media, release_media, release_uploads, unlink_media
+from app.media.images import pick_variant, variants_for
+from app.media.mirror import enqueue_external, mirrored_urls, wake_mirror
+from app.events.live import publish_state
+from app.events.timer import answer_window_open, stop_timer
+from app.quizes.batcher import PendingAnswer, publish_answers
+from app.quizes.live import live_engine, quiz_changed
+
+logger = logging.getLogger("uvicorn.error")
 
 
 
@@ -34,96 +50,119 @@ def _is_http_url(s: str) -> bool:
     except Exception:
         return False
 
-def _normalize(s: str) -> str:
-    # мягкая нормализация для open-ended
-    if s is None:
-        return ""
-    s = unicodedata.normalize("NFKC", s).casefold().strip()
-    # при желании — удаление диакритики:
-    s = "".join(ch for ch in unicodedata.normalize("NFD", s) if not unicodedata.combining(ch))
-    return s
+
+def _remove_legacy_question_files(question_id: int, urls: List[str]) -> int:
+    """
+    Удалить файлы вопроса вне CAS ("/media/questions/<id>/A.jpg") и его пустую папку.
+    Синхронно — вызывается через asyncio.to_thread.
+    """
+    deleted = 0
+    for url in urls:
+        if parse_cas_url(url):
+            continue
+        try:
+            p = urlparse(url).path  # только путь
+            if not p.startswith(MEDIA_URL + "/"):
+                continue
+            rel = p[len(MEDIA_URL) + 1 :]  # "questions/1/A.jpg"
+            fs_path = MEDIA_ROOT / rel
+            if fs_path.is_file():
+                fs_path.unlink(missing_ok=True)
+                deleted += 1
+        except Exception:
+            # не падаем из-за файлов
+            pass
+
+    # попытка удалить пустую папку вопроса
+    folder = MEDIA_ROOT / "questions" / str(question_id)
+    try:
+        if folder.exists():
+            next(folder.iterdir(), None) is None and folder.rmdir()
+    except Exception:
+        pass
+    return deleted
+
+def _prepare_question(
+    qtype: QuestionType | str,
+    text_i18n: dict,
+    options_i18n: Optional[dict],
+    correct_answers_i18n: Optional[dict],
+    duration_seconds: Optional[int],
+    points: Optional[int],
+    images_urls: List[str],
+) -> dict:
+    """Элемент импорта (JSON или манифест с файлами) в вид для upsert по content_hash."""
+    try:
+        qtype = QuestionType(qtype) if isinstance(qtype, str) else qtype
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Unknown question type: {qtype}")
+    options_i18n = options_i18n or {}
+    correct_answers_i18n = correct_answers_i18n or {}
+    return {
+        "hash": question_content_hash(qtype, text_i18n, options_i18n, correct_answers_i18n),
+        "type": qtype,
+        "text_i18n": text_i18n,
+        "options_i18n": options_i18n,
+        "correct_answers_i18n": correct_answers_i18n,
+        "duration_seconds": duration_seconds,
+        "points": points or 1,
+        "images_urls": images_urls,
+    }
+
 
 class QuizService:
     def __init__(
         self,
         session: AsyncSession = Depends(get_async_session),
-        current_user: User = Depends(CurrentUser()),
+        current_user: Identity = Depends(CurrentUser()),
     ):
         self.session = session
         self.current_user = current_user
 
     async def _get_question(self, question_id: int) -> QuizQuestion:
-        res = await self.session.execute(select(QuizQuestion).where(QuizQuestion.id == question_id))
+        # горячие запросы (каждый ответ) — lambda_stmt: select(...) не пересобирается на каждый вызов
+        res = await self.session.execute(lambda_stmt(
+            lambda: select(QuizQuestion).where(QuizQuestion.id == question_id)
+        ))
         q = res.scalar_one_or_none()
         if not q:
             raise HTTPException(status_code=404, detail="Question not found")
         return q
 
     def _get_locale_correct(self, question: QuizQuestion, locale: str, fallback: str = "ru") -> List[str]:
-        if not locale:
-            locale = fallback
-        return question.correct_answers_i18n.get(locale) or question.correct_answers_i18n.get(fallback) or []
+        return locale_values(question.correct_answers_i18n, locale, fallback)
 
     def _get_locale_options(self, question: QuizQuestion, locale: str, fallback: str = "ru") -> List[str]:
-        if not locale:
-            locale = fallback
-        return question.options_i18n.get(locale) or question.options_i18n.get(fallback) or []
+        return locale_values(question.options_i18n, locale, fallback)
 
     async def calculate_points(self, question: QuizQuestion, user_answer: str | List[str], locale: str) -> int:
-        qtype = question.type  # явный enum
-        correct = self._get_locale_correct(question, locale)
-
-        # приводим пользовательский ответ к списку строк
-        if isinstance(user_answer, list):
-            user_list = [str(x) for x in user_answer]
-        else:
-            user_list = [str(user_answer)]
-
-        if qtype == QuestionType.OPEN:
-            # зачёт, если хоть один из вариантов совпал после нормализации
-            u = _normalize(user_list[0]) if user_list else ""
-            return int(any(u == _normalize(ans) for ans in correct))
-
-        if qtype == QuestionType.SINGLE:
-            # ожидаем ровно 1 ответ
-            if len(user_list) != 1 or not correct:
-                return 0
-            return question.points if user_list[0] == correct[0] else 0
-
-        if qtype == QuestionType.MULTIPLE:
-            # сравниваем как множества; частичный зачёт — пропорцией
-            correct_set = set(correct)
-            user_set = set(user_list)
-            if not correct_set:
-                return 0
-            if user_set == correct_set:
-                return question.points
-            # частичный зачёт (можно отключить, если не надо)
-            overlap = len(user_set & correct_set)
-            return int(question.points * overlap / len(correct_set))
-
-        return 0  # на всякий случай
+        return score_answer(question.type, question.points, self._get_locale_correct(question, locale), user_answer)
 
     async def submit_answer(self, data: schemas.UserAnswerCreate) -> dict:
+        # квиз ведёт живая сессия этого воркера — ответ принимается в памяти, в БД уйдёт пачкой
+        live = live_engine.get(data.quiz_id)
+        if live is not None and data.question_id in live.questions:
+            if not await answer_window_open(data.quiz_id, data.question_id):
+                raise HTTPException(status_code=409, detail="Answer window is closed")
+            result = await live.submit(self.current_user.id, data.question_id, data.answers, getattr(data, "locale", "ru"))
+            if result is not None:
+                return result
+
         question = await self._get_question(data.question_id)
+        # квиз под серверным таймером: отвечать можно только на открытый вопрос до дедлайна
+        if not await answer_window_open(question.quiz_id, question.id):
+            raise HTTPException(status_code=409, detail="Answer window is closed")
 
-        # 1) запрет повторного ответа на тот же вопрос
-        already = await self.session.scalar(
-            select(func.count()).select_from(QuizUserAnswer).where(
-                QuizUserAnswer.user_id == self.current_user.id,
-                QuizUserAnswer.question_id == question.id,
-            )
-        ) or 0
-        # if already > 0:
-        #     raise HTTPException(409, "You already answered this question")
+        # повторный ответ на тот же вопрос не запрещён — он просто расходует лимит
+        user_id, question_id = self.current_user.id, question.id
 
-        # 2) проверка глобального лимита ответов
+        # 1) проверка глобального лимита ответов
         limits = await self._get_quiz_limits(question.quiz_id, self.current_user.id)
         remaining_before = int(limits.get("remaining_allowed", 0))
         # if remaining_before <= 0:
         #     raise HTTPException(403, "Answer limit for this quiz has been reached")
 
-        # 3) сохранить ответ
+        # 2) сохранить ответ
         answers_list = data.answers if isinstance(data.answers, list) else [str(data.answers)]
         ua = QuizUserAnswer(
             user_id=self.current_user.id,
@@ -135,25 +174,30 @@ class QuizService:
         self.session.add(ua)
         await self.session.flush()
 
-        # 4) начислить очки только если лимит > 0
+        # 3) начислить очки только если лимит > 0 — атомарным UPDATE, без чтения строки пользователя
         pts = 0
         if remaining_before > 0:
             pts = await self.calculate_points(question, data.answers, getattr(data, "locale", "ru"))
-            self.current_user.points = (self.current_user.points or 0) + pts
-            self.session.add(self.current_user)
+        total_points = await self.session.scalar(lambda_stmt(
+            lambda: update(User)
+            .where(User.id == user_id)
+            .values(points=func.coalesce(User.points, 0) + pts)
+            .returning(User.points)
+        ))
+        # владелец живой сессии квиза (другой воркер) учтёт ответ в прогрессе игрока
+        await publish_answers(self.session, [PendingAnswer(user_id, question.quiz_id, question_id, answers_list, ua.locale, pts)])
 
         await self.session.commit()
         await self.session.refresh(ua)
-        await self.session.refresh(self.current_user)
 
-        # 5) получить новый лимит
+        # 4) получить новый лимит
         limits_after = await self._get_quiz_limits(question.quiz_id, self.current_user.id)
         remaining = int(limits_after.get("remaining_allowed", 0))
 
         return {
             "answer_id": ua.id,
             "awarded_points": pts,
-            "user_total_points": self.current_user.points,
+            "user_total_points": total_points,
             "remaining_questions": remaining,
             "isCompleted": remaining <= 0,
             "limits": limits_after,
@@ -164,13 +208,6 @@ class QuizService:
         return await self._get_quiz_limits(quiz_id, user_id)
 
 
-    async def _get_question(self, question_id: int) -> QuizQuestion:
-        res = await self.session.execute(select(QuizQuestion).where(QuizQuestion.id == question_id))
-        q = res.scalar_one_or_none()
-        if not q:
-            raise HTTPException(status_code=404, detail="Question not found")
-        return q
-
     async def create_quiz_question(
         self,
         data: schemas.QuizQuestionCreate,
@@ -190,8 +227,9 @@ class QuizService:
             saved = await _save_uploads(request, images, subdir="questions")
             images_urls.extend(saved)
 
+        qtype = QuestionType(data.type) if isinstance(data.type, str) else data.type
         q = QuizQuestion(
-            type=QuestionType(data.type) if isinstance(data.type, str) else data.type,
+            type=qtype,
             text_i18n=data.text_i18n or {},
             options_i18n=data.options_i18n or {},
             correct_answers_i18n=data.correct_answers_i18n or {},
@@ -199,9 +237,19 @@ class QuizService:
             points=data.points,
             quiz_id=data.quiz_id,
             images_urls=images_urls,
+            content_hash=question_content_hash(qtype, data.text_i18n, data.options_i18n, data.correct_answers_i18n),
         )
         self.session.add(q)
-        await self.session.commit()
+        await retain_media(self.session, dict.fromkeys(images_urls))
+        await enqueue_external(self.session, images_urls)
+        # живая сессия квиза перезагрузит вопросы
+        await quiz_changed(self.session, data.quiz_id)
+        try:
+            await self.session.commit()
+        except IntegrityError:
+            await self.session.rollback()
+            raise HTTPException(status_code=409, detail="Such question already exists in this quiz")
+        wake_mirror()
         await self.session.refresh(q)
         return q
 
@@ -230,8 +278,18 @@ class QuizService:
         res = await self.session.execute(stmt)
         items = res.scalars().all()
 
+        # внешние картинки, которые уже скачаны к нам, отдаём локальными URL
+        mirrored = await mirrored_urls(self.session, (u for q in items for u in (q.images_urls or [])))
+
         # Pydantic v2: from_attributes=True, чтобы читать из ORM-объектов
-        return [schemas.QuizQuestionOut.model_validate(q, from_attributes=True) for q in items]
+        out = [schemas.QuizQuestionOut.model_validate(q, from_attributes=True) for q in items]
+        if mirrored:
+            for o in out:
+                o.images_variants = {**o.images_variants, **{
+                    u: variants_for(mirrored[u]) for u in o.images_urls if u in mirrored
+                }}
+                o.images_urls = [mirrored.get(u, u) for u in o.images_urls]
+        return out
 
     async def toggle_quiz_active(self, *, quiz_id: int, is_active: bool) -> dict:
         # находим целевой квиз
@@ -259,65 +317,158 @@ class QuizService:
             quiz.is_active = True
         else:
             quiz.is_active = False
+            await stop_timer(self.session, quiz.event_id, quiz_id=quiz.id)
 
         self.session.add(quiz)
+        # старт/стоп квиза — клиенты события узнают через поток /events/{id}/stream
+        await publish_state(self.session, quiz.event_id)
+        # выключенный квиз его владелец дописывает в БД и отпускает
+        await quiz_changed(self.session, quiz.id)
         await self.session.commit()
         await self.session.refresh(quiz)
+        if quiz.is_active:
+            # вопросы и прогресс игроков — в память этого воркера, один раз на включение
+            try:
+                await live_engine.activate(quiz.id)
+            except Exception:
+                logger.exception(f"Live quiz {quiz.id}: failed to load on activation")
         return {"id": quiz.id, "event_id": quiz.event_id, "is_active": quiz.is_active}
     
     async def bulk_add_questions(self, quiz_id: int, payload: schemas.QuizQuestionsBulkIn) -> dict:
-        # 1) проверим, что квиз существует
-        res = await self.session.execute(select(Quiz).where(Quiz.id == quiz_id))
-        quiz = res.scalar_one_or_none()
-        if not quiz:
+        """
+        Импорт как upsert по content_hash (см. app/quizes/hashing.py):
+        - тот же контент уже есть в квизе → вопрос не трогаем, лишь обновляем
+          duration_seconds / points / images_urls, если они поменялись;
+        - тот же текст, но другие варианты/ответы → обновляем существующий вопрос;
+        - иначе создаём новый.
+        Повторный импорт неизменённого пакета — один SELECT и ни одной записи.
+        """
+        # проверим, что квиз существует
+        if not await self.session.scalar(select(Quiz.id).where(Quiz.id == quiz_id)):
             raise HTTPException(status_code=404, detail="Quiz not found")
 
-        created_ids: list[int] = []
-        try:
-            for item in payload.items:
-                # item — это Pydantic-модель (QuizQuestionUpsert / QuizQuestionCreate и т.п.)
-
-                # тип вопроса
-                qtype = item.type
-                if isinstance(qtype, str):
-                    qtype = QuestionType(qtype)
-
-                # text/options/correct берем напрямую из модели
-                text_i18n = item.text_i18n
-                options_i18n = item.options_i18n or {}
-                correct_answers_i18n = item.correct_answers_i18n or {}
-
-                # ВАЖНО: images_urls руками приводим к строкам
-                raw_urls = getattr(item, "images_urls", None)
-                if raw_urls:
-                    images_urls = [str(u) for u in raw_urls]
-                else:
-                    images_urls = []
-
-                question = QuizQuestion(
-                    type=qtype,
-                    text_i18n=text_i18n,
-                    options_i18n=options_i18n,
-                    correct_answers_i18n=correct_answers_i18n,
-                    duration_seconds=item.duration_seconds,
-                    points=item.points or 1,
-                    quiz_id=quiz_id,
-                    images_urls=images_urls,
-                )
+        prepared = []
+        for item in payload.items:
+            raw_urls = getattr(item, "images_urls", None)
+            prepared.append(_prepare_question(
+                item.type, item.text_i18n, item.options_i18n, item.correct_answers_i18n,
+                item.duration_seconds, item.points, [str(u) for u in raw_urls] if raw_urls else [],
+            ))
+        return await self._upsert_questions(quiz_id, prepared)
+
+    async def _upsert_questions(self, quiz_id: int, prepared: List[dict]) -> dict:
+        """Сопоставить подготовленные вопросы (_prepare_question) с вопросами квиза и записать."""
+        # 1) текущие вопросы квиза, индексы по хешу контента и по тексту
+        res = await self.session.execute(
+            select(QuizQuestion).where(QuizQuestion.quiz_id == quiz_id).order_by(QuizQuestion.id)
+        )
+        existing = res.scalars().all()
 
-                self.session.add(question)
-                await self.session.flush()  # получить id без коммита
-                created_ids.append(question.id)
+        by_hash: dict[str, QuizQuestion] = {}
+        for row in existing:
+            h = row.content_hash or question_content_hash(
+                row.type, row.text_i18n, row.options_i18n, row.correct_answers_i18n
+            )
+            if h in by_hash:
+                continue  # старые дубликаты (до появления хеша) оставляем как есть
+            if row.content_hash != h:
+                row.content_hash = h  # досчитываем хеш для строк, созданных до миграции
+            by_hash[h] = row
+
+        # вопросы, которые совпали по хешу, не могут быть «отредактированными» для других элементов
+        incoming_hashes = {p["hash"] for p in prepared}
+        by_text: dict[str, QuizQuestion] = {}
+        for h, row in by_hash.items():
+            if h not in incoming_hashes:
+                by_text.setdefault(question_text_key(row.text_i18n), row)
+
+        created: list[QuizQuestion] = []
+        updated_ids: list[int] = []
+        updated_fields: dict[int, list[str]] = {}
+        unchanged_ids: list[int] = []
+        duplicates = 0
+        seen: set[str] = set()
+        # счётчики ссылок на картинки из CAS
+        retained: list[str] = []
+        released: list[str] = []
 
+        try:
+            for p in prepared:
+                if p["hash"] in seen:
+                    duplicates += 1
+                    continue
+                seen.add(p["hash"])
+
+                row = by_hash.get(p["hash"])
+                fields = ["duration_seconds", "points", "images_urls"]
+                if row is None:
+                    row = by_text.pop(question_text_key(p["text_i18n"]), None)
+                    fields = ["type", "text_i18n", "options_i18n", "correct_answers_i18n", *fields]
+
+                if row is None:
+                    question = QuizQuestion(
+                        type=p["type"],
+                        text_i18n=p["text_i18n"],
+                        options_i18n=p["options_i18n"],
+                        correct_answers_i18n=p["correct_answers_i18n"],
+                        duration_seconds=p["duration_seconds"],
+                        points=p["points"],
+                        quiz_id=quiz_id,
+                        images_urls=p["images_urls"],
+                        content_hash=p["hash"],
+                    )
+                    self.session.add(question)
+                    created.append(question)
+                    retained.extend(dict.fromkeys(p["images_urls"]))
+                    continue
+
+                changed = [f for f in fields if getattr(row, f) != p[f]]
+                if changed:
+                    if "images_urls" in changed:
+                        old_urls, new_urls = set(row.images_urls or []), set(p["images_urls"])
+                        retained.extend(new_urls - old_urls)
+                        released.extend(old_urls - new_urls)
+                    for f in changed:
+                        setattr(row, f, p[f])
+                    row.content_hash = p["hash"]
+                    updated_ids.append(row.id)
+                    updated_fields[row.id] = changed
+                else:
+                    unchanged_ids.append(row.id)
+
+            await retain_media(self.session, retained)
+            await enqueue_external(self.session, retained)
+            orphaned = await release_media(self.session, released)
+            await self.session.flush()  # получить id новых вопросов без коммита
+            orphaned += await release_uploads(self.session, released)
+            if created or updated_ids:
+                # новые вопросы и ответы — в живую сессию квиза
+                await quiz_changed(self.session, quiz_id)
             await self.session.commit()
+        except IntegrityError:
+            # параллельный импорт того же пакета успел вставить такой же вопрос
+            await self.session.rollback()
+            raise HTTPException(status_code=409, detail="Concurrent import of the same questions, retry")
         except Exception:
             await self.session.rollback()
             raise
 
-        return {"created": len(created_ids), "ids": created_ids}
+        await unlink_media(orphaned)
+        wake_mirror()
+
+        created_ids = [q.id for q in created]
+        return {
+            "created": len(created_ids),
+            "ids": created_ids,
+            "updated": len(updated_ids),
+            "updated_ids": updated_ids,
+            "updated_fields": updated_fields,
+            "unchanged": len(unchanged_ids),
+            "unchanged_ids": unchanged_ids,
+            "duplicates_in_payload": duplicates,
+        }
 
-        
-    async def list_questions_by_quiz_locale(self, quiz_id: int, locale: str = "ru", include_correct: bool = False) -> list[schemas.QuizQuestionLocalizedOut]:
+    async def list_questions_by_quiz_locale(self, quiz_id: int, locale: str = "ru", include_correct: bool = False, image_width: Optional[int] = None) -> list[schemas.QuizQuestionLocalizedOut]:
         stmt = (
             select(QuizQuestion)
             .where(QuizQuestion.quiz_id == quiz_id)
@@ -326,6 +477,9 @@ class QuizService:
         res = await self.session.execute(stmt)
         items = res.scalars().all()
 
+        # внешние картинки, которые уже скачаны к нам, отдаём локальными URL
+        mirrored = await mirrored_urls(self.session, (u for q in items for u in (q.images_urls or [])))
+
         out: list[schemas.QuizQuestionLocalizedOut] = []
         for q in items:
             # текст с фолбэком на первую доступную локаль
@@ -341,7 +495,12 @@ class QuizService:
                 "options": options,
                 "duration_seconds": q.duration_seconds,
                 "points": q.points,
-                "images_urls": q.images_urls or [],
+                # клиент попросил ширину — отдаём ближайшую уменьшенную копию вместо оригинала
+                "images_urls": [pick_variant(mirrored.get(u, u), image_width) for u in (q.images_urls or [])],
+                "images_variants": {
+                    **(q.images_variants or {}),
+                    **{u: variants_for(mirrored[u]) for u in (q.images_urls or []) if u in mirrored},
+                },
             }
 
             # если надо получить и правильные ответы (например, для админки):
@@ -375,20 +534,9 @@ class QuizService:
                 # request нужен только для файлов (для URL не обязателен)
                 raise HTTPException(500, detail="Request is required when uploading files")
 
-            subdir = f"questions/{question_id}"
-            folder = MEDIA_ROOT / subdir
-            folder.mkdir(parents=True, exist_ok=True)
-
-            for i, f in enumerate(images):
-                label = ascii_uppercase[i] if i < 26 else f"extra_{i}"
-                ext = _safe_ext(f.filename, f.content_type)
-                filename = f"{label}{ext}"
-                dest = folder / filename
-
-                content = await f.read()
-                await _async_write_bytes(dest, content)
-
-                new_urls.append(f"{MEDIA_URL}/{subdir}/{filename}")
+            # порядок URL-ов = порядок файлов (A, B, C...), одинаковые картинки получают один URL
+            saved = await stream_uploads(images)
+            new_urls.extend(m.url for m in saved)
 
         # 2) URL из интернета → просто приклеиваем как есть (валидируем схему)
         if urls:
@@ -398,17 +546,46 @@ class QuizService:
                     new_urls.append(u)
 
         # 3) объединяем с уже существующими и удаляем дубликаты, сохраняя порядок
+        return await self._append_images(question, new_urls)
+
+    async def _append_images(self, question: QuizQuestion, new_urls: List[str]) -> QuizQuestion:
         existing = question.images_urls or []
         merged = []
         for u in [*existing, *new_urls]:
             if u not in merged:
                 merged.append(u)
         question.images_urls = merged
+        await retain_media(self.session, merged[len(existing):])
+        await enqueue_external(self.session, merged[len(existing):])
 
         self.session.add(question)
         await self.session.commit()
+        wake_mirror()
         await self.session.refresh(question)
         return question
+
+    async def presign_question_images(self, question_id: int, content_types: List[str]) -> list:
+        """
+        Подписанные формы для загрузки картинок вопроса прямо в хранилище (байты мимо API).
+        После загрузки клиент присылает ключи в attach_image_keys.
+        """
+        exists = await self.session.scalar(select(QuizQuestion.id).where(QuizQuestion.id == question_id))
+        if not exists:
+            raise HTTPException(404, "Question not found")
+        storage = get_storage()
+        return [await storage.presign_upload(new_upload_key(ct), ct) for ct in content_types]
+
+    async def attach_image_keys(self, question_id: int, keys: List[str]) -> QuizQuestion:
+        res = await self.session.execute(
+            select(QuizQuestion).where(QuizQuestion.id == question_id)
+        )
+        question = res.scalar_one_or_none()
+        if not question:
+            raise HTTPException(404, "Question not found")
+
+        # проверки объектов (HEAD + первые байты) независимы — параллельно
+        urls = await asyncio.gather(*(verify_upload(k) for k in dict.fromkeys(keys)))
+        return await self._append_images(question, list(urls))
     
     async def bulk_add_questions_with_files(self, quiz_id: int, request, manifest_str: str, files: List):
         # 1) валидация квиза
@@ -431,58 +608,72 @@ class QuizService:
         # 3) сопоставление имени файла -> UploadFile
         file_map = {f.filename: f for f in (files or []) if f and f.filename}
 
-        created_ids = []
-        try:
-            for item in items:
-                data = {
-                    "type": item["type"],
-                    "text_i18n": item.get("text_i18n", {}),
-                    "options_i18n": item.get("options_i18n", {}),
-                    "correct_answers_i18n": item.get("correct_answers_i18n", {}),
-                    "duration_seconds": item.get("duration_seconds", defaults.get("duration_seconds")),
-                    "points": item.get("points", defaults.get("points", 1)),
-                    "quiz_id": quiz_id,
-                }
-                q = QuizQuestion(
-                    type=QuestionType(data["type"]) if isinstance(data["type"], str) else data["type"],
-                    text_i18n=data["text_i18n"],
-                    options_i18n=data["options_i18n"],
-                    correct_answers_i18n=data["correct_answers_i18n"],
-                    duration_seconds=data["duration_seconds"],
-                    points=data["points"],
-                    quiz_id=data["quiz_id"],
-                )
-                self.session.add(q)
-                await self.session.flush()   # получить q.id
-
-                # 4) сохраняем все прикреплённые картинки
-                image_names = item.get("images", []) or []
-                saved_urls = []
-                for name in image_names:
-                    uf = file_map.get(name)
-                    if not uf:
-                        continue  # можно ругаться, можно пропускать
-                    url = await save_upload(request, uf, subdir=f"questions/{q.id}")
-                    # если у тебя images хранятся JSON-списком URL — добавь поле images_json у модели
-                    saved_urls.append(url)
-
-                # если модель хранит одно поле image_url — сохрани первую
-                if saved_urls:
-                    q.image_url = saved_urls[0]
-
-                await self.session.flush()
-                created_ids.append(q.id)
+        # 4) сохраняем прикреплённые картинки (CAS: одинаковый файл — тот же URL, id вопроса не нужен)
+        #    и прогоняем пакет через тот же upsert по content_hash, что и JSON-импорт
+        prepared = []
+        for item in items:
+            try:
+                qtype = item["type"]
+            except (KeyError, TypeError):
+                raise HTTPException(400, "Each item must have a type")
+            saved_urls = []
+            for name in item.get("images", []) or []:
+                uf = file_map.get(name)
+                if not uf:
+                    continue  # можно ругаться, можно пропускать
+                saved_urls.append(await save_upload(request, uf, subdir="questions"))
+            prepared.append(_prepare_question(
+                qtype,
+                item.get("text_i18n", {}),
+                item.get("options_i18n", {}),
+                item.get("correct_answers_i18n", {}),
+                item.get("duration_seconds", defaults.get("duration_seconds")),
+                item.get("points", defaults.get("points", 1)),
+                list(dict.fromkeys(saved_urls)),
+            ))
+
+        return await self._upsert_questions(quiz_id, prepared)
 
-            await self.session.commit()
-        except Exception:
-            await self.session.rollback()
-            raise
+    async def delete_question(self, question_id: int, remove_files: bool = True) -> dict:
+        res = await self.session.execute(
+            select(QuizQuestion).where(QuizQuestion.id == question_id)
+        )
+        q = res.scalar_one_or_none()
+        if not q:
+            raise HTTPException(404, "Question not found")
+
+        urls = list(dict.fromkeys(q.images_urls or []))
+
+        # файлы из CAS общие для многих вопросов: снимаем ссылку, файл удалится только
+        # когда ссылок не останется (после коммита)
+        orphaned = await release_media(self.session, urls)
+
+        await self.session.delete(q)
+        await self.session.flush()
+        # прямые загрузки без счётчиков: удаляем, если других ссылок на ключ не осталось
+        orphaned += await release_uploads(self.session, urls)
+        # живая сессия квиза не должна принимать ответы на удалённый вопрос
+        await quiz_changed(self.session, q.quiz_id)
+        await self.session.commit()
+
+        deleted_files = 0
+        if remove_files:
+            deleted_files += await unlink_media(orphaned)
+
+            # старые файлы вида "/media/questions/<question_id>/A.jpg" принадлежат только этому вопросу;
+            # файловые операции — в потоке, не на event loop
+            deleted_files += await asyncio.to_thread(_remove_legacy_question_files, question_id, urls)
+
+        return {
+            "status": "success",
+            "deleted_id": question_id,
+            "deleted_files": deleted_files,
+        }
 
-        return {"created": len(created_ids), "ids": created_ids}
-    
     async def get_leaderboard(self, limit: int = 10):
         stmt = (
             select(User)
+            .options(*user_leaderboard_load())
             .where(User.is_active == True)
             .order_by(desc(User.points))
             .limit(limit)   
@@ -502,27 +693,26 @@ class QuizService:
         ]
     
     async def _get_quiz_limits(self, quiz_id: int, user_id: int) -> dict:
-        # всего вопросов в квизе
-        total: int = await self.session.scalar(
-            select(func.count()).select_from(QuizQuestion).where(QuizQuestion.quiz_id == quiz_id)
-        ) or 0
-
-        # уже отвечено этим пользователем
-        answered: int = await self.session.scalar(
-            select(func.count()).select_from(QuizUserAnswer).where(
-                QuizUserAnswer.quiz_id == quiz_id,
-                QuizUserAnswer.user_id == user_id,
-            )
-        ) or 0
-
-        # лимит из квиза
-        quiz: Quiz | None = await self.session.get(Quiz, quiz_id)
-        if not quiz:
+        # лимит квиза, всего вопросов и уже отвечено этим пользователем — одним запросом
+        # (вызывается дважды на каждый ответ, поэтому lambda_stmt)
+        row = (await self.session.execute(lambda_stmt(
+            lambda: select(
+                Quiz.answer_limit,
+                select(func.count()).select_from(QuizQuestion)
+                .where(QuizQuestion.quiz_id == quiz_id)
+                .scalar_subquery(),
+                select(func.count()).select_from(QuizUserAnswer)
+                .where(QuizUserAnswer.quiz_id == quiz_id, QuizUserAnswer.user_id == user_id)
+                .scalar_subquery(),
+            ).where(Quiz.id == quiz_id)
+        ))).first()
+        if row is None:
             raise HTTPException(404, "Quiz not found")
+        answer_limit, total, answered = row[0], row[1] or 0, row[2] or 0
 
         # эффективный лимит: если answer_limit задан — используем его,
         # иначе равен общему числу вопросов в квизе
-        effective_limit = quiz.answer_limit if quiz.answer_limit is not None else total
+        effective_limit = answer_limit if answer_limit is not None else total
 
         remaining_allowed = max(effective_limit - answered, 0)
 
@@ -634,48 +824,6 @@ class QuizExportService:
 
         return buf.getvalue(), filename
     
-    async def delete_question(self, question_id: int, remove_files: bool = True) -> dict:
-        res = await self.session.execute(
-            select(QuizQuestion).where(QuizQuestion.id == question_id)
-        )
-        q = res.scalar_one_or_none()
-        if not q:
-            raise HTTPException(404, "Question not found")
-
-        deleted_files = 0
-        if remove_files and q.images_urls:
-            for url in q.images_urls:
-                # ожидаем вида "/media/questions/<question_id>/A.jpg"
-                try:
-                    p = urlparse(url).path  # только путь
-                    if not p.startswith(MEDIA_URL + "/"):
-                        continue
-                    rel = p[len(MEDIA_URL) + 1 :]  # "questions/1/A.jpg"
-                    fs_path = MEDIA_ROOT / rel
-                    if fs_path.is_file():
-                        fs_path.unlink(missing_ok=True)
-                        deleted_files += 1
-                except Exception:
-                    # не падаем из-за файлов
-                    pass
-
-            # попытка удалить пустую папку вопроса
-            folder = MEDIA_ROOT / "questions" / str(question_id)
-            try:
-                if folder.exists():
-                    next(folder.iterdir(), None) is None and folder.rmdir()
-            except Exception:
-                pass
-
-        await self.session.delete(q)
-        await self.session.commit()
-
-        return {
-            "status": "success",
-            "deleted_id": question_id,
-            "deleted_files": deleted_files,
-        }
-    
     async def export_leaderboard_xlsx(
         self,
         *,
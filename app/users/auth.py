@@ -0,0 +1,103 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Optional
+from urllib.parse import parse_qsl
+
+from fastapi import HTTPException
+
+from app.common.identity import Identity
+
+BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
+# initData старше этого не принимаем (повтор перехваченной строки)
+INIT_DATA_MAX_AGE = int(os.getenv("AUTH_INIT_DATA_MAX_AGE_SECONDS", "86400"))
+AUTH_TOKEN_TTL = int(os.getenv("AUTH_TOKEN_TTL_SECONDS", "900"))
+# ключ подписи токенов; по умолчанию выводится из токена бота (одинаков во всех воркерах)
+_TOKEN_SECRET = (
+    os.getenv("AUTH_TOKEN_SECRET", "").encode("utf-8")
+    or hmac.new(b"session-token", BOT_TOKEN.encode("utf-8"), hashlib.sha256).digest()
+)
+_TOKEN_VERSION = "v1"
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+def verify_init_data(init_data: str, bot_token: str = BOT_TOKEN, max_age: int = INIT_DATA_MAX_AGE) -> dict:
+    """
+    Проверка Telegram WebApp initData (https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app):
+    secret = HMAC_SHA256("WebAppData", bot_token), hash = HMAC_SHA256(secret, data_check_string).
+    Возвращает объект user из initData.
+    """
+    fields = dict(parse_qsl(init_data or "", keep_blank_values=True))
+    received = fields.pop("hash", None)
+    if not received or not bot_token:
+        raise HTTPException(status_code=401, detail="Invalid initData")
+
+    data_check_string = "\n".join(f"{k}={fields[k]}" for k in sorted(fields))
+    secret = hmac.new(b"WebAppData", bot_token.encode("utf-8"), hashlib.sha256).digest()
+    expected = hmac.new(secret, data_check_string.encode("utf-8"), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, received):
+        raise HTTPException(status_code=401, detail="Invalid initData")
+
+    try:
+        auth_date = int(fields.get("auth_date", "0"))
+        user = json.loads(fields["user"])
+        int(user["id"])
+    except (KeyError, ValueError, TypeError):
+        raise HTTPException(status_code=401, detail="Invalid initData")
+    if time.time() - auth_date > max_age:
+        raise HTTPException(status_code=401, detail="initData expired")
+    return user
+
+
+def issue_token(identity: Identity, ttl: int = AUTH_TOKEN_TTL) -> str:
+    """
+    v1.<payload>.<signature> — payload: id, telegram_id, флаги и время выдачи/истечения.
+    """
+    now = int(time.time())
+    payload = {
+        "uid": identity.id,
+        "tid": identity.telegram_id,
+        "adm": identity.is_admin,
+        "act": identity.is_active,
+        "iat": now,
+        "exp": now + ttl,
+    }
+    body = f"{_TOKEN_VERSION}.{_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8'))}"
+    sig = hmac.new(_TOKEN_SECRET, body.encode("ascii"), hashlib.sha256).digest()
+    return f"{body}.{_b64encode(sig)}"
+
+
+def verify_token(token: str) -> tuple[Identity, int]:
+    """
+    Проверка подписи и срока — только в памяти, без БД. Возвращает (Identity, iat).
+    """
+    try:
+        version, payload_b64, sig_b64 = token.split(".")
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if version != _TOKEN_VERSION:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    expected = hmac.new(_TOKEN_SECRET, f"{version}.{payload_b64}".encode("ascii"), hashlib.sha256).digest()
+    try:
+        ok = hmac.compare_digest(expected, _b64decode(sig_b64))
+        payload = json.loads(_b64decode(payload_b64)) if ok else None
+    except (ValueError, TypeError):
+        ok = False
+    if not ok:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    if payload["exp"] < time.time():
+        raise HTTPException(status_code=401, detail="Token expired")
+    identity = Identity(int(payload["uid"]), int(payload["tid"]), bool(payload["adm"]), bool(payload["act"]))
+    return identity, int(payload["iat"])
@@ -1,10 +1,12 @@
-from app.users.models import User, AdminChat
+from app.users.models import User, AdminChat, AdminNotification, ModStatus
+from app.common.identity import identities_changed
+from app.media.services import cascade_media_urls, questions_of_creators, release_cascade_media, unlink_media
 from app.users import schemas
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update, delete, func
 from fastapi import HTTPException
 from sqlalchemy.dialects.postgresql import insert
-from typing import Sequence, Iterable
+from typing import Sequence, Iterable, Optional
 
 
 # ---------- User ----------
@@ -34,12 +36,81 @@ async def activate_user_by_telegram_id(session: AsyncSession, telegram_id: int)
   return res.scalar_one_or_none() is not None
 
 async def delete_user_by_telegram_id(session: AsyncSession, telegram_id: int) -> bool:
+  # счётчики ссылок картинок вопросов его событий (удалятся каскадом); объекты соберёт GC
+  urls = await cascade_media_urls(session, questions_of_creators([telegram_id]))
   res = await session.execute(
     delete(User)
       .where(User.telegram_id == telegram_id)
       .returning(User.telegram_id)
   )
-  return res.scalar_one_or_none() is not None
+  if res.scalar_one_or_none() is None:
+    return False
+  await release_cascade_media(session, urls)
+  return True
+
+
+# ---------- Moderation ----------
+def _pending_users(telegram_ids: Optional[Sequence[int]], nickname_contains: Optional[str]):
+  q = select(User).where(User.is_active.is_(False), User.is_admin.is_(False))
+  if telegram_ids is not None:
+    q = q.where(User.telegram_id.in_(telegram_ids))
+  if nickname_contains:
+    # % и _ в подстроке — буквально, не шаблон
+    q = q.where(User.nickname.icontains(nickname_contains, autoescape=True))
+  return q
+
+async def list_pending_users(
+  session: AsyncSession, *, nickname_contains: Optional[str] = None, limit: int = 50, offset: int = 0,
+) -> tuple[int, list[User]]:
+  base = _pending_users(None, nickname_contains)
+  total = (await session.execute(select(func.count()).select_from(base.subquery()))).scalar_one()
+  res = await session.execute(base.order_by(User.id).limit(limit).offset(offset))
+  return total, list(res.scalars().all())
+
+async def moderate_pending_users(
+  session: AsyncSession,
+  status: ModStatus,
+  *,
+  telegram_ids: Optional[Sequence[int]] = None,
+  nickname_contains: Optional[str] = None,
+  all_pending: bool = False,
+  limit: int = 500,
+) -> tuple[list[int], list[tuple[int, int, int]]]:
+  """
+  Одобрить (is_active = TRUE) или отклонить (DELETE) пачку ожидающих пользователей
+  одним UPDATE/DELETE ... RETURNING; без коммита. Строки, которые сейчас модерирует
+  кто-то другой, пропускаются (SKIP LOCKED). Возвращает telegram_id затронутых и
+  их уведомления (user_tid, admin_chat_id, message_id) — для правки сообщений.
+  Без фильтров — только с all_pending=True: пустой фильтр не должен задеть всю очередь.
+  """
+  if not all_pending and telegram_ids is None and not nickname_contains:
+    raise ValueError("moderate_pending_users: no filter given and all_pending is not set")
+  ids = (
+    _pending_users(telegram_ids, nickname_contains)
+      .with_only_columns(User.id)
+      .order_by(User.id)
+      .limit(limit)
+      .with_for_update(skip_locked=True)
+      .scalar_subquery()
+  )
+  if status is ModStatus.approved:
+    stmt = update(User).where(User.id.in_(ids)).values(is_active=True)
+  else:
+    stmt = delete(User).where(User.id.in_(ids))
+  res = await session.execute(stmt.returning(User.telegram_id).execution_options(synchronize_session=False))
+  tids = list(res.scalars().all())
+  if not tids:
+    return [], []
+
+  await identities_changed(session, tids)
+  res = await session.execute(
+    update(AdminNotification)
+      .where(AdminNotification.user_tid.in_(tids))
+      .values(status=status.value)
+      .returning(AdminNotification.user_tid, AdminNotification.admin_chat_id, AdminNotification.message_id)
+      .execution_options(synchronize_session=False)
+  )
+  return tids, [tuple(r) for r in res.all()]
 
 
 async def get_user(session: AsyncSession, telegram_id: int) -> User:
@@ -75,8 +146,12 @@ async def delete_user(session: AsyncSession, telegram_id: int):
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
+    urls = await cascade_media_urls(session, questions_of_creators([telegram_id]))
     await session.delete(user)
+    await session.flush()
+    orphaned = await release_cascade_media(session, urls)
     await session.commit()
+    await unlink_media(orphaned)
     return {"detail": "User deleted"}
 
 
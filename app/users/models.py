@@ -1,6 +1,10 @@
 import enum
-from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, BigInteger, UniqueConstraint
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.orm import Mapped, mapped_column, relationship, load_only
+from sqlalchemy import String, BigInteger, UniqueConstraint, Integer, Text, DateTime, func
+from sqlalchemy.dialects.postgresql import JSONB
 
 from app.common.db import Base
 from app.events.models import event_players
@@ -16,12 +20,18 @@ class User(Base):
     is_active: Mapped[bool] = mapped_column(default=False)
     is_admin: Mapped[bool] = mapped_column(default=False)
     points: Mapped[int] = mapped_column(default=0)
+    # unix-время последней смены прав/статуса: токены, выданные раньше, недействительны (app/common/identity.py)
+    tokens_valid_after: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+
+    # связи по умолчанию НЕ грузятся (raise_on_sql): нужна связь — явный selectinload(...) в запросе.
+    # passive_deletes — удаление пользователя не тянет коллекции, чистит ON DELETE CASCADE в БД
 
     # ивенты, которые он создал
     created_events: Mapped[list["Event"]] = relationship(
         back_populates="creator",
         cascade="all, delete-orphan",
-        lazy="selectin",
+        passive_deletes=True,
+        lazy="raise_on_sql",
         foreign_keys="[Event.creator_id]",
     )
 
@@ -29,11 +39,16 @@ class User(Base):
     events: Mapped[list["Event"]] = relationship(
         secondary="event_players",
         back_populates="players",
-        lazy="selectin",
+        passive_deletes=True,
+        lazy="raise_on_sql",
         primaryjoin="User.telegram_id==event_players.c.user_telegram_id",
         secondaryjoin="Event.id==event_players.c.event_id",
     )
 
+def user_leaderboard_load() -> tuple:
+    """Профиль загрузки для таблицы лидеров — только поля UserLeaderboardOut."""
+    return (load_only(User.telegram_id, User.nickname, User.first_name, User.last_name, User.points),)
+
 class AdminChat(Base):
     __tablename__ = "admin_chat"
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
@@ -55,4 +70,27 @@ class AdminNotification(Base):
     user_tid: Mapped[int] = mapped_column(BigInteger, index=True, nullable=False)
     admin_chat_id: Mapped[int] = mapped_column(BigInteger, index=True, nullable=False)
     message_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
-    status: Mapped[str] = mapped_column(String(16), default=ModStatus.pending.value, nullable=False)
\ No newline at end of file
+    status: Mapped[str] = mapped_column(String(16), default=ModStatus.pending.value, nullable=False)
+
+class OutboxStatus(str, enum.Enum):
+    pending = "pending"
+    sending = "sending"
+    done = "done"
+    failed = "failed"
+
+class NotificationOutbox(Base):
+    """
+    Исходящее уведомление в Telegram, записанное в той же транзакции, что и событие
+    (регистрация и т.п.). Отправляет фоновый диспетчер telegram/outbox.py.
+    """
+    __tablename__ = "notification_outbox"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    kind: Mapped[str] = mapped_column(String(32), nullable=False)
+    payload: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    status: Mapped[str] = mapped_column(String(16), default=OutboxStatus.pending.value, nullable=False, index=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
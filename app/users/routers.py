@@ -7,7 +7,7 @@ from app.common.db import get_async_session
 from app.users.services import UserService
 from app.users.services import AdminChatService
 from app.common.common import CurrentUser
-from app.users.models import User
+from app.common.identity import Identity
 
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -19,6 +19,11 @@ async def register(payload: schemas.UserRegisterIn, session: AsyncSession = Depe
   return user
 
 
+@router.post("/auth/telegram", response_model=schemas.TokenOut, summary="Вход по initData Telegram WebApp")
+async def login_telegram(payload: schemas.TelegramLoginIn, session: AsyncSession = Depends(get_async_session)):
+    return await UserService.login_with_init_data(session, payload.init_data)
+
+
 @router.post("/check_admin")
 async def check_admin(telegram_id: int, service: UserService = Depends()):
     return await service.check_admin(telegram_id)
@@ -29,6 +34,21 @@ async def list_users(service: UserService = Depends()):
     return await service.list_users()
 
 
+@router.get("/moderation/queue", response_model=schemas.ModerationQueueOut, summary="Очередь модерации (только для админов)")
+async def moderation_queue(
+    nickname_contains: str | None = Query(None, min_length=1, max_length=50),
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    service: UserService = Depends(),
+):
+    return await service.moderation_queue(nickname_contains, limit, offset)
+
+
+@router.post("/moderation/bulk", response_model=schemas.ModerationBulkOut, summary="Массово одобрить/отклонить ожидающих (только для админов)")
+async def moderation_bulk(payload: schemas.ModerationBulkIn, service: UserService = Depends()):
+    return await service.bulk_moderate(payload)
+
+
 @router.get("/{telegram_id}", response_model=schemas.UserRead)
 async def get_user(telegram_id: int, service: UserService = Depends()):
     return await service.get_user(telegram_id)
@@ -48,7 +68,7 @@ admin_router = APIRouter(prefix="/admin-chat", tags=["admin-chat"])
 @admin_router.get("/", summary="Список участников admin chat (сырой)")
 async def get_admin_chat_ids(
     session: AsyncSession = Depends(get_async_session),
-    _: User = Depends(CurrentUser(require_admin=True)),
+    _: Identity = Depends(CurrentUser(require_admin=True)),
 ):
     rows = await AdminChatService.list_all(session)
     return {"count": len(rows), "telegram_ids": [r.telegram_id for r in rows]}
@@ -56,7 +76,7 @@ async def get_admin_chat_ids(
 @admin_router.get("/users", response_model=list[schemas.UserOut], summary="Список участников admin chat c данными пользователя")
 async def get_admin_chat_users(
     session: AsyncSession = Depends(get_async_session),
-    _: User = Depends(CurrentUser(require_admin=True)),
+    _: Identity = Depends(CurrentUser(require_admin=True)),
 ):
     pairs = await AdminChatService.list_all_with_users(session)
     # берём только тех, у кого есть профиль
@@ -67,7 +87,7 @@ async def get_admin_chat_users(
 async def add_admin_chat_member(
     telegram_id: int,
     session: AsyncSession = Depends(get_async_session),
-    _: User = Depends(CurrentUser(require_admin=True)),
+    _: Identity = Depends(CurrentUser(require_admin=True)),
 ):
     await AdminChatService.add_one(session, telegram_id=telegram_id)
     return {"status": "ok", "telegram_id": telegram_id}
@@ -76,7 +96,7 @@ async def add_admin_chat_member(
 async def add_admin_chat_many(
     telegram_ids: List[int],
     session: AsyncSession = Depends(get_async_session),
-    _: User = Depends(CurrentUser(require_admin=True)),
+    _: Identity = Depends(CurrentUser(require_admin=True)),
 ):
     inserted = await AdminChatService.add_many(session, telegram_ids)
     return {"status": "ok", "inserted": inserted, "requested": len(telegram_ids)}
@@ -85,7 +105,7 @@ async def add_admin_chat_many(
 async def remove_admin_chat_member(
     telegram_id: int = Query(...),
     session: AsyncSession = Depends(get_async_session),
-    _: User = Depends(CurrentUser(require_admin=True)),
+    _: Identity = Depends(CurrentUser(require_admin=True)),
 ):
     ok = await AdminChatService.remove(session, telegram_id)
     if not ok:
@@ -1,6 +1,6 @@
-from typing import Optional, List
+from typing import Optional, List, Literal
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 class UserBase(BaseModel):
     telegram_id: int
@@ -50,6 +50,17 @@ class UserRead(BaseModel):
     class Config:
         orm_mode = True
 
+class TelegramLoginIn(BaseModel):
+    init_data: str = Field(min_length=1, description="window.Telegram.WebApp.initData как есть")
+
+class TokenOut(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int
+    telegram_id: int
+    is_admin: bool
+    is_active: bool
+
 class AdminChatIn(BaseModel):
     telegram_id: int
 
@@ -60,4 +71,27 @@ class AdminChatOut(BaseModel):
     telegram_id: int
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class ModerationQueueOut(BaseModel):
+    total: int
+    items: list[UserOut]
+
+class ModerationBulkIn(BaseModel):
+    action: Literal["approve", "reject"]
+    telegram_ids: Optional[list[int]] = Field(default=None, min_length=1, max_length=5000)
+    nickname_contains: Optional[str] = Field(default=None, min_length=1, max_length=50)
+    # все ожидающие (по порядку регистрации, не больше limit) — только явно, не по забытому фильтру
+    all: bool = False
+    limit: int = Field(default=500, ge=1, le=5000)
+
+    @model_validator(mode="after")
+    def require_filter(self):
+        if not self.all and self.telegram_ids is None and self.nickname_contains is None:
+            raise ValueError("Specify telegram_ids, nickname_contains or all=true.")
+        return self
+
+class ModerationBulkOut(BaseModel):
+    action: str
+    count: int
+    telegram_ids: list[int]
@@ -7,28 +7,32 @@ from sqlalchemy.dialects.postgresql import insert
 
 from app.common.db import get_async_session
 from app.common.common import CurrentUser
+from app.common.identity import Identity, get_identity, identity_changed
+from app.users.auth import AUTH_TOKEN_TTL, issue_token, verify_init_data
 from app.users import crud, schemas
 from app.users.models import User
-from app.users.models import AdminChat
-from telegram.moderation import notify_admins_new_user
+from app.media.services import cascade_media_urls, questions_of_creators, release_cascade_media, unlink_media
+from app.users.models import AdminChat, ModStatus
+from telegram.moderation import schedule_moderated_edits
+from telegram.outbox import enqueue_notification
 
 
 class UserService:
     def __init__(
         self,
         session: AsyncSession = Depends(get_async_session),
-        current_user: Annotated[Optional[User], Depends(CurrentUser(optional=True))] = None,
+        current_user: Annotated[Optional[Identity], Depends(CurrentUser(optional=True))] = None,
     ):
         self.session = session
         self.current_user = current_user
 
     # ===== Helpers =====
-    def _require_auth(self) -> User:
+    def _require_auth(self) -> Identity:
         if not self.current_user:
             raise HTTPException(status_code=401, detail="Not authenticated")
         return self.current_user
 
-    def _require_admin(self) -> User:
+    def _require_admin(self) -> Identity:
         user = self._require_auth()
         if not user.is_admin:
             raise HTTPException(status_code=403, detail="Admin rights required")
@@ -77,16 +81,33 @@ class UserService:
             nickname=nickname,
             telegram_id=data.telegram_id,
         )
-        await session.commit()
-
-        await notify_admins_new_user(
+        # уведомление админам — в той же транзакции; в Telegram его отправит диспетчер outbox
+        await enqueue_notification(
+            session,
+            "new_user",
             telegram_id=user.telegram_id,
             first_name=user.first_name,
             last_name=user.last_name,
             nickname=user.nickname,
         )
+        await session.commit()
         return user
 
+    @staticmethod
+    async def login_with_init_data(session: AsyncSession, init_data: str) -> schemas.TokenOut:
+        """Вход из Telegram WebApp: проверяем подпись initData и выдаём короткоживущий токен."""
+        tg_user = verify_init_data(init_data)
+        identity = await get_identity(session, int(tg_user["id"]))
+        if identity is None:
+            raise HTTPException(status_code=401, detail="User not registered")
+        return schemas.TokenOut(
+            access_token=issue_token(identity),
+            expires_in=AUTH_TOKEN_TTL,
+            telegram_id=identity.telegram_id,
+            is_admin=identity.is_admin,
+            is_active=identity.is_active,
+        )
+
     async def check_admin(self, telegram_id: int) -> dict:
         """Проверка прав админа по telegram_id (без текущей авторизации)."""
         user = await self._get_user_by_telegram(telegram_id)
@@ -124,8 +145,14 @@ class UserService:
         if target.is_admin and target.telegram_id != admin.telegram_id:
             raise HTTPException(status_code=403, detail="You cannot delete another admin")
 
+        # события пользователя удалятся каскадом вместе с вопросами — снимаем ссылки их картинок
+        urls = await cascade_media_urls(self.session, questions_of_creators([target.telegram_id]))
         await self.session.delete(target)
+        await self.session.flush()
+        orphaned = await release_cascade_media(self.session, urls)
+        await identity_changed(self.session, target.telegram_id)
         await self.session.commit()
+        await unlink_media(orphaned)
 
         return {
             "status": "success",
@@ -136,6 +163,34 @@ class UserService:
 
 
 
+    async def moderation_queue(self, nickname_contains: Optional[str], limit: int, offset: int) -> schemas.ModerationQueueOut:
+        """Пользователи, ожидающие модерации (только админ)."""
+        self._require_admin()
+        total, users = await crud.list_pending_users(
+            self.session, nickname_contains=nickname_contains, limit=limit, offset=offset,
+        )
+        return schemas.ModerationQueueOut(total=total, items=[schemas.UserOut.model_validate(u) for u in users])
+
+    async def bulk_moderate(self, payload: schemas.ModerationBulkIn) -> schemas.ModerationBulkOut:
+        """
+        Одобрить/отклонить пачку ожидающих одним запросом (только админ). Карточки
+        модерации у админов правятся в фоне через общий лимитированный sender.
+        """
+        self._require_admin()
+        status = ModStatus.approved if payload.action == "approve" else ModStatus.rejected
+        tids, rows = await crud.moderate_pending_users(
+            self.session,
+            status,
+            telegram_ids=payload.telegram_ids,
+            nickname_contains=payload.nickname_contains,
+            all_pending=payload.all,
+            limit=payload.limit,
+        )
+        await self.session.commit()
+
+        schedule_moderated_edits(rows, status)
+        return schemas.ModerationBulkOut(action=payload.action, count=len(tids), telegram_ids=tids)
+
     async def promote_to_admin(self, telegram_id: int) -> User:
         """Повысить пользователя до админа (только админ)."""
         self._require_admin()
@@ -149,6 +204,7 @@ class UserService:
 
         target.is_admin = True
         self.session.add(target)
+        await identity_changed(self.session, target.telegram_id)
         await self.session.commit()
         await self.session.refresh(target)
         return target
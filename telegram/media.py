@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import NamedTuple, Optional, Union
+from urllib.parse import urlparse
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile, FSInputFile, InputFile, Message
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.common.db import AsyncSessionLocal
+from app.common.files import MEDIA_ROOT, MEDIA_STORAGE, MEDIA_URL, UPLOAD_CHUNK_SIZE, cas_path, parse_cas_url
+from app.media.models import TelegramFile
+from telegram.core import bot
+from telegram.sender import sender
+
+logger = logging.getLogger("uvicorn.error")
+
+TG_FILE_CACHE_SIZE = int(os.getenv("TG_FILE_CACHE_SIZE", "5000"))
+
+# так Telegram отвечает на протухший/чужой file_id
+_STALE_MARKERS = ("wrong file identifier", "wrong remote file", "file reference", "file_id_invalid")
+
+# (sha256, kind) -> file_id; поверх таблицы telegram_files, чтобы горячие файлы не ходили в БД
+_file_ids: "OrderedDict[tuple[str, str], str]" = OrderedDict()
+# (path, mtime_ns, size) -> sha256 для файлов вне CAS — не перечитываем их при каждой отправке
+_hashes: "OrderedDict[tuple[str, int, int], str]" = OrderedDict()
+
+
+class _Source(NamedTuple):
+    sha256: Optional[str]               # None — содержимое неизвестно, не кешируем
+    upload: Union[InputFile, str]       # что отправлять, если file_id нет
+
+
+def _remember(cache: OrderedDict, key, value) -> None:
+    cache[key] = value
+    cache.move_to_end(key)
+    if len(cache) > TG_FILE_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+async def _local_sha256(path: Path) -> str:
+    st = await asyncio.to_thread(path.stat)
+    key = (str(path), st.st_mtime_ns, st.st_size)
+    sha = _hashes.get(key)
+    if sha is None:
+        sha = await asyncio.to_thread(_file_sha256, path)
+        _remember(_hashes, key, sha)
+    return sha
+
+
+async def _resolve(source: Union[str, bytes], filename: Optional[str]) -> _Source:
+    if isinstance(source, (bytes, bytearray)):
+        data = bytes(source)
+        return _Source(hashlib.sha256(data).hexdigest(), BufferedInputFile(data, filename or "file"))
+
+    # CAS: хеш уже в URL, файл читать не нужно
+    cas = parse_cas_url(source)
+    if cas is not None:
+        sha, ext = cas
+        if MEDIA_STORAGE != "local":
+            # CAS в S3: URL публичный — Telegram скачает сам, а file_id кешируется по sha
+            return _Source(sha, source)
+        return _Source(sha, FSInputFile(cas_path(sha, ext), filename=filename))
+
+    # прочие локальные файлы (/media/quizes/...) — хешируем содержимое
+    parsed = urlparse(source)
+    if not parsed.netloc and parsed.path.startswith(MEDIA_URL + "/"):
+        local = (MEDIA_ROOT / parsed.path[len(MEDIA_URL) + 1:]).resolve()
+        if local.is_relative_to(MEDIA_ROOT.resolve()) and local.is_file():
+            return _Source(await _local_sha256(local), FSInputFile(local, filename=filename))
+
+    # внешний URL: Telegram скачает сам, содержимое нам неизвестно
+    return _Source(None, source)
+
+
+async def _cached_file_id(sha: str, kind: str) -> Optional[str]:
+    file_id = _file_ids.get((sha, kind))
+    if file_id is not None:
+        _file_ids.move_to_end((sha, kind))
+        return file_id
+    async with AsyncSessionLocal() as session:
+        file_id = (await session.execute(
+            select(TelegramFile.file_id).where(
+                TelegramFile.bot_id == bot.id, TelegramFile.sha256 == sha, TelegramFile.kind == kind,
+            )
+        )).scalar_one_or_none()
+    if file_id is not None:
+        _remember(_file_ids, (sha, kind), file_id)
+    return file_id
+
+
+async def _store_file_id(sha: str, kind: str, file_id: str) -> None:
+    _remember(_file_ids, (sha, kind), file_id)
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            insert(TelegramFile)
+            .values(bot_id=bot.id, sha256=sha, kind=kind, file_id=file_id)
+            .on_conflict_do_update(
+                index_elements=[TelegramFile.bot_id, TelegramFile.sha256, TelegramFile.kind],
+                set_={"file_id": file_id},
+            )
+        )
+        await session.commit()
+
+
+async def _forget_file_id(sha: str, kind: str) -> None:
+    _file_ids.pop((sha, kind), None)
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            delete(TelegramFile).where(
+                TelegramFile.bot_id == bot.id, TelegramFile.sha256 == sha, TelegramFile.kind == kind,
+            )
+        )
+        await session.commit()
+
+
+def _sent_file_id(msg: Message, kind: str) -> Optional[str]:
+    if kind == "photo":
+        return msg.photo[-1].file_id if msg.photo else None
+    return msg.document.file_id if msg.document else None
+
+
+async def _send(chat_id: int, kind: str, media, **kwargs) -> Message:
+    if kind == "photo":
+        return await sender.send_photo(chat_id, media, **kwargs)
+    return await sender.send_document(chat_id, media, **kwargs)
+
+
+async def send_media(
+    chat_id: int,
+    source: Union[str, bytes],
+    *,
+    kind: str = "photo",
+    filename: Optional[str] = None,
+    **kwargs,
+) -> Message:
+    """
+    Отправить картинку (kind="photo") или файл (kind="document") через общий sender.
+    source — URL из images_urls (/media/cas/..., /media/..., внешний) или байты (экспорт).
+    Первый раз файл загружается в Telegram, полученный file_id запоминается по sha256
+    содержимого; дальше отправляется только file_id. Если Telegram его не принял —
+    запись удаляется и файл загружается заново.
+    """
+    if kind not in ("photo", "document"):
+        raise ValueError(f"Unsupported media kind: {kind!r}")
+    src = await _resolve(source, filename)
+
+    if src.sha256 is not None:
+        file_id = await _cached_file_id(src.sha256, kind)
+        if file_id is not None:
+            try:
+                return await _send(chat_id, kind, file_id, **kwargs)
+            except TelegramBadRequest as e:
+                if not any(m in str(e).lower() for m in _STALE_MARKERS):
+                    raise
+                logger.info(f"Telegram file_id for {src.sha256[:12]} is stale, re-uploading: {e}")
+                await _forget_file_id(src.sha256, kind)
+
+    msg = await _send(chat_id, kind, src.upload, **kwargs)
+    if src.sha256 is not None:
+        file_id = _sent_file_id(msg, kind)
+        if file_id:
+            await _store_file_id(src.sha256, kind, file_id)
+    return msg
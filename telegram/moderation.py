@@ -1,18 +1,37 @@
+import asyncio
+import html
+import logging
+
 from aiogram import Router, F
-from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.filters import Command, CommandObject
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, Message
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 
-from telegram.core import bot
+from telegram.sender import sender
 from app.common.db import get_async_session, AsyncSessionLocal
+from app.common.identity import identity_changed, get_identity
 from sqlalchemy import text, select
 from sqlalchemy.sql import text as sql_text
-from app.users.models import AdminNotification, AdminChat
+from app.users.models import AdminNotification, AdminChat, ModStatus
+from app.users import crud
 from app.users.models import User
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
+logger = logging.getLogger("uvicorn.error")
+
 router = Router()
 
+# задачи массовой правки сообщений (держим ссылки, чтобы их не собрал GC)
+_edit_tasks: set[asyncio.Task] = set()
+# сколько пользователей максимум за одну команду /moderate
+BULK_LIMIT = 1000
+
+def moderation_text(tid: int, status: ModStatus) -> str:
+    if status is ModStatus.approved:
+        return f"✅ Пользователь {tid} активирован."
+    return f"❌ Пользователь {tid} отклонён."
+
 def moderation_kb(tid: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="✅ Активировать", callback_data=f"approve_tg:{tid}")],
@@ -25,9 +44,23 @@ async def fetch_admin_ids() -> list[int]:
         return [int(tid) for (tid,) in res.all()]
 
 async def notify_admins_new_user(telegram_id: int, first_name: str, last_name: str, nickname: str):
+    """
+    Разослать карточку модерации админам. Вызывается диспетчером outbox и может
+    повторяться: чаты, которым уведомление уже ушло, пропускаем. Если кому-то не
+    отправили по временной причине — исключение, диспетчер повторит позже.
+    """
     async with AsyncSessionLocal() as session:
+        # пользователя уже одобрили/отклонили (или удалили) — модерировать нечего
+        is_active = (await session.execute(
+            select(User.is_active).where(User.telegram_id == telegram_id)
+        )).scalar_one_or_none()
+        if is_active is None or is_active:
+            return
         # берём только те чаты, которые вы добавили в admin chat
         admin_ids = [row[0] for row in (await session.execute(select(AdminChat.telegram_id))).all()]
+        notified = set((await session.execute(
+            select(AdminNotification.admin_chat_id).where(AdminNotification.user_tid == telegram_id)
+        )).scalars().all())
 
     if not admin_ids:
         print("[WARN] No admin chats configured (fill AdminChat table).")
@@ -42,23 +75,48 @@ async def notify_admins_new_user(telegram_id: int, first_name: str, last_name: s
         "Одобрить пользователя?"
     )
     kb = moderation_kb(telegram_id)
+    admin_ids = [chat_id for chat_id in admin_ids if chat_id not in notified]
 
-    # отправка и запись уведомлений
+    # отправка всем админам параллельно (лимиты держит sender), затем запись уведомлений
+    results = await asyncio.gather(
+        *(sender.send_message(chat_id, text_msg, reply_markup=kb, parse_mode="HTML") for chat_id in admin_ids),
+        return_exceptions=True,
+    )
+    failed: list[BaseException] = []
     async with AsyncSessionLocal() as session:
-        for chat_id in admin_ids:
-            try:
-                msg = await bot.send_message(chat_id, text_msg, reply_markup=kb, parse_mode="HTML")
-                session.add(AdminNotification(
-                    user_tid=telegram_id,
-                    admin_chat_id=chat_id,
-                    message_id=msg.message_id,
-                    status="pending",
-                ))
-            except (TelegramBadRequest, TelegramForbiddenError) as e:
-                print(f"[TG] skip {chat_id}: {e}")
+        for chat_id, msg in zip(admin_ids, results):
+            if isinstance(msg, (TelegramBadRequest, TelegramForbiddenError)):
+                # бот заблокирован / чат не найден — повторять бессмысленно
+                print(f"[TG] skip {chat_id}: {msg}")
                 continue
+            if isinstance(msg, BaseException):
+                failed.append(msg)
+                continue
+            session.add(AdminNotification(
+                user_tid=telegram_id,
+                admin_chat_id=chat_id,
+                message_id=msg.message_id,
+                status="pending",
+            ))
         await session.commit()
 
+    if failed:
+        raise RuntimeError(f"{len(failed)} admin chat(s) not notified: {failed[0]!r}")
+
+
+async def edit_notifications(call: CallbackQuery, notifs: list[AdminNotification], text_all: str):
+    """Отредактировать уведомление у всех админов (и нажатое сообщение, если его нет в таблице)."""
+    targets = {(n.admin_chat_id, n.message_id) for n in notifs}
+    if call.message is not None:
+        targets.add((call.message.chat.id, call.message.message_id))
+    results = await asyncio.gather(
+        *(sender.edit_message_text(chat_id, message_id, text_all) for chat_id, message_id in targets),
+        return_exceptions=True,
+    )
+    for (chat_id, _), res in zip(targets, results):
+        if isinstance(res, BaseException) and not isinstance(res, (TelegramBadRequest, TelegramForbiddenError)):
+            print(f"[TG] edit failed {chat_id}: {res!r}")
+
 @router.callback_query(F.data.startswith("approve_tg:"))
 async def on_approve(call: CallbackQuery):
     tid = int(call.data.split(":")[1])
@@ -79,6 +137,8 @@ async def on_approve(call: CallbackQuery):
             {"tid": tid},
         )
         first_time = res.first() is not None
+        if first_time:
+            await identity_changed(s, tid)
 
         # 2) помечаем уведомления и забираем все message_id
         notifs = (await s.execute(
@@ -89,26 +149,9 @@ async def on_approve(call: CallbackQuery):
             n.status = "approved"
         await s.commit()
 
-    # 3) редактируем/удаляем сообщения у всех админов
-    text_all = f"✅ Пользователь {tid} активирован."
-    for n in notifs:
-        try:
-            # можно удалить:
-            # await bot.delete_message(n.admin_chat_id, n.message_id)
-            # или отредактировать:
-            await bot.edit_message_text(
-                text_all,
-                chat_id=n.admin_chat_id,
-                message_id=n.message_id,
-            )
-        except (TelegramBadRequest, TelegramForbiddenError):
-            pass
-
-    # 4) нажатому администратору отредактируем текущее сообщение (на случай, если оно не попало в цикл)
-    try:
-        await call.message.edit_text(text_all)
-    except TelegramBadRequest:
-        pass
+    # 3) редактируем сообщения у всех админов, включая нажатое (на случай, если его нет в таблице)
+    text_all = moderation_text(tid, ModStatus.approved)
+    await edit_notifications(call, notifs, text_all)
 
 @router.callback_query(F.data.startswith("reject_tg:"))
 async def on_reject(call: CallbackQuery):
@@ -121,6 +164,7 @@ async def on_reject(call: CallbackQuery):
     async for s in get_async_session():
         # удаляем пользователя ИЛИ ставим is_active = FALSE/какой-то статус
         await s.execute(text("DELETE FROM users WHERE telegram_id = :tid"), {"tid": tid})
+        await identity_changed(s, tid)
 
         notifs = (await s.execute(
             select(AdminNotification).where(AdminNotification.user_tid == tid)
@@ -129,17 +173,95 @@ async def on_reject(call: CallbackQuery):
             n.status = "rejected"
         await s.commit()
 
-    text_all = f"❌ Пользователь {tid} отклонён."
-    for n in notifs:
+    text_all = moderation_text(tid, ModStatus.rejected)
+    await edit_notifications(call, notifs, text_all)
+
+
+async def edit_moderated_messages(rows: list[tuple[int, int, int]], status: ModStatus) -> None:
+    """
+    Массовая правка карточек модерации (user_tid, admin_chat_id, message_id) после
+    bulk-одобрения/отклонения. Всё идёт через sender: параллельно, но в лимитах
+    Telegram — сотня карточек в одном чате правится примерно за сотню секунд.
+    """
+    results = await asyncio.gather(
+        *(sender.edit_message_text(chat_id, message_id, moderation_text(tid, status)) for tid, chat_id, message_id in rows),
+        return_exceptions=True,
+    )
+    failed = [r for r in results if isinstance(r, BaseException) and not isinstance(r, (TelegramBadRequest, TelegramForbiddenError))]
+    if failed:
+        logger.warning(f"Moderation: {len(failed)} of {len(rows)} messages not edited: {failed[0]!r}")
+
+
+def schedule_moderated_edits(rows: list[tuple[int, int, int]], status: ModStatus) -> None:
+    """Запустить edit_moderated_messages в фоне — ответ админу не ждёт правки сотен сообщений."""
+    if not rows:
+        return
+    task = asyncio.create_task(edit_moderated_messages(rows, status))
+    _edit_tasks.add(task)
+    task.add_done_callback(_edit_tasks.discard)
+
+
+async def _is_admin(message: Message) -> bool:
+    if message.from_user is None:
+        return False
+    async with AsyncSessionLocal() as session:
+        identity = await get_identity(session, message.from_user.id)
+    return identity is not None and identity.is_admin
+
+
+@router.message(Command("pending"))
+async def on_pending(message: Message):
+    """/pending — сколько пользователей ждут модерации и первые из них."""
+    if not await _is_admin(message):
+        return
+    async with AsyncSessionLocal() as session:
+        total, users = await crud.list_pending_users(session, limit=20)
+    if not total:
+        await message.answer("Очередь модерации пуста.")
+        return
+    lines = [f"<code>{u.telegram_id}</code> — {html.escape(u.nickname)}" for u in users]
+    more = f"\n… и ещё {total - len(users)}" if total > len(users) else ""
+    await message.answer(f"<b>Ожидают модерации: {total}</b>\n" + "\n".join(lines) + more)
+
+
+@router.message(Command("moderate"))
+async def on_moderate(message: Message, command: CommandObject):
+    """
+    /moderate approve all            — одобрить всех ожидающих (до BULK_LIMIT)
+    /moderate reject 123 456         — отклонить перечисленных
+    /moderate approve nick:<часть>   — одобрить тех, чей ник содержит подстроку
+    """
+    if not await _is_admin(message):
+        return
+    usage = "Использование: /moderate approve|reject all|nick:&lt;часть ника&gt;|&lt;telegram_id …&gt;"
+    args = (command.args or "").split()
+    if len(args) < 2 or args[0] not in ("approve", "reject"):
+        await message.answer(usage)
+        return
+
+    status = ModStatus.approved if args[0] == "approve" else ModStatus.rejected
+    telegram_ids = None
+    nickname_contains = None
+    if args[1].startswith("nick:"):
+        nickname_contains = args[1][len("nick:"):]
+        # пустая подстрока совпала бы со всеми ожидающими — для этого есть явное "all"
+        if not nickname_contains:
+            await message.answer(usage)
+            return
+    elif args[1] != "all":
         try:
-            await bot.edit_message_text(
-                text_all,
-                chat_id=n.admin_chat_id,
-                message_id=n.message_id,
-            )
-        except (TelegramBadRequest, TelegramForbiddenError):
-            pass
-    try:
-        await call.message.edit_text(text_all)
-    except TelegramBadRequest:
-        pass
\ No newline at end of file
+            telegram_ids = [int(a) for a in args[1:]]
+        except ValueError:
+            await message.answer(usage)
+            return
+
+    async with AsyncSessionLocal() as session:
+        tids, rows = await crud.moderate_pending_users(
+            session, status, telegram_ids=telegram_ids, nickname_contains=nickname_contains,
+            all_pending=args[1] == "all", limit=BULK_LIMIT,
+        )
+        await session.commit()
+
+    schedule_moderated_edits(rows, status)
+    verb = "Одобрено" if status is ModStatus.approved else "Отклонено"
+    await message.answer(f"{verb}: {len(tids)}. Карточки у админов обновятся в течение пары минут.")
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import select, update, or_, and_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.common.db import AsyncSessionLocal
+from app.common.pubsub import publish, subscribe
+from app.users.models import NotificationOutbox, OutboxStatus
+from telegram.moderation import notify_admins_new_user
+
+logger = logging.getLogger("uvicorn.error")
+
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("TELEGRAM_OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_POLL_SECONDS = float(os.getenv("TELEGRAM_OUTBOX_POLL_SECONDS", "30"))
+OUTBOX_BATCH = int(os.getenv("TELEGRAM_OUTBOX_BATCH", "20"))
+
+# запись в статусе sending дольше этого — диспетчер умер посреди отправки, берём заново
+_STALE_SENDING = timedelta(minutes=5)
+_CHANNEL = "telegram_outbox"
+
+_wakeup = asyncio.Event()
+
+# kind -> обработчик payload; исключение = повторить позже
+_HANDLERS: Dict[str, Callable[..., Awaitable[Any]]] = {
+    "new_user": notify_admins_new_user,
+}
+
+
+def _on_notify(_payload: Optional[str]) -> None:
+    _wakeup.set()
+
+
+subscribe(_CHANNEL, _on_notify)
+
+
+async def enqueue_notification(session: AsyncSession, kind: str, **payload) -> None:
+    """
+    Поставить уведомление в outbox в транзакции вызывающего кода. Диспетчер узнает
+    о нём через NOTIFY сразу после коммита (при откате не отправится ничего).
+    """
+    if kind not in _HANDLERS:
+        raise ValueError(f"Unknown outbox kind: {kind!r}")
+    session.add(NotificationOutbox(kind=kind, payload=payload))
+    await publish(session, _CHANNEL, kind)
+
+
+async def _claim(limit: int) -> list:
+    """Забрать пачку уведомлений; SKIP LOCKED — на случай смены лидера посреди пачки."""
+    async with AsyncSessionLocal() as session:
+        due = (
+            select(NotificationOutbox.id)
+            .where(or_(
+                and_(NotificationOutbox.status == OutboxStatus.pending.value, NotificationOutbox.next_attempt_at <= func.now()),
+                and_(NotificationOutbox.status == OutboxStatus.sending.value, NotificationOutbox.updated_at < func.now() - _STALE_SENDING),
+            ))
+            .order_by(NotificationOutbox.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        res = await session.execute(
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id.in_(due.scalar_subquery()))
+            .values(status=OutboxStatus.sending.value, attempts=NotificationOutbox.attempts + 1)
+            .returning(NotificationOutbox.id, NotificationOutbox.kind, NotificationOutbox.payload, NotificationOutbox.attempts)
+        )
+        rows = res.all()
+        await session.commit()
+        return rows
+
+
+async def _process(row_id: int, kind: str, payload: dict, attempts: int) -> None:
+    error: Optional[str] = None
+    try:
+        await _HANDLERS[kind](**payload)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        error = repr(e)
+
+    async with AsyncSessionLocal() as session:
+        if error is None:
+            values = {"status": OutboxStatus.done.value, "last_error": None}
+        elif attempts >= OUTBOX_MAX_ATTEMPTS:
+            values = {"status": OutboxStatus.failed.value, "last_error": error}
+        else:
+            # экспоненциальная пауза: 30 с, 1, 2, 4... минут
+            values = {
+                "status": OutboxStatus.pending.value,
+                "last_error": error,
+                "next_attempt_at": func.now() + timedelta(seconds=15 * 2 ** attempts),
+            }
+        await session.execute(update(NotificationOutbox).where(NotificationOutbox.id == row_id).values(**values))
+        await session.commit()
+
+    if error is not None:
+        logger.warning(f"Telegram outbox: {kind} #{row_id} failed (attempt {attempts}): {error}")
+
+
+async def run_outbox_dispatcher() -> None:
+    """
+    Фоновый цикл (в лидере): разбирает outbox пачками, отправка идёт через общий
+    sender с его лимитами. Между пачками ждёт NOTIFY или OUTBOX_POLL_SECONDS.
+    """
+    while True:
+        _wakeup.clear()
+        try:
+            rows = await _claim(OUTBOX_BATCH)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Telegram outbox: failed to claim batch")
+            rows = []
+
+        if rows:
+            results = await asyncio.gather(
+                *(_process(r.id, r.kind, r.payload, r.attempts) for r in rows),
+                return_exceptions=True,
+            )
+            for r in results:
+                if isinstance(r, Exception):
+                    logger.error(f"Telegram outbox: {r!r}")
+            continue
+
+        try:
+            await asyncio.wait_for(_wakeup.wait(), OUTBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
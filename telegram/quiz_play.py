@@ -0,0 +1,330 @@
+import html
+import logging
+import os
+import re
+import time
+from typing import List, NamedTuple, Optional
+
+from aiogram import F, Router
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject
+from aiogram.types import CallbackQuery, ForceReply, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from sqlalchemy import select
+
+from app.common.db import AsyncSessionLocal, ReadSessionLocal
+from app.common.identity import Identity, get_identity
+from app.events.timer import answer_window_open
+from app.quizes.batcher import PendingAnswer, answer_batcher
+from app.quizes.live import live_engine
+from app.quizes.models import Quiz, QuizQuestion, QuizUserAnswer, QuestionType
+from app.quizes.scoring import locale_values, score_answer
+from app.quizes.services import QuizService
+from telegram.core import bot
+from telegram.media import send_media
+from telegram.sender import sender
+
+logger = logging.getLogger("uvicorn.error")
+
+# сколько живёт локализованная колода квиза в памяти процесса
+QUIZ_PLAY_CACHE_TTL = float(os.getenv("QUIZ_PLAY_CACHE_TTL_SECONDS", "60"))
+QUIZ_PLAY_LOCALES = ("ru", "kk", "en")
+_BUTTON_TEXT_MAX = 60
+
+# метка в тексте open-вопроса: по ней находим вопрос, когда игрок отвечает reply'ем
+_OPEN_MARK_RE = re.compile(r"#(\d+)/(\d+)/([a-z]{2,5})")
+
+router = Router()
+
+
+class PlayQuestion(NamedTuple):
+    id: int
+    type: QuestionType
+    text: str
+    options: List[str]
+    points: int
+    images_urls: List[str]
+    correct: List[str]
+
+
+class Deck(NamedTuple):
+    quiz_id: int
+    name: str
+    is_active: bool
+    answer_limit: Optional[int]
+    questions: List[PlayQuestion]
+
+    @property
+    def limit(self) -> int:
+        return self.answer_limit if self.answer_limit is not None else len(self.questions)
+
+    def get(self, question_id: int) -> Optional[PlayQuestion]:
+        return next((q for q in self.questions if q.id == question_id), None)
+
+
+# (quiz_id, locale) -> (expires_at, Deck)
+_decks: dict[tuple[int, str], tuple[float, Deck]] = {}
+# (user_id, quiz_id, question_id) ответов, которые этот процесс сейчас записывает: повторное
+# нажатие, пока идёт запись, не пройдёт
+_inflight: set[tuple[int, int, int]] = set()
+
+
+async def get_deck(quiz_id: int, locale: str) -> Optional[Deck]:
+    """
+    Вопросы квиза в том же локализованном виде, что отдаёт /quizes/{id}/questions,
+    плюс правильные ответы для подсчёта очков. Кешируется на QUIZ_PLAY_CACHE_TTL.
+    """
+    now = time.monotonic()
+    hit = _decks.get((quiz_id, locale))
+    if hit is not None and hit[0] > now:
+        return hit[1]
+
+    async with ReadSessionLocal() as session:
+        quiz = (await session.execute(
+            select(Quiz.name, Quiz.is_active, Quiz.answer_limit).where(Quiz.id == quiz_id)
+        )).first()
+        if quiz is None:
+            return None
+        payloads = await QuizService(session, None).list_questions_by_quiz_locale(quiz_id, locale)
+        correct = dict((await session.execute(
+            select(QuizQuestion.id, QuizQuestion.correct_answers_i18n).where(QuizQuestion.quiz_id == quiz_id)
+        )).all())
+
+    deck = Deck(
+        quiz_id=quiz_id,
+        name=quiz.name,
+        is_active=quiz.is_active,
+        answer_limit=quiz.answer_limit,
+        questions=[
+            PlayQuestion(p.id, p.type, p.text, p.options, p.points, p.images_urls, locale_values(correct.get(p.id), locale))
+            for p in payloads
+        ],
+    )
+    _decks[(quiz_id, locale)] = (now + QUIZ_PLAY_CACHE_TTL, deck)
+    return deck
+
+
+async def _progress(user_id: int, quiz_id: int) -> tuple[set[int], int]:
+    """
+    (id отвеченных вопросов, число ответов) игрока в квизе. Квиз ведёт живая сессия этого
+    воркера — из её памяти (БД отстаёт на пачку), иначе из БД: ответы могли прийти через
+    HTTP или другой воркер, а пачка батчера к этому моменту уже закоммичена.
+    """
+    live = live_engine.get(quiz_id)
+    if live is not None:
+        return live.answered_questions(user_id)
+    async with AsyncSessionLocal() as session:
+        ids = (await session.execute(
+            select(QuizUserAnswer.question_id).where(
+                QuizUserAnswer.user_id == user_id, QuizUserAnswer.quiz_id == quiz_id,
+            )
+        )).scalars().all()
+    return set(ids), len(ids)
+
+
+def _locale(language_code: Optional[str]) -> str:
+    code = (language_code or "").split("-")[0].lower()
+    return code if code in QUIZ_PLAY_LOCALES else "ru"
+
+
+async def _player(telegram_id: int) -> Optional[Identity]:
+    async with AsyncSessionLocal() as session:
+        identity = await get_identity(session, telegram_id)
+    return identity if identity is not None and identity.is_active else None
+
+
+def _button_text(s: str) -> str:
+    return s if len(s) <= _BUTTON_TEXT_MAX else s[:_BUTTON_TEXT_MAX - 1] + "…"
+
+
+def _options_kb(deck: Deck, q: PlayQuestion, locale: str, mask: int = 0) -> InlineKeyboardMarkup:
+    if q.type == QuestionType.SINGLE:
+        rows = [
+            [InlineKeyboardButton(text=_button_text(opt), callback_data=f"qp:a:{deck.quiz_id}:{q.id}:{i}:{locale}")]
+            for i, opt in enumerate(q.options)
+        ]
+    else:
+        # multiple: выбранное храним битовой маской прямо в callback_data — без состояния на сервере
+        rows = [
+            [InlineKeyboardButton(
+                text=("☑ " if mask & (1 << i) else "☐ ") + _button_text(opt),
+                callback_data=f"qp:t:{deck.quiz_id}:{q.id}:{mask ^ (1 << i)}:{locale}",
+            )]
+            for i, opt in enumerate(q.options)
+        ]
+        rows.append([InlineKeyboardButton(text="✅ Ответить", callback_data=f"qp:s:{deck.quiz_id}:{q.id}:{mask}:{locale}")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+async def _send_question(chat_id: int, deck: Deck, q: PlayQuestion, number: int, locale: str) -> None:
+    for url in q.images_urls:
+        try:
+            await send_media(chat_id, url)
+        except TelegramBadRequest as e:
+            logger.warning(f"Quiz play: image {url!r} not sent: {e}")
+
+    text = f"<b>{html.escape(deck.name)}</b> · {number}/{deck.limit}\n\n{html.escape(q.text)}"
+    if q.type == QuestionType.OPEN:
+        text += f"\n\n<i>Ответьте на это сообщение · #{deck.quiz_id}/{q.id}/{locale}</i>"
+        await sender.send_message(chat_id, text, reply_markup=ForceReply(selective=True))
+    else:
+        await sender.send_message(chat_id, text, reply_markup=_options_kb(deck, q, locale))
+
+
+async def _send_next(chat_id: int, player: Identity, deck: Deck, locale: str, total: Optional[int] = None) -> None:
+    answered, count = await _progress(player.id, deck.quiz_id)
+    nxt = next((q for q in deck.questions if q.id not in answered), None)
+    if nxt is None or count >= deck.limit:
+        score = f" Ваш счёт: <b>{total}</b>." if total is not None else ""
+        await sender.send_message(chat_id, f"🏁 Квиз «{html.escape(deck.name)}» пройден.{score}")
+        return
+    await _send_question(chat_id, deck, nxt, count + 1, locale)
+
+
+async def _accept(player: Identity, deck: Deck, q: PlayQuestion, answers: List[str], locale: str) -> tuple[bool, str, Optional[int]]:
+    """Засчитать ответ: (принят, текст для игрока, новый счёт)."""
+    if not await answer_window_open(deck.quiz_id, q.id):
+        return False, "Время на ответ вышло", None
+    key = (player.id, deck.quiz_id, q.id)
+    if key in _inflight:
+        return False, "Вы уже ответили на этот вопрос", None
+    # отмечаем до чтения прогресса: повторное нажатие, пока идёт проверка и запись, не пройдёт
+    _inflight.add(key)
+    try:
+        return await _submit(player, deck, q, answers, locale)
+    finally:
+        _inflight.discard(key)
+
+
+async def _submit(player: Identity, deck: Deck, q: PlayQuestion, answers: List[str], locale: str) -> tuple[bool, str, Optional[int]]:
+    answered, count = await _progress(player.id, deck.quiz_id)
+    if q.id in answered:
+        return False, "Вы уже ответили на этот вопрос", None
+    # ответы на другие вопросы, которые этот процесс ещё записывает, — тоже в счёт лимита
+    count += sum(
+        1 for uid, qz, qid in _inflight
+        if uid == player.id and qz == deck.quiz_id and qid != q.id and qid not in answered
+    )
+    if count >= deck.limit:
+        return False, "Лимит ответов в этом квизе исчерпан", None
+
+    try:
+        # квиз ведёт живая сессия этого воркера — ответ через неё, иначе пачкой в БД
+        live = live_engine.get(deck.quiz_id)
+        result = await live.submit(player.id, q.id, answers, locale) if live is not None and q.id in live.questions else None
+        if result is not None:
+            pts, total = result["awarded_points"], result["user_total_points"]
+        else:
+            pts = score_answer(q.type, q.points, q.correct, answers)
+            total = await answer_batcher.submit(PendingAnswer(player.id, deck.quiz_id, q.id, answers, locale, pts))
+    except Exception:
+        return False, "Не удалось сохранить ответ, попробуйте ещё раз", None
+    return True, (f"✅ +{pts}" if pts else "❌ Неверно") + f" · всего {total}", total
+
+
+@router.message(Command("play"))
+async def on_play(message: Message, command: CommandObject):
+    """/play — список активных квизов; /play <id> [ru|kk|en] — начать или продолжить квиз."""
+    player = await _player(message.from_user.id) if message.from_user else None
+    if player is None:
+        await message.answer("Сначала зарегистрируйтесь в приложении и дождитесь одобрения.")
+        return
+
+    args = (command.args or "").split()
+    locale = _locale(args[1] if len(args) > 1 else message.from_user.language_code)
+    if not args or not args[0].isdigit():
+        async with ReadSessionLocal() as session:
+            quizes = (await session.execute(
+                select(Quiz.id, Quiz.name).where(Quiz.is_active.is_(True)).order_by(Quiz.id)
+            )).all()
+        if not quizes:
+            await message.answer("Сейчас нет активных квизов.")
+            return
+        kb = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=_button_text(name), callback_data=f"qp:p:{qid}:0:0:{locale}")]
+            for qid, name in quizes
+        ])
+        await message.answer("Выберите квиз:", reply_markup=kb)
+        return
+
+    await _start(message.chat.id, player, int(args[0]), locale)
+
+
+async def _start(chat_id: int, player: Identity, quiz_id: int, locale: str) -> None:
+    deck = await get_deck(quiz_id, locale)
+    if deck is None or not deck.is_active or not deck.questions:
+        await sender.send_message(chat_id, "Этот квиз сейчас недоступен.")
+        return
+    await _send_next(chat_id, player, deck, locale)
+
+
+@router.callback_query(F.data.startswith("qp:"))
+async def on_play_callback(call: CallbackQuery):
+    try:
+        _, action, quiz_id, question_id, value, locale = call.data.split(":")
+        quiz_id, question_id, value = int(quiz_id), int(question_id), int(value)
+    except ValueError:
+        await call.answer()
+        return
+
+    player = await _player(call.from_user.id)
+    if player is None or call.message is None:
+        await call.answer("Нет доступа", show_alert=True)
+        return
+    chat_id, message_id = call.message.chat.id, call.message.message_id
+
+    if action == "p":
+        await call.answer()
+        await _start(chat_id, player, quiz_id, locale)
+        return
+
+    deck = await get_deck(quiz_id, locale)
+    q = deck.get(question_id) if deck is not None and deck.is_active else None
+    if q is None:
+        await call.answer("Вопрос больше недоступен", show_alert=True)
+        return
+
+    if action == "t":
+        await call.answer()
+        await sender.edit_message_reply_markup(chat_id, message_id, _options_kb(deck, q, locale, mask=value))
+        return
+
+    if action == "a":
+        answers = [q.options[value]] if 0 <= value < len(q.options) else []
+    elif action == "s":
+        answers = [opt for i, opt in enumerate(q.options) if value & (1 << i)]
+        if not answers:
+            await call.answer("Выберите хотя бы один вариант")
+            return
+    else:
+        await call.answer()
+        return
+
+    accepted, reply, total = await _accept(player, deck, q, answers, locale)
+    await call.answer(reply)
+    if accepted:
+        # убираем кнопки у отвеченного вопроса и присылаем следующий
+        await sender.edit_message_reply_markup(chat_id, message_id, None)
+        await _send_next(chat_id, player, deck, locale, total)
+
+
+@router.message(F.reply_to_message.from_user.id == bot.id, F.text)
+async def on_open_answer(message: Message):
+    src = message.reply_to_message
+    m = _OPEN_MARK_RE.search(src.text or "")
+    if m is None:
+        return
+    player = await _player(message.from_user.id) if message.from_user else None
+    if player is None:
+        return
+    quiz_id, question_id, locale = int(m.group(1)), int(m.group(2)), m.group(3)
+
+    deck = await get_deck(quiz_id, locale)
+    q = deck.get(question_id) if deck is not None and deck.is_active else None
+    if q is None or q.type != QuestionType.OPEN:
+        await message.answer("Вопрос больше недоступен.")
+        return
+
+    accepted, reply, total = await _accept(player, deck, q, [message.text], locale)
+    await sender.send_message(message.chat.id, reply)
+    if accepted:
+        await _send_next(message.chat.id, player, deck, locale, total)
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from telegram.core import bot
+
+logger = logging.getLogger("uvicorn.error")
+
+# лимиты Bot API: ~30 сообщений/с на бота, ~1/с в один чат (в группы — 20/мин)
+# Бакеты живут в памяти процесса, а отправляют все воркеры uvicorn (вебхук, игра в чате),
+# поэтому общий лимит бота делим на их число (uvicorn берёт --workers из WEB_CONCURRENCY).
+# Лимит на чат не делим: чат обычно обслуживает один воркер, остальное ловит RetryAfter.
+SEND_PROCESSES = max(int(os.getenv("TG_SEND_PROCESSES", os.getenv("WEB_CONCURRENCY", "1"))), 1)
+GLOBAL_RATE = float(os.getenv("TG_SEND_GLOBAL_RATE", "25")) / SEND_PROCESSES
+PER_CHAT_RATE = float(os.getenv("TG_SEND_PER_CHAT_RATE", "1"))
+SEND_CONCURRENCY = int(os.getenv("TG_SEND_CONCURRENCY", "16"))
+# сколько раз повторяем после RetryAfter
+_MAX_RETRIES = 5
+_MAX_CHAT_BUCKETS = 10_000
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше capacity в запасе. Ожидающие обслуживаются по очереди."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        # меньше одного токена в запасе acquire() не дождётся никогда
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Telegram попросил подождать: следующий токен появится не раньше чем через seconds."""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity and not self._lock.locked()
+
+
+class _PendingEdit:
+    __slots__ = ("kwargs", "future")
+
+    def __init__(self, kwargs: Dict[str, Any]):
+        self.kwargs = kwargs
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class OutboundScheduler:
+    """
+    Общий исходящий канал бота: параллельная отправка с ограничением по токен-бакетам
+    (глобальному и на каждый чат), повтор после TelegramRetryAfter и склейка правок
+    одного и того же сообщения — если правка ещё ждёт своей очереди, новая просто
+    заменяет её текст, и в Telegram уходит только последняя.
+    """
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        # при многих воркерах GLOBAL_RATE < 1 в секунду — запас всё равно хотя бы один токен
+        self._global = TokenBucket(GLOBAL_RATE, max(1.0, GLOBAL_RATE))
+        self._chats: Dict[int, TokenBucket] = {}
+        self._sem = asyncio.Semaphore(SEND_CONCURRENCY)
+        self._edits: Dict[Tuple[int, int, str], _PendingEdit] = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= _MAX_CHAT_BUCKETS:
+                self._chats = {cid: b for cid, b in self._chats.items() if not b.idle}
+            bucket = self._chats[chat_id] = TokenBucket(PER_CHAT_RATE, 1)
+        return bucket
+
+    async def _call(self, chat_id: int, method, *, have_chat_token: bool = False, **kwargs):
+        chat_bucket = self._chat_bucket(chat_id)
+        for attempt in range(_MAX_RETRIES + 1):
+            if not have_chat_token:
+                await chat_bucket.acquire()
+            have_chat_token = False
+            await self._global.acquire()
+            try:
+                async with self._sem:
+                    return await method(chat_id=chat_id, **kwargs)
+            except TelegramRetryAfter as e:
+                if attempt == _MAX_RETRIES:
+                    raise
+                logger.warning(f"Telegram flood control for chat {chat_id}: retry after {e.retry_after}s")
+                chat_bucket.pause(e.retry_after)
+                # 429 может быть и за общий лимит бота — притормаживаем всю отправку процесса
+                self._global.pause(e.retry_after)
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        return await self._call(chat_id, self.bot.send_message, text=text, **kwargs)
+
+    async def send_photo(self, chat_id: int, photo, **kwargs):
+        return await self._call(chat_id, self.bot.send_photo, photo=photo, **kwargs)
+
+    async def send_document(self, chat_id: int, document, **kwargs):
+        return await self._call(chat_id, self.bot.send_document, document=document, **kwargs)
+
+    async def _edit(self, method, chat_id: int, message_id: int, kwargs: Dict[str, Any]) -> Optional[Any]:
+        key = (chat_id, message_id, method.__name__)
+        pending = self._edits.get(key)
+        if pending is not None:
+            # правка этого сообщения ещё ждёт очереди — отправится только последняя версия
+            pending.kwargs = kwargs
+            return await asyncio.shield(pending.future)
+
+        pending = self._edits[key] = _PendingEdit(kwargs)
+        try:
+            # пока ждём токен чата, новые правки заменяют pending.kwargs
+            await self._chat_bucket(chat_id).acquire()
+            self._edits.pop(key, None)  # дальше правка «в полёте», следующая встанет в очередь заново
+            try:
+                result = await self._call(
+                    chat_id, method, have_chat_token=True, message_id=message_id, **pending.kwargs,
+                )
+            except TelegramBadRequest as e:
+                if "message is not modified" not in str(e):
+                    raise
+                result = None
+        except asyncio.CancelledError:
+            self._edits.pop(key, None)
+            pending.future.cancel()
+            raise
+        except Exception as e:
+            self._edits.pop(key, None)
+            pending.future.set_exception(e)
+            pending.future.exception()  # помечаем полученным: ждущих может и не быть
+            raise
+        pending.future.set_result(result)
+        return result
+
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str, **kwargs) -> Optional[Any]:
+        return await self._edit(self.bot.edit_message_text, chat_id, message_id, {"text": text, **kwargs})
+
+    async def edit_message_reply_markup(self, chat_id: int, message_id: int, reply_markup=None) -> Optional[Any]:
+        return await self._edit(self.bot.edit_message_reply_markup, chat_id, message_id, {"reply_markup": reply_markup})
+
+
+sender = OutboundScheduler(bot)
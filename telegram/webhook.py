@@ -0,0 +1,98 @@
+import asyncio
+import hmac
+import logging
+import os
+
+from aiogram.types import Update
+from fastapi import APIRouter, HTTPException, Request, Response
+from pydantic import ValidationError
+
+from telegram.core import bot, dp
+
+logger = logging.getLogger("uvicorn.error")
+
+# polling — как раньше (один воркер-лидер тянет getUpdates); webhook — Telegram сам шлёт апдейты в API
+TELEGRAM_MODE = os.getenv("TELEGRAM_MODE", "polling").lower()
+# публичный URL этого роута, например https://api.example.com/telegram/webhook
+WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "")
+# Telegram пришлёт его в X-Telegram-Bot-Api-Secret-Token (1-256 символов A-Z a-z 0-9 _ -)
+WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "")
+WEBHOOK_QUEUE_SIZE = int(os.getenv("TELEGRAM_WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_WORKERS = int(os.getenv("TELEGRAM_WEBHOOK_WORKERS", "8"))
+# сколько ждём обработки уже принятых апдейтов при остановке
+_DRAIN_SECONDS = 10.0
+
+router = APIRouter(prefix="/telegram", tags=["telegram"], include_in_schema=False)
+
+_queue: asyncio.Queue = asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+_workers: list[asyncio.Task] = []
+
+
+@router.post("/webhook")
+async def telegram_webhook(request: Request):
+    if TELEGRAM_MODE != "webhook":
+        raise HTTPException(status_code=404)
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not WEBHOOK_SECRET or not hmac.compare_digest(token, WEBHOOK_SECRET):
+        raise HTTPException(status_code=401, detail="Invalid secret token")
+
+    try:
+        update = Update.model_validate(await request.json(), context={"bot": bot})
+    except (ValidationError, ValueError) as e:
+        # не-2xx Telegram будет повторять вечно, а этот апдейт не разберём и потом — пропускаем
+        logger.warning(f"Telegram webhook: malformed update skipped: {e!r}"[:1000])
+        return Response(status_code=200)
+    try:
+        _queue.put_nowait(update)
+    except asyncio.QueueFull:
+        # обработчики не успевают: не-2xx — Telegram повторит доставку позже
+        logger.warning("Telegram webhook: update queue is full, asking Telegram to retry")
+        return Response(status_code=503, headers={"Retry-After": "1"})
+    return Response(status_code=200)
+
+
+async def _worker() -> None:
+    while True:
+        update = await _queue.get()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception:
+            logger.exception(f"Telegram webhook: failed to handle update {update.update_id}")
+        finally:
+            _queue.task_done()
+
+
+def start_webhook_workers() -> None:
+    """Пул обработчиков очереди — в каждом воркере uvicorn (апдейт приходит в любой)."""
+    for _ in range(WEBHOOK_WORKERS - len(_workers)):
+        _workers.append(asyncio.create_task(_worker()))
+
+
+async def stop_webhook_workers() -> None:
+    try:
+        await asyncio.wait_for(_queue.join(), _DRAIN_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning(f"Telegram webhook: {_queue.qsize()} updates dropped on shutdown")
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+async def register_webhook() -> None:
+    """
+    Зарегистрировать webhook у Telegram (делает только лидер). Накопившиеся апдейты
+    не выбрасываем — они придут в новый webhook.
+    """
+    if not WEBHOOK_URL or not WEBHOOK_SECRET:
+        raise RuntimeError("TELEGRAM_WEBHOOK_URL and TELEGRAM_WEBHOOK_SECRET are required in webhook mode")
+    used = dp.resolve_used_update_types()
+    await bot.set_webhook(
+        WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=used,
+        drop_pending_updates=False,
+        max_connections=WEBHOOK_WORKERS,
+    )
+    info = await bot.get_webhook_info()
+    logger.info(f"Webhook set: url={info.url!r}, pending={info.pending_update_count}, ALLOWED_UPDATES={used}")
@@ -0,0 +1,121 @@
+"""
+Общие фикстуры тестов.
+
+Тесты с БД идут на отдельном Postgres из TEST_DATABASE_URL (postgresql+asyncpg://...).
+Переменная не задана — поднимаем одноразовый локальный Postgres из pgserver
+(requirements-dev.txt); нет и его — такие тесты пропускаются, чистые (скоринг и т.п.)
+идут всегда.
+Каждый тест работает в транзакции, которая в конце откатывается: commit() в сервисах
+превращается в SAVEPOINT (join_transaction_mode="create_savepoint").
+"""
+import os
+import tempfile
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+if not TEST_DATABASE_URL:
+    try:
+        import pgserver
+    except ImportError:
+        pgserver = None
+    if pgserver is not None:
+        # initdb во временный каталог: сервер и данные удаляются по завершении тестов
+        _pg = pgserver.get_server(tempfile.mkdtemp(prefix="quiz-test-pg-"), cleanup_mode="delete")
+        TEST_DATABASE_URL = _pg.get_uri().replace("postgresql://", "postgresql+asyncpg://", 1)
+# модули приложения читают окружение при импорте; движок приложения в тестах не подключается
+os.environ.setdefault("DATABASE_URL", TEST_DATABASE_URL or "postgresql+asyncpg://localhost/test")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:TEST-TOKEN")
+
+import pytest
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.common.db import AsyncSessionLocal, Base
+# все модели должны попасть в Base.metadata до create_all
+import app.users.models, app.events.models, app.quizes.models, app.media.models  # noqa: E401,F401
+from app.common.sqlstats import instrument_engine
+
+
+@pytest.fixture
+async def db_engine():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    engine = create_async_engine(TEST_DATABASE_URL, poolclass=NullPool)
+    # счётчики SQL для app.common.sqlstats.assert_queries
+    instrument_engine(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+async def session(db_engine):
+    async with db_engine.connect() as conn:
+        trans = await conn.begin()
+        s = AsyncSession(bind=conn, expire_on_commit=False, join_transaction_mode="create_savepoint")
+        try:
+            yield s
+        finally:
+            await s.close()
+            await trans.rollback()
+
+
+# telegram_id игроков committed_quiz — вне диапазона test_query_counts
+COMMITTED_TID = 910_001
+
+
+@pytest.fixture
+async def committed_quiz(db_engine):
+    """
+    Активный квиз с тремя вопросами (single / multiple / open) и два игрока — закоммиченные:
+    для кода, который открывает свои сессии (AsyncSessionLocal). Удаляются в конце теста
+    каскадом от игроков (создатель события — первый из них).
+    """
+    from app.events.models import Event
+    from app.quizes.models import Quiz, QuizQuestion, QuestionType
+    from app.users.models import User
+
+    tids = [COMMITTED_TID, COMMITTED_TID + 1]
+    async with AsyncSessionLocal() as s:
+        await s.execute(delete(User).where(User.telegram_id.in_(tids)))
+        users = [
+            User(telegram_id=tid, first_name=f"P{i}", last_name="Test", nickname=f"committed{i}", is_active=True, is_admin=i == 0, points=0)
+            for i, tid in enumerate(tids)
+        ]
+        s.add_all(users)
+        await s.flush()
+        event = Event(name=f"Committed event {tids[0]}", creator_id=tids[0])
+        s.add(event)
+        await s.flush()
+        quiz = Quiz(name="Committed quiz", event_id=event.id, is_active=True)
+        s.add(quiz)
+        await s.flush()
+        questions = [
+            QuizQuestion(
+                quiz_id=quiz.id, type=QuestionType.SINGLE, points=2,
+                text_i18n={"ru": "Один"}, options_i18n={"ru": ["A", "B"]}, correct_answers_i18n={"ru": ["A"]},
+            ),
+            QuizQuestion(
+                quiz_id=quiz.id, type=QuestionType.MULTIPLE, points=3,
+                text_i18n={"ru": "Несколько"}, options_i18n={"ru": ["A", "B", "C"]},
+                correct_answers_i18n={"ru": ["A", "B"], "en": ["A", "C"]},
+            ),
+            QuizQuestion(
+                quiz_id=quiz.id, type=QuestionType.OPEN, points=1,
+                text_i18n={"ru": "Открытый"}, correct_answers_i18n={"ru": ["Ёлка"]},
+            ),
+        ]
+        s.add_all(questions)
+        await s.commit()
+        data = {
+            "quiz_id": quiz.id,
+            "event_id": event.id,
+            "question_ids": [q.id for q in questions],
+            "user_ids": [u.id for u in users],
+            "telegram_ids": tids,
+        }
+    yield data
+    async with AsyncSessionLocal() as s:
+        await s.execute(delete(User).where(User.telegram_id.in_(tids)))
+        await s.commit()
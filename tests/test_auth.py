@@ -0,0 +1,64 @@
+"""
+Авторизация: подписанный токен проверяется в памяти, отзыв читается через кеш identity —
+повторный запрос с тем же токеном не ходит в БД. Старый ?current_user_telegram_id=
+по умолчанию выключен.
+"""
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app.common import common, identity
+from app.common.common import resolve_identity
+from app.common.identity import Identity
+from app.common.sqlstats import assert_queries
+from app.users.auth import issue_token, verify_token
+from app.users.models import User
+
+TID = 930_001
+
+
+@pytest.fixture
+async def user(session):
+    u = User(telegram_id=TID, first_name="A", last_name="B", nickname="authuser", is_active=True, is_admin=True)
+    session.add(u)
+    await session.flush()
+    identity._cache.clear()
+    # SAVEPOINT тестовой транзакции — не запрос авторизации
+    await session.connection()
+    return Identity(u.id, TID, True, True)
+
+
+def _bearer(token: str) -> HTTPAuthorizationCredentials:
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def test_telegram_id_param_disabled_by_default():
+    assert common.ALLOW_TELEGRAM_ID_PARAM is False
+
+
+async def test_telegram_id_param_rejected(session, user):
+    with pytest.raises(HTTPException) as e:
+        await resolve_identity(session=session, credentials=None, current_user_telegram_id=TID)
+    assert e.value.status_code == 401
+
+
+async def test_bearer_token_needs_no_db_after_first_request(session, user):
+    token = issue_token(user)
+    assert verify_token(token)[0] == user
+
+    with assert_queries() as stats:
+        assert await resolve_identity(session=session, credentials=_bearer(token), current_user_telegram_id=None) == user
+    assert stats.count == 1  # первая проверка отзыва — в кеш identity
+    with assert_queries() as stats:
+        for _ in range(10):
+            await resolve_identity(session=session, credentials=_bearer(token), current_user_telegram_id=None)
+    assert stats.count == 0
+
+
+async def test_tampered_token_rejected(user):
+    token = issue_token(user)
+    body, sig = token.rsplit(".", 1)
+    forged = issue_token(Identity(user.id + 1, user.telegram_id, True, True)).split(".")[1]
+    for bad in (f"{body}.{sig[:-2]}AA", f"v1.{forged}.{sig}", "garbage"):
+        with pytest.raises(HTTPException):
+            verify_token(bad)
@@ -0,0 +1,82 @@
+"""
+Цена авторизации запроса: проверка подписи токена и полный resolve_identity по Bearer
+(кеш identity прогрет) против старого ?current_user_telegram_id=. Запуск:
+
+    pytest -m bench -s tests/test_bench_auth.py
+"""
+import hashlib
+import hmac
+import json
+import time
+from urllib.parse import urlencode
+
+import pytest
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app.common import common, identity
+from app.common.common import resolve_identity
+from app.common.identity import Identity
+from app.common.sqlstats import assert_queries
+from app.users.auth import BOT_TOKEN, issue_token, verify_init_data, verify_token
+from app.users.models import User
+
+pytestmark = pytest.mark.bench
+
+N = 20_000
+TID = 940_001
+
+
+def _report(name: str, seconds: float, n: int) -> None:
+    print(f"\n{name}: {seconds / n * 1e6:.2f} us/op ({n} ops)")
+
+
+def _init_data(telegram_id: int) -> str:
+    fields = {"auth_date": str(int(time.time())), "user": json.dumps({"id": telegram_id, "first_name": "A"})}
+    check = "\n".join(f"{k}={fields[k]}" for k in sorted(fields))
+    secret = hmac.new(b"WebAppData", BOT_TOKEN.encode("utf-8"), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret, check.encode("utf-8"), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+def test_bench_verify_token():
+    token = issue_token(Identity(1, TID, False, True))
+    t0 = time.perf_counter()
+    for _ in range(N):
+        verify_token(token)
+    _report("verify_token", time.perf_counter() - t0, N)
+
+
+def test_bench_verify_init_data():
+    # только вход (POST /users/auth/telegram), не каждый запрос
+    data = _init_data(TID)
+    t0 = time.perf_counter()
+    for _ in range(N):
+        verify_init_data(data)
+    _report("verify_init_data", time.perf_counter() - t0, N)
+
+
+async def test_bench_resolve_identity(session, monkeypatch):
+    session.add(User(telegram_id=TID, first_name="A", last_name="B", nickname="benchuser", is_active=True, is_admin=False))
+    await session.flush()
+    ident = await identity.get_identity(session, TID)
+    creds = HTTPAuthorizationCredentials(scheme="Bearer", credentials=issue_token(ident))
+    monkeypatch.setattr(common, "ALLOW_TELEGRAM_ID_PARAM", True)
+
+    n = N // 4
+    with assert_queries() as stats:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            await resolve_identity(session=session, credentials=creds, current_user_telegram_id=None)
+        _report("resolve_identity (Bearer, warm cache)", time.perf_counter() - t0, n)
+        t0 = time.perf_counter()
+        for _ in range(n):
+            await resolve_identity(session=session, credentials=None, current_user_telegram_id=TID)
+        _report("resolve_identity (?current_user_telegram_id, warm cache)", time.perf_counter() - t0, n)
+    assert stats.count == 0
+
+    # холодный кеш: старый способ без кеша — SELECT на каждый запрос
+    t0 = time.perf_counter()
+    for _ in range(n // 10):
+        identity._cache.clear()
+        await resolve_identity(session=session, credentials=None, current_user_telegram_id=TID)
+    _report("resolve_identity (?current_user_telegram_id, cold cache = DB)", time.perf_counter() - t0, n // 10)
@@ -0,0 +1,102 @@
+"""
+CPU на запрос в горячих путях: POST /quizes/answer (submit_answer, путь БД) и зависимость
+CurrentUser по Bearer-токену. submit_answer гоняется дважды — с кешем скомпилированного SQL
+и без него (compiled_cache=None), разница — то, что экономят lambda_stmt и кеш. Запуск:
+
+    pytest -m bench -s tests/test_bench_requests.py
+"""
+import time
+
+import pytest
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.common import identity
+from app.common.common import CurrentUser, resolve_identity
+from app.common.sqlstats import assert_queries
+from app.events import timer
+from app.events.models import Event
+from app.quizes.models import QuestionType, Quiz, QuizQuestion
+from app.quizes.schemas import UserAnswerCreate
+from app.quizes.services import QuizService
+from app.users.auth import issue_token
+from app.users.models import User
+
+pytestmark = pytest.mark.bench
+
+N = 300
+TID = 940_101
+
+
+async def _seed(session: AsyncSession) -> tuple[identity.Identity, int, int]:
+    session.add(User(telegram_id=TID, first_name="B", last_name="Bench", nickname="benchreq", is_active=True, is_admin=True))
+    await session.flush()
+    event = Event(name="Bench event", creator_id=TID)
+    session.add(event)
+    await session.flush()
+    quiz = Quiz(name="Bench quiz", event_id=event.id, is_active=True)
+    session.add(quiz)
+    await session.flush()
+    question = QuizQuestion(
+        quiz_id=quiz.id, type=QuestionType.SINGLE, points=1,
+        text_i18n={"ru": "?"}, options_i18n={"ru": ["A", "B"]}, correct_answers_i18n={"ru": ["A"]},
+    )
+    session.add(question)
+    await session.flush()
+    # пользователь каждый раз новый (транзакция откатывается) — старый id в кеше не нужен
+    identity._cache.clear()
+    ident = await identity.get_identity(session, TID)
+    return ident, quiz.id, question.id
+
+
+def _report(name: str, cpu: float, wall: float, queries: int, n: int) -> None:
+    print(f"\n{name}: {cpu / n * 1e6:.0f} us CPU/op, {wall / n * 1e6:.0f} us wall/op, {queries / n:.1f} queries/op ({n} ops)")
+
+
+async def _submit_loop(db_engine, *, compiled_cache: bool) -> None:
+    async with db_engine.connect() as conn:
+        if not compiled_cache:
+            await conn.execution_options(compiled_cache=None)
+        trans = await conn.begin()
+        session = AsyncSession(bind=conn, expire_on_commit=False, join_transaction_mode="create_savepoint")
+        try:
+            ident, quiz_id, question_id = await _seed(session)
+            svc = QuizService(session, ident)
+            data = UserAnswerCreate(quiz_id=quiz_id, question_id=question_id, answers="A", locale="ru")
+            # разогрев: первый вызов компилирует и готовит statement-ы
+            await svc.submit_answer(data)
+            with assert_queries() as stats:
+                cpu0, wall0 = time.process_time(), time.perf_counter()
+                for _ in range(N):
+                    await svc.submit_answer(data)
+                cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+            label = "compiled cache" if compiled_cache else "no compiled cache"
+            _report(f"submit_answer ({label})", cpu, wall, stats.count, N)
+        finally:
+            await session.close()
+            await trans.rollback()
+
+
+async def test_bench_submit_answer(db_engine, monkeypatch):
+    # окна таймеров уже пришли по NOTIFY — без отдельного запроса на каждый ответ
+    monkeypatch.setattr(timer, "_windows_loaded", True)
+    await _submit_loop(db_engine, compiled_cache=True)
+    await _submit_loop(db_engine, compiled_cache=False)
+
+
+async def test_bench_current_user(session):
+    await _seed(session)
+    ident = await identity.get_identity(session, TID)
+    creds = HTTPAuthorizationCredentials(scheme="Bearer", credentials=issue_token(ident))
+    dependency = CurrentUser(require_admin=True)
+    # разогрев кеша identity (проверка отзыва токена)
+    await dependency(identity=await resolve_identity(session=session, credentials=creds, current_user_telegram_id=None))
+
+    n = N * 20
+    with assert_queries() as stats:
+        cpu0, wall0 = time.process_time(), time.perf_counter()
+        for _ in range(n):
+            await dependency(identity=await resolve_identity(session=session, credentials=creds, current_user_telegram_id=None))
+        cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+    _report("CurrentUser(require_admin=True), Bearer", cpu, wall, stats.count, n)
+    assert stats.count == 0
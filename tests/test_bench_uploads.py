@@ -0,0 +1,70 @@
+"""
+Загрузка 50 картинок по 2 МБ одним запросом: по очереди (stream_upload в цикле) против
+stream_uploads (до UPLOAD_CONCURRENCY файлов параллельно) — весь путь store_stream:
+чтение чанками, sha256, временный файл, pin_blob и перенос в CAS. Запуск:
+
+    pytest -m bench -s tests/test_bench_uploads.py
+"""
+import io
+import os
+import time
+
+import pytest
+from fastapi import UploadFile
+from sqlalchemy import delete
+
+from app.common import files
+from app.common.db import AsyncSessionLocal
+from app.common.files import LocalStorage, stream_upload, stream_uploads
+from app.media.models import MediaBlob
+
+pytestmark = pytest.mark.bench
+
+N_FILES = 50
+SIZE = 2 * 1024 * 1024
+_JPEG = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+
+
+@pytest.fixture
+def storage(db_engine, tmp_path, monkeypatch):
+    backend = LocalStorage(tmp_path / "media", "/media")
+    monkeypatch.setattr(files, "_storage", backend)
+    monkeypatch.setattr(files, "CAS_TMP_DIR", tmp_path / "media" / "cas" / ".tmp")
+    return backend
+
+
+def _payloads() -> list[bytes]:
+    # каждый файл уникален — дедупликация CAS не должна срезать работу
+    return [_JPEG + os.urandom(SIZE - len(_JPEG)) for _ in range(N_FILES)]
+
+
+def _uploads(payloads: list[bytes]) -> list[UploadFile]:
+    return [UploadFile(io.BytesIO(p), filename=f"{i}.jpg") for i, p in enumerate(payloads)]
+
+
+async def _forget(stored) -> None:
+    async with AsyncSessionLocal() as s:
+        await s.execute(delete(MediaBlob).where(MediaBlob.sha256.in_([m.sha256 for m in stored])))
+        await s.commit()
+
+
+def _report(name: str, seconds: float) -> None:
+    mb = N_FILES * SIZE / 1024 / 1024
+    print(f"\n{name}: {seconds * 1e3:.0f} ms for {N_FILES} x {SIZE // 1024 // 1024} MB ({mb / seconds:.0f} MB/s)")
+
+
+async def test_bench_upload_50_x_2mb(storage):
+    for label, concurrent in [("sequential stream_upload", False), ("stream_uploads", True)]:
+        payloads = _payloads()
+        batch = _uploads(payloads)
+        t0 = time.perf_counter()
+        if concurrent:
+            stored = await stream_uploads(batch)
+        else:
+            stored = [await stream_upload(f) for f in batch]
+        _report(label, time.perf_counter() - t0)
+        try:
+            # порядок результата = порядок файлов (варианты A, B, C... — позиции в списке)
+            assert [storage._path(m.key).read_bytes()[:64] for m in stored] == [p[:64] for p in payloads]
+        finally:
+            await _forget(stored)
@@ -0,0 +1,215 @@
+"""
+Живая сессия квиза (app/quizes/live.py): оценка как у QuizService, восстановление из
+журнала после падения владельца, фенсинг при пересечении эпох и запись ответов на
+удалённые вопросы. Сессии грузятся прямо через _load — без advisory-блокировок движка.
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import delete, func, select
+
+from app.common.db import AsyncSessionLocal
+from app.common.identity import Identity
+from app.quizes import live as live_mod
+from app.quizes.live import LiveQuizEngine, _journal_path, _load, _on_quiz, _rejected_path, _taken_path
+from app.quizes.models import LiveQuizEpoch, QuizQuestion, QuizUserAnswer
+from app.quizes.schemas import UserAnswerCreate
+from app.quizes.services import QuizService
+from app.users.models import User
+
+
+@pytest.fixture(autouse=True)
+def journal_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(live_mod, "LIVE_JOURNAL_DIR", str(tmp_path))
+    return tmp_path
+
+
+async def _answers(quiz_id: int) -> list[tuple[int, int]]:
+    async with AsyncSessionLocal() as s:
+        return sorted((await s.execute(
+            select(QuizUserAnswer.user_id, QuizUserAnswer.question_id).where(QuizUserAnswer.quiz_id == quiz_id)
+        )).all())
+
+
+async def _points(user_id: int) -> int:
+    async with AsyncSessionLocal() as s:
+        return await s.scalar(select(User.points).where(User.id == user_id))
+
+
+async def _crash(live) -> None:
+    """Владелец упал: фоновая запись остановлена, в БД ничего не дописано, журнал на диске."""
+    live.writer.cancel()
+    await asyncio.gather(live.writer, return_exceptions=True)
+    await live.journal.close()
+
+
+@pytest.mark.parametrize("locale", ["ru", "en", "de"])
+async def test_live_scoring_matches_db_path(committed_quiz, locale):
+    # один и тот же ответ: игрок 0 — через живую сессию, игрок 1 — через QuizService (БД)
+    quiz_id = committed_quiz["quiz_id"]
+    single, multiple, open_ = committed_quiz["question_ids"]
+    live_uid, db_uid = committed_quiz["user_ids"]
+    live = await _load(quiz_id)
+    try:
+        for qid, answers in [(single, "A"), (multiple, ["C", "A"]), (open_, " ёлка ")]:
+            got = await live.submit(live_uid, qid, answers, locale)
+            async with AsyncSessionLocal() as s:
+                svc = QuizService(s, Identity(db_uid, committed_quiz["telegram_ids"][1], False, True))
+                expected = await svc.submit_answer(UserAnswerCreate(quiz_id=quiz_id, question_id=qid, answers=answers, locale=locale))
+            assert got["awarded_points"] == expected["awarded_points"], (qid, answers, locale)
+            assert got["limits"] == expected["limits"]
+    finally:
+        await live.close()
+    assert await _points(live_uid) == await _points(db_uid)
+
+
+async def test_live_repeat_and_over_limit_match_db_path(committed_quiz):
+    # повтор не запрещён ни там, ни там: каждый ответ расходует лимит, очки — пока лимит был > 0
+    quiz_id = committed_quiz["quiz_id"]
+    single, multiple, open_ = committed_quiz["question_ids"]
+    live_uid, db_uid = committed_quiz["user_ids"]
+    steps = [
+        (single, "A"),
+        (single, "A"),          # повтор того же вопроса
+        (multiple, ["B", "A"]),  # последний ответ в лимите
+        (open_, "ёлка"),        # сверх лимита: ответ пишется, очков нет
+        (single, "A"),
+    ]
+    live = await _load(quiz_id)
+    try:
+        for step, (qid, answers) in enumerate(steps):
+            got = await live.submit(live_uid, qid, answers, "ru")
+            async with AsyncSessionLocal() as s:
+                svc = QuizService(s, Identity(db_uid, committed_quiz["telegram_ids"][1], False, True))
+                expected = await svc.submit_answer(UserAnswerCreate(quiz_id=quiz_id, question_id=qid, answers=answers, locale="ru"))
+            assert got["awarded_points"] == expected["awarded_points"], step
+            assert got["limits"] == expected["limits"], step
+            assert got["isCompleted"] == expected["isCompleted"], step
+        assert expected["awarded_points"] == 0 and expected["limits"]["remaining_allowed"] == 0
+        await live.flush()
+    finally:
+        await live.close()
+    assert await _points(live_uid) == await _points(db_uid) == 2 + 2 + 3
+    answers = await _answers(quiz_id)
+    assert answers.count((live_uid, single)) == answers.count((db_uid, single)) == 3
+
+
+async def test_crash_replay_round_trip(committed_quiz, journal_dir):
+    quiz_id = committed_quiz["quiz_id"]
+    qids = committed_quiz["question_ids"]
+    uid = committed_quiz["user_ids"][0]
+
+    first = await _load(quiz_id)
+    for qid in qids:
+        await first.submit(uid, qid, "A", "ru")
+    await _crash(first)
+    assert await _answers(quiz_id) == []
+
+    # следующий владелец забирает журнал (_take_journal) и дописывает хвост в БД
+    second = await _load(quiz_id)
+    try:
+        assert second.epoch == first.epoch + 1
+        assert await _answers(quiz_id) == sorted((uid, qid) for qid in qids)
+        assert await _points(uid) == sum(rec["points"] for rec in first._unpersisted)
+        assert second.answered_questions(uid) == (set(qids), 3)
+        assert not _journal_path(quiz_id, first.epoch).exists()
+        assert not _taken_path(_journal_path(quiz_id, first.epoch)).exists()
+
+        # упавший владелец ожил и дописывает то же — строка эпохи не даст записать дважды
+        await first._persist(list(first._unpersisted))
+        assert len(await _answers(quiz_id)) == 3
+        async with AsyncSessionLocal() as s:
+            row = await s.get(LiveQuizEpoch, (quiz_id, first.epoch))
+            assert row.persisted_seq == 3
+    finally:
+        await second.close()
+
+
+async def test_fencing_when_epochs_overlap(committed_quiz):
+    quiz_id = committed_quiz["quiz_id"]
+    single, multiple, _ = committed_quiz["question_ids"]
+    uid = committed_quiz["user_ids"][0]
+
+    old = await _load(quiz_id)
+    await old.submit(uid, single, "A", "ru")
+    # второй воркер захватил квиз, пока первый ещё жив
+    new = await _load(quiz_id)
+    try:
+        assert await _answers(quiz_id) == [(uid, single)]
+
+        # старый владелец видит, что журнал забрали: ответ подтверждается только после записи в БД
+        result = await old.submit(uid, multiple, ["A", "B"], "ru")
+        assert result["awarded_points"] == 3
+        assert old.journal.fenced and old.closed
+        assert await _answers(quiz_id) == sorted([(uid, single), (uid, multiple)])
+        assert live_mod.live_engine.get(quiz_id) is None
+
+        await old.close()
+        assert len(await _answers(quiz_id)) == 2
+        assert await _points(uid) == 5
+    finally:
+        await new.close()
+
+
+async def test_deleted_question_does_not_block_writer(committed_quiz, journal_dir):
+    quiz_id = committed_quiz["quiz_id"]
+    single, multiple, open_ = committed_quiz["question_ids"]
+    uid = committed_quiz["user_ids"][0]
+
+    live = await _load(quiz_id)
+    await live.submit(uid, single, "A", "ru")
+    await live.submit(uid, multiple, ["A", "B"], "ru")
+    await live.submit(uid, open_, "ёлка", "ru")
+    await _crash(live)
+    async with AsyncSessionLocal() as s:
+        await s.execute(delete(QuizQuestion).where(QuizQuestion.id == multiple))
+        await s.commit()
+
+    # восстановление из журнала: ответ на удалённый вопрос откладывается, остальные записаны
+    replayed = await _load(quiz_id)
+    try:
+        assert await _answers(quiz_id) == sorted([(uid, single), (uid, open_)])
+        assert _rejected_path(quiz_id).read_text().count("\n") == 1
+
+        # то же в фоновой записи: пачка с плохой строкой не застревает
+        await replayed.submit(uid, single, "B", "ru")
+        async with AsyncSessionLocal() as s:
+            await s.execute(delete(QuizQuestion).where(QuizQuestion.id == open_))
+            await s.commit()
+        await replayed.submit(uid, single, "A", "ru")
+        await replayed.flush()
+        async with AsyncSessionLocal() as s:
+            n = await s.scalar(select(func.count()).select_from(QuizUserAnswer).where(QuizUserAnswer.quiz_id == quiz_id))
+        assert n == 3
+    finally:
+        await replayed.close()
+    assert not _journal_path(quiz_id, replayed.epoch).exists()
+
+
+async def test_quiz_change_invalidates_session():
+    engine = LiveQuizEngine()
+
+    class _Session:
+        closed = False
+        stale = False
+
+    engine._quizes = {1: _Session(), 2: _Session()}
+    assert engine.get(1) is not None
+
+    # quiz_changed → NOTIFY → _on_quiz: ответы идут мимо сессии, пока сканирование её не перезагрузит
+    engine.invalidate(1)
+    assert engine.get(1) is None and engine.get(2) is not None
+    # уведомления потерялись — перезагружаем всё
+    engine.invalidate(None)
+    assert engine.get(2) is None
+
+
+async def test_on_quiz_marks_owned_session_stale(monkeypatch):
+    engine = LiveQuizEngine()
+    monkeypatch.setattr(live_mod, "live_engine", engine)
+    seen = []
+    monkeypatch.setattr(engine, "invalidate", seen.append)
+    _on_quiz("7")
+    _on_quiz(None)
+    _on_quiz("garbage")
+    assert seen == [7, None]
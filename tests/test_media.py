@@ -0,0 +1,130 @@
+"""
+Счётчики ссылок на блобы CAS (app/media/services.py): pin_blob не держит блокировку строки
+media_blobs во время загрузки, а каскадное удаление вопросов (вместе с создателем события)
+снимает их ссылки.
+"""
+import hashlib
+
+import pytest
+from sqlalchemy import delete, select, text
+
+from app.common import files
+from app.common.db import AsyncSessionLocal
+from app.common.files import LocalStorage, cas_key
+from app.events.models import Event
+from app.media.models import MediaBlob
+from app.media.services import pin_blob, retain_media
+from app.quizes.models import QuestionType, Quiz, QuizQuestion
+from app.users import crud
+from app.users.models import User
+
+TID = 950_001
+
+
+@pytest.fixture
+def storage(db_engine, tmp_path, monkeypatch):
+    backend = LocalStorage(tmp_path, "/media")
+    monkeypatch.setattr(files, "_storage", backend)
+    return backend
+
+
+async def _blob(sha: str):
+    async with AsyncSessionLocal() as s:
+        return (await s.execute(select(MediaBlob.refcount, MediaBlob.pinned_until).where(MediaBlob.sha256 == sha))).first()
+
+
+async def _forget(sha: str) -> None:
+    async with AsyncSessionLocal() as s:
+        await s.execute(delete(MediaBlob).where(MediaBlob.sha256 == sha))
+        await s.commit()
+
+
+async def test_pin_blob_uploads_without_row_lock(storage):
+    data = b"pin-blob-upload"
+    sha = hashlib.sha256(data).hexdigest()
+    puts = []
+
+    async def put(key: str) -> None:
+        # строки ещё нет, и никто её не держит: удаление и другие загрузки не ждут сеть
+        async with AsyncSessionLocal() as s:
+            await s.execute(text("SET LOCAL lock_timeout = '100ms'"))
+            assert (await s.execute(select(MediaBlob.sha256).where(MediaBlob.sha256 == sha).with_for_update())).first() is None
+        path = storage._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        puts.append(key)
+
+    try:
+        created, pinned_until = await pin_blob(sha, ".bin", put)
+        assert created and pinned_until is not None
+        assert puts == [cas_key(sha, ".bin")]
+        assert (await _blob(sha)).pinned_until == pinned_until
+
+        # содержимое уже есть — повторная загрузка его не кладёт
+        created, _ = await pin_blob(sha, ".bin", put)
+        assert not created and len(puts) == 1
+    finally:
+        await _forget(sha)
+
+
+async def test_pin_blob_restores_object_deleted_before_pin(storage):
+    data = b"pin-blob-race"
+    sha = hashlib.sha256(data).hexdigest()
+    key = cas_key(sha, ".bin")
+    puts = []
+
+    async def put(key: str) -> None:
+        path = storage._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        puts.append(key)
+        if len(puts) == 1:
+            # параллельный unlink_media успел стереть объект до пина
+            path.unlink()
+
+    try:
+        created, _ = await pin_blob(sha, ".bin", put)
+        assert created and len(puts) == 2
+        assert await storage.stat(key) is not None
+    finally:
+        await _forget(sha)
+
+
+async def test_deleting_creator_releases_question_media(storage):
+    data = b"cascade-media"
+    sha = hashlib.sha256(data).hexdigest()
+    key = cas_key(sha, ".bin")
+    path = storage._path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    url = storage.url_for(key)
+
+    async with AsyncSessionLocal() as s:
+        await s.execute(delete(User).where(User.telegram_id == TID))
+        s.add(User(telegram_id=TID, first_name="M", last_name="Test", nickname="mediaowner", is_active=True, is_admin=True))
+        await s.flush()
+        event = Event(name=f"Media event {TID}", creator_id=TID)
+        s.add(event)
+        await s.flush()
+        quiz = Quiz(name="Media quiz", event_id=event.id)
+        s.add(quiz)
+        await s.flush()
+        # две ссылки одного вопроса на один файл считаются одной (как при сохранении)
+        s.add_all([
+            QuizQuestion(
+                quiz_id=quiz.id, type=QuestionType.OPEN, points=1, text_i18n={"ru": f"Q{i}"},
+                correct_answers_i18n={"ru": ["x"]}, images_urls=[url, url],
+            )
+            for i in range(2)
+        ])
+        await retain_media(s, [url, url])
+        await s.commit()
+    assert (await _blob(sha)).refcount == 2
+
+    try:
+        async with AsyncSessionLocal() as s:
+            await crud.delete_user(s, TID)
+        assert await _blob(sha) is None
+        assert await storage.stat(key) is None
+    finally:
+        await _forget(sha)
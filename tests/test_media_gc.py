@@ -0,0 +1,21 @@
+"""
+Сборщик мусора медиа (app/media/gc.py) ходит только по локальному MEDIA_ROOT: с другим
+хранилищем он отказывается работать, а не проходит впустую.
+"""
+import pytest
+from fastapi import HTTPException
+
+from app.media import gc
+
+
+async def test_gc_refuses_non_local_storage(monkeypatch):
+    monkeypatch.setattr(gc, "MEDIA_STORAGE", "s3")
+    assert not gc.gc_supported()
+    with pytest.raises(HTTPException) as e:
+        await gc.collect_garbage(dry_run=True)
+    assert e.value.status_code == 501
+
+
+def test_gc_supports_local_storage(monkeypatch):
+    monkeypatch.setattr(gc, "MEDIA_STORAGE", "local")
+    assert gc.gc_supported()
@@ -0,0 +1,151 @@
+"""
+Зеркалирование внешних картинок (app/media/mirror.py) против локального HTTP-сервера:
+скачивание в CAS, редиректы, повторы на 5xx, окончательные ошибки и подмена URL при
+выдаче. Сервер слушает 127.0.0.1, поэтому в «счастливых» тестах проверка публичности
+адреса разрешает именно его; сама защита от SSRF проверяется отдельно.
+"""
+import hashlib
+import os
+from collections import Counter
+
+import aiohttp
+import pytest
+from aiohttp import web
+from sqlalchemy import delete, select
+
+from app.common import files
+from app.common.db import AsyncSessionLocal
+from app.common.files import LocalStorage
+from app.media import mirror
+from app.media.models import ExternalMedia, MediaBlob, MirrorStatus
+
+_JPEG = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+
+
+class _Origin:
+    """Сторонний хост с картинками: считает запросы по путям."""
+
+    def __init__(self):
+        self.image = _JPEG + os.urandom(4096)
+        self.hits: Counter = Counter()
+        self.url = ""
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        path = request.path
+        self.hits[path] += 1
+        if path == "/img.jpg":
+            return web.Response(body=self.image, content_type="image/jpeg")
+        if path == "/moved":
+            raise web.HTTPFound("/img.jpg")
+        if path == "/meta":
+            # редирект во внутреннюю сеть (метаданные облака)
+            raise web.HTTPFound("http://169.254.169.254/latest/meta-data/")
+        if path == "/flaky" and self.hits[path] == 1:
+            return web.Response(status=503)
+        if path == "/flaky":
+            return web.Response(body=self.image, content_type="image/jpeg")
+        if path == "/text":
+            return web.Response(text="definitely not an image", content_type="text/plain")
+        return web.Response(status=404)
+
+
+@pytest.fixture
+async def origin():
+    server = _Origin()
+    app = web.Application()
+    app.router.add_route("GET", "/{tail:.*}", server.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    server.url = f"http://127.0.0.1:{port}"
+    yield server
+    await runner.cleanup()
+
+
+@pytest.fixture
+def storage(db_engine, tmp_path, monkeypatch):
+    backend = LocalStorage(tmp_path / "media", "/media")
+    monkeypatch.setattr(files, "_storage", backend)
+    monkeypatch.setattr(files, "CAS_TMP_DIR", tmp_path / "media" / "cas" / ".tmp")
+    return backend
+
+
+@pytest.fixture
+def loopback_is_public(monkeypatch):
+    monkeypatch.setattr(mirror, "_is_public_ip", lambda addr: addr == "127.0.0.1")
+    monkeypatch.setattr(mirror, "MIRROR_ENABLED", True)
+
+
+@pytest.fixture
+async def http():
+    async with aiohttp.ClientSession() as s:
+        yield s
+
+
+async def _cleanup(origin: _Origin, sha: str) -> None:
+    async with AsyncSessionLocal() as s:
+        await s.execute(delete(ExternalMedia).where(ExternalMedia.source_url.startswith(origin.url)))
+        await s.execute(delete(MediaBlob).where(MediaBlob.sha256 == sha))
+        await s.commit()
+
+
+async def _row(url: str) -> ExternalMedia:
+    async with AsyncSessionLocal() as s:
+        return await s.scalar(select(ExternalMedia).where(ExternalMedia.source_url == url))
+
+
+async def test_download_follows_redirect_into_cas(origin, storage, loopback_is_public, http):
+    sha = hashlib.sha256(origin.image).hexdigest()
+    stored = await mirror._download(http, f"{origin.url}/moved")
+    assert stored.sha256 == sha
+    assert storage._path(stored.key).read_bytes() == origin.image
+    assert origin.hits == Counter({"/moved": 1, "/img.jpg": 1})
+    await _cleanup(origin, sha)
+
+
+async def test_process_mirrors_and_rewrites_url(origin, storage, loopback_is_public, http):
+    sha = hashlib.sha256(origin.image).hexdigest()
+    urls = {name: f"{origin.url}/{name}" for name in ("img.jpg", "flaky", "missing", "text")}
+    try:
+        async with AsyncSessionLocal() as s:
+            await mirror.enqueue_external(s, urls.values())
+            await s.commit()
+        rows = await mirror._claim(10)
+        assert sorted(r.source_url for r in rows) == sorted(urls.values())
+        for r in rows:
+            await mirror._process(http, r.id, r.source_url, r.attempts)
+
+        done = await _row(urls["img.jpg"])
+        assert done.status == MirrorStatus.done.value and done.local_url == storage.url_for(files.cas_key(sha, ".jpg"))
+        # 503 — быстрый повтор в той же попытке
+        assert (await _row(urls["flaky"])).status == MirrorStatus.done.value
+        assert origin.hits["/flaky"] == 2
+        # 404 и не-картинка — повторять бессмысленно
+        for name in ("missing", "text"):
+            row = await _row(urls[name])
+            assert row.status == MirrorStatus.failed.value and row.last_error
+        assert origin.hits["/missing"] == 1
+
+        # одинаковое содержимое — один блоб на две ссылки
+        async with AsyncSessionLocal() as s:
+            assert await s.scalar(select(MediaBlob.refcount).where(MediaBlob.sha256 == sha)) == 2
+            local = await mirror.mirrored_urls(s, [urls["img.jpg"], urls["missing"], "/media/local.jpg"])
+        assert local == {urls["img.jpg"]: done.local_url}
+    finally:
+        await _cleanup(origin, sha)
+
+
+async def test_redirect_to_private_address_is_blocked(origin, storage, loopback_is_public, http):
+    with pytest.raises(mirror._PermanentError):
+        await mirror._download(http, f"{origin.url}/meta")
+    assert origin.hits == Counter({"/meta": 1})
+
+
+async def test_loopback_origin_is_blocked_by_default(origin, http):
+    assert not mirror.is_external(f"{origin.url}/img.jpg")
+    assert not mirror.is_external("http://localhost/img.jpg")
+    with pytest.raises(mirror._PermanentError):
+        await mirror._download(http, f"{origin.url}/img.jpg")
+    assert not origin.hits
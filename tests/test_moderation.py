@@ -0,0 +1,44 @@
+"""
+Массовая модерация: пустой фильтр не должен задевать всю очередь ожидающих, а подстрока
+ника ищется буквально (% и _ — не шаблон).
+"""
+import pytest
+from pydantic import ValidationError
+
+from app.users import crud
+from app.users.models import ModStatus, User
+from app.users.schemas import ModerationBulkIn
+
+
+def test_bulk_requires_filter_or_all():
+    with pytest.raises(ValidationError):
+        ModerationBulkIn(action="reject")
+    with pytest.raises(ValidationError):
+        ModerationBulkIn(action="reject", telegram_ids=[])
+    assert ModerationBulkIn(action="reject", all=True).all
+    assert ModerationBulkIn(action="approve", nickname_contains="bob").nickname_contains == "bob"
+    assert ModerationBulkIn(action="approve", telegram_ids=[1]).telegram_ids == [1]
+
+
+async def test_crud_refuses_unfiltered_call(session):
+    with pytest.raises(ValueError):
+        await crud.moderate_pending_users(session, ModStatus.rejected)
+    with pytest.raises(ValueError):
+        await crud.moderate_pending_users(session, ModStatus.rejected, nickname_contains="")
+
+
+async def test_nickname_filter_is_literal(session):
+    nicks = ["a_b", "axb", "100%", "1000"]
+    session.add_all([
+        User(telegram_id=920_000 + i, first_name="P", last_name="Q", nickname=n, is_active=False, is_admin=False)
+        for i, n in enumerate(nicks)
+    ])
+    await session.flush()
+
+    total, users = await crud.list_pending_users(session, nickname_contains="_")
+    assert [u.nickname for u in users] == ["a_b"]
+    total, users = await crud.list_pending_users(session, nickname_contains="%")
+    assert [u.nickname for u in users] == ["100%"]
+
+    tids, _ = await crud.moderate_pending_users(session, ModStatus.approved, nickname_contains="0%")
+    assert tids == [920_002]
@@ -0,0 +1,136 @@
+"""
+Сколько SQL выполняют эндпоинты: связи User/Event/Quiz по умолчанию не грузятся
+(lazy="raise_on_sql"), нужное подгружается профилями загрузки. Число запросов не должно
+зависеть от того, сколько у пользователей событий, игроков и квизов.
+"""
+import pytest
+from sqlalchemy import select
+
+from app.common import identity
+from app.common.identity import Identity, get_identity
+from app.common.sqlstats import assert_queries
+from app.events.models import Event, event_players
+from app.events import timer
+from app.events.services import EventService
+from app.quizes.models import Quiz, QuizQuestion, QuestionType
+from app.quizes.schemas import UserAnswerCreate
+from app.quizes.services import QuizService
+from app.users import crud
+from app.users.models import User
+
+ADMIN_TID = 900_001
+
+
+@pytest.fixture
+async def seeded(session):
+    users = [
+        User(
+            telegram_id=ADMIN_TID + i,
+            first_name=f"First{i}",
+            last_name=f"Last{i}",
+            nickname=f"player{i}",
+            is_active=True,
+            is_admin=i == 0,
+            points=i * 10,
+        )
+        for i in range(5)
+    ]
+    session.add_all(users)
+    await session.flush()
+
+    events = [Event(name=f"Event {i}", creator_id=ADMIN_TID) for i in range(3)]
+    session.add_all(events)
+    await session.flush()
+    await session.execute(event_players.insert().values([
+        {"event_id": e.id, "user_telegram_id": u.telegram_id} for e in events for u in users
+    ]))
+
+    quizes = [Quiz(name=f"Quiz {e.id}.{j}", event_id=e.id) for e in events for j in range(2)]
+    session.add_all(quizes)
+    await session.flush()
+    session.add_all([
+        QuizQuestion(
+            quiz_id=q.id,
+            type=QuestionType.SINGLE,
+            text_i18n={"ru": f"Вопрос {k}"},
+            options_i18n={"ru": ["A", "B"]},
+            correct_answers_i18n={"ru": ["A"]},
+        )
+        for q in quizes for k in range(3)
+    ])
+    await session.commit()
+    seeded = {"admin": Identity(users[0].id, ADMIN_TID, True, True), "quiz_id": quizes[0].id}
+    # ничего из сидирования не должно остаться в identity map — иначе считаем не те запросы
+    session.expunge_all()
+    # SAVEPOINT тестовой транзакции (conftest) открываем заранее — он не запрос эндпоинта
+    await session.connection()
+    return seeded
+
+
+async def test_current_user_lookup(session, seeded):
+    # CurrentUser по ?current_user_telegram_id=: один узкий SELECT, потом — кеш процесса
+    identity._cache.clear()
+    with assert_queries() as stats:
+        assert await get_identity(session, ADMIN_TID) is not None
+    assert stats.count == 1
+    with assert_queries() as stats:
+        await get_identity(session, ADMIN_TID)
+    assert stats.count == 0
+
+
+async def test_list_users(session, seeded):
+    # GET /users/
+    with assert_queries() as stats:
+        users = await crud.list_users(session)
+    assert len(users) >= 5
+    assert stats.count == 1
+
+
+async def test_get_user(session, seeded):
+    # GET /users/{telegram_id}
+    with assert_queries() as stats:
+        await crud.get_user(session, ADMIN_TID)
+    assert stats.count == 1
+
+
+async def test_list_events(session, seeded):
+    # GET /events/: события + одна пачка квизов (selectinload), игроки и создатель не грузятся
+    svc = EventService(session, seeded["admin"])
+    with assert_queries() as stats:
+        events = await svc.list_events()
+    assert all(len(e.quizes) == 2 for e in events if e.name.startswith("Event "))
+    assert stats.count == 2
+
+
+async def test_leaderboard(session, seeded):
+    # GET /quizes/leaderboard
+    svc = QuizService(session, seeded["admin"])
+    with assert_queries() as stats:
+        rows = await svc.get_leaderboard(limit=10)
+    assert rows
+    assert stats.count == 1
+
+
+async def test_quiz_limits(session, seeded):
+    # GET /quizes/{quiz_id}/limits
+    svc = QuizService(session, seeded["admin"])
+    with assert_queries() as stats:
+        limits = await svc.get_quiz_limits_public(seeded["quiz_id"], seeded["admin"].id)
+    assert limits["total_questions"] == 3
+    assert stats.count == 1
+
+
+async def test_submit_answer(session, seeded, monkeypatch):
+    # POST /quizes/answer (путь БД, без живой сессии): окна таймеров уже загружены из NOTIFY
+    monkeypatch.setattr(timer, "_windows_loaded", True)
+    question_id = await session.scalar(select(QuizQuestion.id).where(QuizQuestion.quiz_id == seeded["quiz_id"]).limit(1))
+    svc = QuizService(session, seeded["admin"])
+    with assert_queries() as stats:
+        result = await svc.submit_answer(UserAnswerCreate(quiz_id=seeded["quiz_id"], question_id=question_id, answers="A", locale="ru"))
+    assert result["awarded_points"] == 1
+    # вопрос, лимиты, INSERT ответа, UPDATE очков, NOTIFY, refresh ответа, лимиты после;
+    # SAVEPOINT — от тестовой транзакции (commit сервиса), в проде это COMMIT
+    queries = [sql for sql in stats.statements.elements() if "SAVEPOINT" not in sql]
+    assert len(queries) == 7
+    # повторный ответ не запрещён — отдельного COUNT по (user_id, question_id) нет
+    assert not [sql for sql in queries if "quiz_user_answers.question_id =" in sql]
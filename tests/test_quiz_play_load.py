@@ -0,0 +1,183 @@
+"""
+Нагрузочный тест игры в чате (telegram/quiz_play.py): весь зал одновременно жмёт кнопку
+ответа. Апдейты идут через Dispatcher.feed_update, бот ходит в поддельный Bot API на
+aiohttp, ответы пишутся пачками через AnswerBatcher — транзакций должно быть в разы
+меньше, чем нажатий, а повторное нажатие не должно пройти.
+"""
+import asyncio
+import time
+from collections import Counter
+
+import pytest
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Update
+from aiohttp import web
+from sqlalchemy import delete, func, select
+
+from app.common.db import AsyncSessionLocal
+from app.events.models import Event
+from app.quizes.batcher import AnswerBatcher
+from app.quizes.models import QuestionType, Quiz, QuizQuestion, QuizUserAnswer
+from app.users.models import User
+from telegram import quiz_play
+from telegram import sender as sender_mod
+from telegram.sender import OutboundScheduler
+
+PLAYERS = 100
+BASE_TID = 970_000
+
+
+class _BotApi:
+    """Поддельный Bot API: считает вызовы по методам и чатам."""
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self.texts: dict[int, list[str]] = {}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await request.post()
+        chat_id = int(params.get("chat_id", 0))
+        self.calls[method] += 1
+        if method == "sendMessage":
+            self.texts.setdefault(chat_id, []).append(params["text"])
+            result = {"message_id": 1, "date": 0, "chat": {"id": chat_id, "type": "private"}, "text": params["text"]}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+class _CountingBatcher(AnswerBatcher):
+    def __init__(self):
+        super().__init__(max_size=200, max_wait_ms=50)
+        self.flushes: list[int] = []
+
+    async def _flush(self, batch: list) -> None:
+        self.flushes.append(len(batch))
+        await super()._flush(batch)
+
+
+@pytest.fixture
+async def bot_api(monkeypatch):
+    api = _BotApi()
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+    api.bot = Bot("123456:TEST-TOKEN", session=AiohttpSession(api=TelegramAPIServer.from_base(base)))
+
+    # лимиты Telegram здесь не проверяем (см. test_sender.py) — только путь ответа
+    monkeypatch.setattr(sender_mod, "GLOBAL_RATE", 10_000.0)
+    monkeypatch.setattr(sender_mod, "PER_CHAT_RATE", 100.0)
+    monkeypatch.setattr(quiz_play, "sender", OutboundScheduler(api.bot))
+    yield api
+    await api.bot.session.close()
+    await runner.cleanup()
+
+
+@pytest.fixture
+def dispatcher(monkeypatch):
+    parent = quiz_play.router.parent_router
+    if parent is not None:
+        yield parent
+        return
+    dp = Dispatcher()
+    dp.include_router(quiz_play.router)
+    yield dp
+    dp.sub_routers.remove(quiz_play.router)
+    monkeypatch.setattr(quiz_play.router, "_parent_router", None)
+
+
+@pytest.fixture
+async def batcher(monkeypatch):
+    b = _CountingBatcher()
+    monkeypatch.setattr(quiz_play, "answer_batcher", b)
+    task = asyncio.create_task(b.run())
+    yield b
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+@pytest.fixture
+async def room(db_engine):
+    tids = [BASE_TID + i for i in range(PLAYERS)]
+    async with AsyncSessionLocal() as s:
+        await s.execute(delete(User).where(User.telegram_id.in_(tids)))
+        users = [
+            User(telegram_id=tid, first_name="P", last_name="Load", nickname=f"load{i}", is_active=True, is_admin=i == 0, points=0)
+            for i, tid in enumerate(tids)
+        ]
+        s.add_all(users)
+        await s.flush()
+        event = Event(name=f"Load event {BASE_TID}", creator_id=tids[0])
+        s.add(event)
+        await s.flush()
+        quiz = Quiz(name="Load quiz", event_id=event.id, is_active=True)
+        s.add(quiz)
+        await s.flush()
+        questions = [
+            QuizQuestion(
+                quiz_id=quiz.id, type=QuestionType.SINGLE, points=points,
+                text_i18n={"ru": f"Вопрос {n}"}, options_i18n={"ru": ["A", "B"]}, correct_answers_i18n={"ru": ["A"]},
+            )
+            for n, points in ((1, 2), (2, 3))
+        ]
+        s.add_all(questions)
+        await s.commit()
+        data = {"quiz_id": quiz.id, "question_ids": [q.id for q in questions], "user_ids": [u.id for u in users], "tids": tids}
+    yield data
+    async with AsyncSessionLocal() as s:
+        await s.execute(delete(User).where(User.telegram_id.in_(tids)))
+        await s.commit()
+
+
+def _tap(bot: Bot, update_id: int, tid: int, data: str) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": tid, "is_bot": False, "first_name": "P", "language_code": "ru"},
+            "chat_instance": "load",
+            "data": data,
+            "message": {"message_id": 1000 + update_id, "date": 0, "chat": {"id": tid, "type": "private"}, "text": "?"},
+        },
+    }, context={"bot": bot})
+
+
+async def test_room_answers_at_once(room, bot_api, dispatcher, batcher):
+    bot = bot_api.bot
+    quiz_id, (first, second) = room["quiz_id"], room["question_ids"]
+    data = f"qp:a:{quiz_id}:{first}:0:ru"
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(dispatcher.feed_update(bot, _tap(bot, i, tid, data)) for i, tid in enumerate(room["tids"])))
+    elapsed = time.perf_counter() - t0
+    print(f"\n{PLAYERS} taps in {elapsed * 1e3:.0f} ms, batches: {batcher.flushes}")
+
+    async with AsyncSessionLocal() as s:
+        answers = await s.scalar(select(func.count()).select_from(QuizUserAnswer).where(QuizUserAnswer.quiz_id == quiz_id))
+        points = Counter((await s.scalars(select(User.points).where(User.telegram_id.in_(room["tids"])))).all())
+    assert answers == PLAYERS
+    assert points == Counter({2: PLAYERS})
+    # одна транзакция на пачку, а не на нажатие
+    assert sum(batcher.flushes) == PLAYERS and len(batcher.flushes) <= PLAYERS // 10
+
+    # каждому — ответ на нажатие, снятые кнопки и следующий вопрос
+    assert bot_api.calls["answerCallbackQuery"] == PLAYERS
+    assert bot_api.calls["editMessageReplyMarkup"] == PLAYERS
+    assert all(len(bot_api.texts[tid]) == 1 and "Вопрос 2" in bot_api.texts[tid][0] for tid in room["tids"])
+
+    # тот же зал жмёт ту же кнопку ещё раз — повтор не записывается
+    await asyncio.gather(*(
+        dispatcher.feed_update(bot, _tap(bot, PLAYERS + i, tid, data)) for i, tid in enumerate(room["tids"])
+    ))
+    async with AsyncSessionLocal() as s:
+        again = await s.scalar(select(func.count()).select_from(QuizUserAnswer).where(QuizUserAnswer.quiz_id == quiz_id))
+    assert again == PLAYERS and sum(batcher.flushes) == PLAYERS
+    assert bot_api.calls["answerCallbackQuery"] == 2 * PLAYERS
+    assert bot_api.calls["editMessageReplyMarkup"] == PLAYERS
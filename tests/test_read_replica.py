@@ -0,0 +1,131 @@
+"""
+Маршрутизация чтения на реплику (app/common/db.py) на двух локальных Postgres: primary —
+тестовая БД, «реплика» — второй экземпляр pgserver с теми же таблицами, но своими данными
+(как сильно отставшая реплика). Движки создаются при импорте по DATABASE_REPLICA_URL,
+поэтому приложение запускается в отдельном процессе и запросы идут через ASGI.
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+TID = 960_001
+
+_PROBE = r'''
+import asyncio, json, sys
+from sqlalchemy import delete, select
+
+import app.main
+from app.common import db
+from app.common.identity import Identity
+from app.events.models import Event
+from app.users.auth import issue_token
+from app.users.models import User
+
+TID = int(sys.argv[1])
+
+
+async def call(method, path, token):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "http_version": "1.1", "method": method, "path": path, "raw_path": path.encode(),
+        "query_string": query.encode(), "root_path": "", "scheme": "http", "server": ("test", 80),
+        "headers": [(b"authorization", f"Bearer {token}".encode())],
+    }
+    await app.main.app(scope, receive, send)
+    status = next(m["status"] for m in sent if m["type"] == "http.response.start")
+    body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return status, json.loads(body)
+
+
+async def seed(session_factory, event_name):
+    async with session_factory() as s:
+        await s.execute(delete(User).where(User.telegram_id == TID))
+        user = User(telegram_id=TID, first_name="R", last_name="Test", nickname="replica", is_active=True, is_admin=True)
+        s.add(user)
+        await s.flush()
+        s.add(Event(name=event_name, creator_id=TID))
+        await s.commit()
+        return user.id
+
+
+async def names(session_factory):
+    async with session_factory() as s:
+        return sorted((await s.scalars(select(Event.name).where(Event.creator_id == TID))).all())
+
+
+async def main():
+    assert db.replica_engine is not None and db.ReadSessionLocal is not db.AsyncSessionLocal
+    for engine in (db.engine, db.replica_engine):
+        async with engine.begin() as conn:
+            await conn.run_sync(db.Base.metadata.create_all)
+    user_id = await seed(db.AsyncSessionLocal, "primary-event")
+    await seed(db.ReadSessionLocal, "replica-event")
+    token = issue_token(Identity(user_id, TID, True, True))
+
+    out = {}
+    try:
+        out["list"] = await call("GET", "/events/", token)
+        out["create"] = await call("POST", "/events/create?name=created-event", token)
+        out["primary"] = await names(db.AsyncSessionLocal)
+        out["replica"] = await names(db.ReadSessionLocal)
+    finally:
+        for factory in (db.AsyncSessionLocal, db.ReadSessionLocal):
+            async with factory() as s:
+                await s.execute(delete(User).where(User.telegram_id == TID))
+                await s.commit()
+        await db.engine.dispose()
+        await db.replica_engine.dispose()
+    print(json.dumps(out))
+
+
+asyncio.run(main())
+'''
+
+
+@pytest.fixture(scope="module")
+def replica_url():
+    try:
+        import pgserver
+    except ImportError:
+        pytest.skip("pgserver is not installed")
+    server = pgserver.get_server(tempfile.mkdtemp(prefix="quiz-test-replica-"), cleanup_mode="delete")
+    yield server.get_uri().replace("postgresql://", "postgresql+asyncpg://", 1)
+    server.cleanup()
+
+
+async def test_reads_go_to_replica_and_writes_to_primary(db_engine, replica_url):
+    env = {
+        **os.environ,
+        "DATABASE_REPLICA_URL": replica_url,
+        "TELEGRAM_MODE": "polling",
+    }
+    proc = await asyncio.to_thread(
+        subprocess.run,
+        [sys.executable, "-c", _PROBE, str(TID)],
+        env=env, cwd=Path(__file__).resolve().parents[1], capture_output=True, text=True, timeout=120,
+    )
+    assert proc.returncode == 0, proc.stderr[-3000:]
+    out = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    # список событий — read-only эндпоинт: читает реплику
+    status, events = out["list"]
+    assert status == 200
+    assert [e["name"] for e in events if e["creator_id"] == TID] == ["replica-event"]
+    # запись и проверка identity — на primary; на реплику не попадает
+    assert out["create"][0] == 200
+    assert out["primary"] == ["created-event", "primary-event"]
+    assert out["replica"] == ["replica-event"]
@@ -0,0 +1,72 @@
+"""
+Один ответ должен оцениваться одинаково везде: HTTP и игра в чате бота считают через
+score_answer, живая сессия квиза — через скомпилированные ключи (compile_answer_key).
+"""
+import itertools
+
+import pytest
+
+from app.quizes.live import compile_question
+from app.quizes.models import QuestionType
+from app.quizes.scoring import compile_answer_key, locale_values, score_answer
+
+CORRECT = [
+    [],
+    ["A"],
+    ["A", "B"],
+    ["A", "B", "C"],
+    ["Ёлка"],
+    ["Café", "coffee"],
+]
+
+ANSWERS = [
+    "A",
+    "B",
+    "",
+    " ёЛКА ",
+    "cafe",
+    "CAFÉ",
+    [],
+    ["A"],
+    ["B"],
+    ["A", "B"],
+    ["B", "A"],
+    ["A", "A"],
+    ["A", "B", "C"],
+    ["A", "D"],
+    ["coffee", "Café"],
+    [1],
+]
+
+
+@pytest.mark.parametrize(
+    "qtype, points, correct",
+    list(itertools.product(list(QuestionType), [0, 1, 3], CORRECT)),
+)
+def test_compiled_key_matches_score_answer(qtype, points, correct):
+    key = compile_answer_key(qtype, points, correct)
+    for answer in ANSWERS:
+        assert key(answer) == score_answer(qtype, points, correct, answer), answer
+
+
+CORRECT_I18N = [
+    None,
+    {},
+    {"ru": ["A"]},
+    {"ru": ["A"], "en": ["B"]},
+    {"ru": ["A", "B"], "en": []},
+    {"en": ["B"]},
+]
+
+
+@pytest.mark.parametrize(
+    "qtype, correct_i18n",
+    list(itertools.product(list(QuestionType), CORRECT_I18N)),
+)
+def test_live_question_matches_calculate_points(qtype, correct_i18n):
+    # QuizService.calculate_points: score_answer по ответам локали с фолбэком на ru
+    question = compile_question(1, qtype, 2, correct_i18n)
+    for locale in ("ru", "en", "de", ""):
+        correct = locale_values(correct_i18n, locale)
+        for answer in ANSWERS:
+            assert question.score(answer, locale) == score_answer(qtype, 2, correct, answer), (locale, answer)
@@ -0,0 +1,97 @@
+"""
+Исходящий канал бота (telegram/sender.py) против поддельного Bot API: склейка правок
+одного сообщения, пауза после RetryAfter, лимит на чат и запас глобального бакета.
+"""
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from telegram import sender as sender_mod
+from telegram.sender import OutboundScheduler, TokenBucket
+
+
+class FakeBot:
+    """Bot API в памяти: запоминает вызовы (время, метод, chat_id, аргументы)."""
+
+    def __init__(self, retry_after: dict[int, int] | None = None):
+        self.calls: list[tuple[float, str, int, dict]] = []
+        # chat_id -> сколько секунд ответить RetryAfter на первый вызов
+        self.retry_after = dict(retry_after or {})
+
+    async def _call(self, name: str, chat_id: int, kwargs: dict):
+        await asyncio.sleep(0)
+        if chat_id in self.retry_after:
+            seconds = self.retry_after.pop(chat_id)
+            raise TelegramRetryAfter(SendMessage(chat_id=chat_id, text="x"), "Flood control exceeded", seconds)
+        self.calls.append((time.monotonic(), name, chat_id, kwargs))
+        return kwargs
+
+    async def send_message(self, chat_id: int, **kwargs):
+        return await self._call("send_message", chat_id, kwargs)
+
+    async def edit_message_text(self, chat_id: int, **kwargs):
+        return await self._call("edit_message_text", chat_id, kwargs)
+
+    async def edit_message_reply_markup(self, chat_id: int, **kwargs):
+        return await self._call("edit_message_reply_markup", chat_id, kwargs)
+
+
+@pytest.fixture
+def fast_limits(monkeypatch):
+    monkeypatch.setattr(sender_mod, "GLOBAL_RATE", 1000.0)
+    monkeypatch.setattr(sender_mod, "PER_CHAT_RATE", 10.0)
+
+
+async def test_edits_to_same_message_are_coalesced(fast_limits):
+    bot = FakeBot()
+    out = OutboundScheduler(bot)
+    # токен чата потрачен — правки ждут очереди и склеиваются
+    await out.send_message(1, "hello")
+    results = await asyncio.gather(*(out.edit_message_text(1, 42, f"v{i}") for i in range(5)))
+
+    edits = [c for c in bot.calls if c[1] == "edit_message_text"]
+    assert [c[3]["text"] for c in edits] == ["v4"]
+    assert all(r["text"] == "v4" for r in results)
+
+    # другое сообщение — отдельная правка
+    await out.edit_message_text(1, 43, "other")
+    assert len([c for c in bot.calls if c[1] == "edit_message_text"]) == 2
+
+
+async def test_retry_after_pauses_chat_and_global(fast_limits):
+    bot = FakeBot(retry_after={1: 1})
+    out = OutboundScheduler(bot)
+    t0 = time.monotonic()
+    first = asyncio.create_task(out.send_message(1, "a"))
+    await asyncio.sleep(0.05)
+    # другой чат: RetryAfter мог быть за общий лимит бота — тоже ждёт
+    await out.send_message(2, "b")
+    await first
+    assert sorted(c[2] for c in bot.calls) == [1, 2]
+    assert min(c[0] for c in bot.calls) - t0 >= 0.9
+
+
+async def test_per_chat_rate(fast_limits):
+    bot = FakeBot()
+    out = OutboundScheduler(bot)
+    t0 = time.monotonic()
+    await asyncio.gather(*(out.send_message(1, str(i)) for i in range(4)))
+    same_chat = time.monotonic() - t0
+    # 10/с в чат, запас 1: первый сразу, остальные через ~0.1 с
+    assert same_chat >= 0.25
+
+    t0 = time.monotonic()
+    await asyncio.gather(*(out.send_message(100 + i, "x") for i in range(4)))
+    assert time.monotonic() - t0 < 0.1
+
+
+async def test_global_bucket_below_one_token_per_second(monkeypatch):
+    # 10 сообщений/с на 12 воркеров: раньше запас был < 1 токена и acquire() висел вечно
+    monkeypatch.setattr(sender_mod, "GLOBAL_RATE", 10 / 12)
+    out = OutboundScheduler(FakeBot())
+    assert out._global.capacity >= 1
+    await asyncio.wait_for(out.send_message(1, "a"), 1)
+    await asyncio.wait_for(TokenBucket(0.5, 0.5).acquire(), 1)
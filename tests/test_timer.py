@@ -0,0 +1,73 @@
+"""
+Серверный таймер события (app/events/timer.py): после последнего вопроса окно ответа
+остаётся закрытым, в ручной режим квиз возвращает только явный stop_timer.
+"""
+import json
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, update
+
+from app.common.db import AsyncSessionLocal
+from app.events import timer
+from app.events.live import load_state
+from app.events.models import Event, EventTimer
+
+
+@pytest.fixture(autouse=True)
+def windows(monkeypatch):
+    # без слушателя event_state: окна — из БД, пока их явно не загрузят
+    monkeypatch.setattr(timer, "_windows", {})
+    monkeypatch.setattr(timer, "_window_quiz", {})
+    monkeypatch.setattr(timer, "_windows_loaded", False)
+
+
+async def _start_expired(event_id: int, quiz_id: int, index: int) -> None:
+    async with AsyncSessionLocal() as s:
+        event = await s.get(Event, event_id)
+        await timer.start_timer(s, event, quiz_id, index)
+        await s.flush()
+        await s.execute(
+            update(EventTimer).where(EventTimer.event_id == event_id).values(deadline=func.now() - timedelta(seconds=1))
+        )
+        await s.commit()
+
+
+async def test_window_stays_closed_after_last_question(committed_quiz):
+    event_id, quiz_id = committed_quiz["event_id"], committed_quiz["quiz_id"]
+    qids = committed_quiz["question_ids"]
+
+    await _start_expired(event_id, quiz_id, 1)
+    assert await timer._advance(event_id) is not None
+    assert await timer.answer_window_open(quiz_id, qids[2])
+    assert not await timer.answer_window_open(quiz_id, qids[1])
+
+    # последний вопрос истёк: строка таймера остаётся, ответы закрыты на все вопросы
+    async with AsyncSessionLocal() as s:
+        await s.execute(
+            update(EventTimer).where(EventTimer.event_id == event_id).values(deadline=func.now() - timedelta(seconds=1))
+        )
+        await s.commit()
+    assert await timer._advance(event_id) is None
+    async with AsyncSessionLocal() as s:
+        row = await s.get(EventTimer, event_id)
+        assert row is not None and row.question_id is None and row.deadline is None
+        state = await load_state(s, event_id)
+    for qid in qids:
+        assert not await timer.answer_window_open(quiz_id, qid)
+    # повторный шаг планировщика по законченному таймеру ничего не делает
+    assert await timer._advance(event_id) is None
+
+    # воркеры с окнами из уведомлений видят то же
+    timer._on_state(json.dumps(state))
+    timer._windows_loaded = True
+    assert timer._windows[quiz_id] == (None, None)
+    assert not await timer.answer_window_open(quiz_id, qids[0])
+
+    # ручной режим — только явной остановкой
+    timer._windows_loaded = False
+    async with AsyncSessionLocal() as s:
+        assert await timer.stop_timer(s, event_id)
+        await s.commit()
+    for qid in qids:
+        assert await timer.answer_window_open(quiz_id, qid)
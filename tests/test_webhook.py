@@ -0,0 +1,140 @@
+"""
+Webhook-режим бота (telegram/webhook.py): проверка секрета, пропуск битых апдейтов, ответ
+503 при полной очереди и путь апдейта через пул обработчиков до Bot API. Bot API — локальный
+стенд на aiohttp, бот ходит в него через TelegramAPIServer.
+"""
+import asyncio
+import json
+
+import pytest
+from aiogram import Bot, Dispatcher, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Message
+from aiohttp import web
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from telegram import webhook
+
+SECRET = "test-webhook-secret"
+TOKEN = "123456:TEST-TOKEN"
+
+
+class _BotApi:
+    """Стенд Bot API: запоминает вызовы методов {method: [params]}."""
+
+    def __init__(self):
+        self.calls: dict[str, list[dict]] = {}
+        self.sent = asyncio.Event()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls.setdefault(method, []).append(params)
+        if method == "getWebhookInfo":
+            hook = (self.calls.get("setWebhook") or [{}])[-1]
+            result = {"url": hook.get("url", ""), "has_custom_certificate": False, "pending_update_count": 3}
+        elif method == "sendMessage":
+            self.sent.set()
+            result = {
+                "message_id": len(self.calls[method]), "date": 0,
+                "chat": {"id": int(params["chat_id"]), "type": "private"}, "text": params["text"],
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+@pytest.fixture
+async def bot_api(monkeypatch):
+    api = _BotApi()
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+    bot = Bot(TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(base)))
+
+    dp = Dispatcher()
+
+    @dp.message(F.text == "ping")
+    async def pong(message: Message) -> None:
+        await message.answer("pong")
+
+    monkeypatch.setattr(webhook, "bot", bot)
+    monkeypatch.setattr(webhook, "dp", dp)
+    monkeypatch.setattr(webhook, "TELEGRAM_MODE", "webhook")
+    monkeypatch.setattr(webhook, "WEBHOOK_SECRET", SECRET)
+    monkeypatch.setattr(webhook, "WEBHOOK_URL", "https://api.example.com/telegram/webhook")
+    monkeypatch.setattr(webhook, "_queue", asyncio.Queue(maxsize=2))
+    monkeypatch.setattr(webhook, "_workers", [])
+    yield api
+    await bot.session.close()
+    await runner.cleanup()
+
+
+def _request(payload, secret: str = SECRET) -> Request:
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    headers = [(b"content-type", b"application/json"), (b"x-telegram-bot-api-secret-token", secret.encode())]
+    return Request({"type": "http", "method": "POST", "path": "/telegram/webhook", "headers": headers}, receive)
+
+
+def _update(update_id: int, text: str = "ping") -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": text,
+            "chat": {"id": 42, "type": "private"},
+            "from": {"id": 42, "is_bot": False, "first_name": "A"},
+        },
+    }
+
+
+async def test_rejects_wrong_secret(bot_api):
+    with pytest.raises(HTTPException) as e:
+        await webhook.telegram_webhook(_request(_update(1), secret="nope"))
+    assert e.value.status_code == 401
+    assert webhook._queue.empty()
+
+
+async def test_malformed_update_is_acknowledged(bot_api):
+    # 2xx — иначе Telegram будет повторять апдейт вечно
+    for bad in (b"{not json", {"update_id": "x"}, {"message": {}}):
+        resp = await webhook.telegram_webhook(_request(bad))
+        assert resp.status_code == 200
+    assert webhook._queue.empty()
+
+
+async def test_full_queue_asks_telegram_to_retry(bot_api):
+    for i in range(2):
+        assert (await webhook.telegram_webhook(_request(_update(i)))).status_code == 200
+    resp = await webhook.telegram_webhook(_request(_update(3)))
+    assert resp.status_code == 503 and resp.headers["Retry-After"] == "1"
+    assert webhook._queue.qsize() == 2
+
+
+async def test_update_is_handled_through_bot_api(bot_api):
+    webhook.start_webhook_workers()
+    try:
+        assert (await webhook.telegram_webhook(_request(_update(10)))).status_code == 200
+        await asyncio.wait_for(bot_api.sent.wait(), 5)
+    finally:
+        await webhook.stop_webhook_workers()
+    assert bot_api.calls["sendMessage"] == [{"chat_id": "42", "text": "pong"}]
+    assert webhook._queue.empty() and not webhook._workers
+
+
+async def test_register_webhook_keeps_pending_updates(bot_api):
+    await webhook.register_webhook()
+    hook, = bot_api.calls["setWebhook"]
+    assert hook["url"] == "https://api.example.com/telegram/webhook"
+    assert hook["secret_token"] == SECRET
+    assert hook["drop_pending_updates"] == "false"
+    assert "deleteWebhook" not in bot_api.calls